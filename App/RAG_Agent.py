@@ -1,16 +1,33 @@
-import google.genai as genai
-from google.genai.types import GenerateContentConfig
-from typing import List, Dict, Tuple
+import time
+from typing import Iterator, List, Dict, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from pathlib import Path
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+from config import (
+    GEMINI_MODEL_NAME, EMBEDDING_MODEL_NAME, RESPONSE_CACHE_ENABLED,
+    CHAT_CONTEXT_CHARS, IDENTIFICATION_CONTEXT_CHARS, IDENTIFICATION_CHUNKS_PER_SPECIES,
+    IDENTIFICATION_PRIMARY_SHARE
+)
+from conversation_context import ConversationContext
+from image_catalogue import ExampleImageCatalogue, default_catalogue
+from metrics import (
+    HISTORY_TOKENS, LLM_ERRORS, PROMPT_CHARS, PROMPT_TOKENS, RESPONSE_CACHE_LOOKUPS,
+    record_stage, span
+)
+from response_cache import (
+    PLACEHOLDER, ResponseCache, default_response_cache, fill_confidences, has_unmasked_percentages,
+    identification_key, mask_confidences
+)
+from retrieval import RetrievalService
+
+OFFLINE_CHAT_MESSAGE = "No internet connection. Please connect to the internet to chat with the mycologist assistant."
 
 class MushroomRAGAgent:
-    def __init__(self, api_key: str, knowledge_base: List[str],
-                 model_name: str, embedding_model: str, embeddings: np.ndarray = None):
+    def __init__(self, api_key: str, knowledge_base: List[str] = None,
+                 model_name: str = GEMINI_MODEL_NAME, embedding_model: str = EMBEDDING_MODEL_NAME,
+                 embeddings: np.ndarray = None, name_index: Dict[str, List[int]] = None,
+                 retriever: RetrievalService = None, client=None,
+                 image_catalogue: ExampleImageCatalogue = None,
+                 response_cache: ResponseCache = None, genai_types=None):
 
         self.system_instructions = """You are an expert mycologist - a mushroom specialist.
 
@@ -64,35 +81,40 @@ class MushroomRAGAgent:
         self.client = None
         self.chat = None
         self.model_name = model_name
-
-        # Try if api is avaible
-        if api_key:
+        # google.genai.types by default; llm_stub.FakeTypes lets a fake client run without the SDK
+        self.genai_types = genai_types
+
+        # Use an injected client (e.g. llm_stub.FakeClient) or try if api is avaible
+        if client is not None:
+            self.client = client
+            self.chat = self._create_chat()
+            self.online_mode = True
+        elif api_key:
             try:
+                # Deferred so importing this module stays cheap
+                import google.genai as genai
+
                 # Configure Gemini with new API
                 self.client = genai.Client(api_key=api_key)
                 # Initialize chat with automatic history management ✅
-                self.chat = self.client.chats.create(
-                    model=model_name,
-                    config=GenerateContentConfig(system_instruction=self.system_instructions)
-                )
+                self.chat = self._create_chat()
                 self.online_mode = True
                 print("Połączono z Gemini API.")
             except Exception as e:
                 print(f"Problem z połączeniem lub kluczem API ({e}).")
-        else:
-            print("Brak klucza API.")
 
-        # Knowledge base
-        self.knowledge_base = knowledge_base
+        # Shared retrieval (embedding model + document matrix); build a private one if not given
+        if retriever is None:
+            retriever = RetrievalService(knowledge_base, embedding_model, embeddings, name_index)
+        self.retriever = retriever
 
-        # Load semantic embedding model
-        self.embedding_model = SentenceTransformer(embedding_model)
+        # Example images per species, indexed once per process
+        self.image_catalogue = image_catalogue or default_catalogue()
 
-        # Create semantic embeddings for documents
-        if embeddings is None:
-            self.doc_embeddings = self.embedding_model.encode(knowledge_base)
-        else:
-            self.doc_embeddings = embeddings
+        # Identification cards shared across sessions, keyed by prediction set
+        if response_cache is None and RESPONSE_CACHE_ENABLED:
+            response_cache = default_response_cache()
+        self.response_cache = response_cache
 
         # Track current identification
         self.current_identification = None
@@ -100,43 +122,106 @@ class MushroomRAGAgent:
         # Track first retrieved documents
         self.first_retrieved_docs = None
 
+        # Track documents already in the conversation and prompt sizes
+        self.conversation = ConversationContext()
+
+
+    def _types(self):
+        if self.genai_types is None:
+            from google.genai import types
+            self.genai_types = types
+        return self.genai_types
+
+
+    def _create_chat(self, history: List = None):
+        types = self._types()
+        return self.client.chats.create(
+            model=self.model_name,
+            config=types.GenerateContentConfig(system_instruction=self.system_instructions),
+            history=history
+        )
+
+
+    def _make_content(self, role: str, text: str):
+        types = self._types()
+        return types.Content(role=role, parts=[types.Part(text=text)])
+
+
+    def _fit_context(self, relevant_docs: List[Dict], build, kind: str) -> str:
+        with span("prompt_assembly", kind=kind):
+            # Send only documents that are not in the conversation yet
+            history = self.chat.get_history()
+            new_docs = self.conversation.select_new_documents(relevant_docs, history)
+            context = build(new_docs)
+
+            # Compact older turns if history + prompt exceed the token budget
+            compacted = self.conversation.fit_history(history, context, self._make_content)
+            if compacted is not None:
+                self.chat = self._create_chat(history=compacted)
+                history = compacted
+
+        stats = self.conversation.record_turn(
+            context, history,
+            new_documents=len(new_docs),
+            skipped_documents=len(relevant_docs) - len(new_docs),
+            compacted=compacted is not None
+        )
+        PROMPT_CHARS.inc(stats["prompt_chars"], kind=kind)
+        PROMPT_TOKENS.observe(stats["prompt_tokens"], kind=kind)
+        HISTORY_TOKENS.observe(stats["history_tokens"])
+        return context
+
+
+    def _retrieve_relevant_docs(self, query: str, top_k: int = 5,
+                                max_chars: int = CHAT_CONTEXT_CHARS) -> List[Dict[str, any]]:
+        # Best knowledge base chunks, within the prompt's character budget
+        with span("retrieve", queries=1):
+            return self.retriever.retrieve(query, top_k, max_chars=max_chars)
 
-    def _retrieve_relevant_docs(self, query: str, top_k: int = 5) -> List[Dict[str, any]]:
-        # Create embedding for the query
-        query_embedding = self.embedding_model.encode(query)
 
-        # Calculate semantic similarity with all documents
-        similarities = []
-        for doc_embedding in self.doc_embeddings:
-            sim = cosine_similarity(query_embedding, doc_embedding)
-            similarities.append(float(sim))
-        similarities = np.array(similarities)
+    def _retrieve_relevant_docs_batch(self, queries: List[str], top_k: int = 5,
+                                      max_chars: int = IDENTIFICATION_CONTEXT_CHARS) -> List[Dict[str, any]]:
+        # The top prediction gets its share of the budget, the alternatives split the rest
+        shares = [1.0]
+        if len(queries) > 1:
+            rest = (1.0 - IDENTIFICATION_PRIMARY_SHARE) / (len(queries) - 1)
+            shares = [IDENTIFICATION_PRIMARY_SHARE] + [rest] * (len(queries) - 1)
+        with span("retrieve", queries=len(queries)):
+            return self.retriever.retrieve_batch(queries, top_k, max_chars=max_chars, shares=shares)
 
-        # Get top-k most similar documents
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
 
-        results = []
-        for idx in top_indices:
-            if similarities[idx] > 0:
-                results.append({
-                    "document": self.knowledge_base[idx],
-                    "similarity": float(similarities[idx]),
-                    "index": int(idx)
-                })
-        return results
+    def _generate(self, context: str) -> str:
+        with span("llm_generate", streamed=False):
+            return self.chat.send_message(message=context).text
+
+
+    def _generate_stream(self, context: str) -> Iterator[str]:
+        # Timed by hand: a span cannot stay open across the consumer's yields
+        start = time.perf_counter()
+        first_chunk = True
+        for chunk in self.chat.send_message_stream(message=context):
+            if chunk.text:
+                if first_chunk:
+                    record_stage("llm_first_chunk", time.perf_counter() - start)
+                    first_chunk = False
+                yield chunk.text
+        record_stage("llm_generate", time.perf_counter() - start, streamed=True)
 
 
     def _build_context(self, relevant_docs: List[Dict], query: str) -> str:
+        # System instructions are already set on the chat session
         context_parts = [
-            f"{self.system_instructions}\n",
             "\n=== MUSHROOM KNOWLEDGE BASE (Retrieved Documents) ===\n"
         ]
 
+        if not relevant_docs:
+            context_parts.append("(No new documents - use the documents provided earlier in this conversation)")
+
         for i, doc_data in enumerate(relevant_docs, 1):
             doc = doc_data["document"]
             score = doc_data["similarity"]
 
-            context_parts.append(f"\n--- Document {i} (relevance: {score:.3f}) ---")
+            context_parts.append(f"\n--- Document {i} (id {doc_data['index']}, relevance: {score:.3f}) ---")
             context_parts.append(doc)
             context_parts.append("---\n")
 
@@ -147,43 +232,54 @@ class MushroomRAGAgent:
         return "\n".join(context_parts)
 
 
-    def send_message(self, user_message: str, top_k: int = 5, verbose: bool = False) -> str:
-        # Block if there is no internet connection
-        if not self.online_mode:
-            return "No internet connection. Please connect to the internet to chat with the mycologist assistant."
-
+    def _prepare_message(self, user_message: str, top_k: int = 5) -> str:
         relevant_docs = self._retrieve_relevant_docs(user_message, top_k=top_k)
 
-        # ADD CONTEXT FROM PREVIOUS QUERY
-        current_indices = {doc['index'] for doc in relevant_docs}
-        for prev_doc in self.first_retrieved_docs:
-            if prev_doc['index'] not in current_indices:
-                relevant_docs.append(prev_doc)
+        # AUGMENTATION (documents from earlier turns are already in the chat history)
+        return self._fit_context(
+            relevant_docs, lambda new_docs: self._build_context(new_docs, user_message), kind="chat"
+        )
 
-        # AUGMENTATION
-        context = self._build_context(relevant_docs, user_message)
 
-        if verbose:
-            print(f"\n🔍 Found {len(relevant_docs)} relevant documents:")
-            for doc_data in relevant_docs:
-                doc_preview = doc_data['document'][:80].replace('\n', ' ')
-                print(f"  - {doc_preview}... (score: {doc_data['similarity']:.3f})")
+    def send_message(self, user_message: str, top_k: int = 5) -> str:
+        # Block if there is no internet connection
+        if not self.online_mode:
+            return OFFLINE_CHAT_MESSAGE
 
-            print(f"\n📝 Context length: {len(context)} characters")
-            history = self.chat.get_history()
-            print(f"💬 Chat history length: {len(history)} messages")
+        context = self._prepare_message(user_message, top_k)
 
         # GENERATION (chat automatically handles history!) ✅
         try:
-            response = self.chat.send_message(message=context)
-            return response.text
+            return self._generate(context)
         except Exception as e:
+            LLM_ERRORS.inc()
             return f"Error: {str(e)}"
 
-    def clear_history(self):
+
+    def send_message_stream(self, user_message: str, top_k: int = 5) -> Iterator[str]:
+        # Same as send_message, but yields text chunks as they arrive
+        if not self.online_mode:
+            yield OFFLINE_CHAT_MESSAGE
+            return
+
+        context = self._prepare_message(user_message, top_k)
+
+        try:
+            yield from self._generate_stream(context)
+        except Exception as e:
+            LLM_ERRORS.inc()
+            yield f"Error: {str(e)}"
+
+    def reset(self):
+        # Start a new conversation, e.g. when a service worker reuses the agent
         if self.online_mode and self.client:
-            self.chat = self.client.chats.create(model=self.model_name)
+            self.chat = self._create_chat()
         self.first_retrieved_docs = []
+        self.conversation.reset()
+
+
+    def clear_history(self):
+        self.reset()
         print("✓ Conversation history cleared")
 
     def get_history(self) -> List:
@@ -192,17 +288,11 @@ class MushroomRAGAgent:
         return []
 
 
-    def initialize_from_predictions(self, predictions: Dict[str, float], verbose: bool = False) -> str:
-
-        # Sort by confidence
-        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+    def _offline_identification(self, sorted_predictions: List[Tuple[str, float]]) -> str:
         primary_species, primary_conf = sorted_predictions[0]
-
-        # If there is not internet connection print predictions and warning
-        if not self.online_mode:
-            alts_list = [f"- {s} (Confidence: {c:.2%})" for s, c in sorted_predictions[1:]]
-            alts = "\n".join(alts_list)
-            return f"""[OFFLINE MODE - NO INTERNET CONNECTION]
+        alts_list = [f"- {s} (Confidence: {c:.2%})" for s, c in sorted_predictions[1:]]
+        alts = "\n".join(alts_list)
+        return f"""[OFFLINE MODE - NO INTERNET CONNECTION]
 
 PRIMARY PREDICTION:
 Name: {primary_species}
@@ -214,49 +304,146 @@ ALTERNATIVE PREDICTIONS:
 ⚠️ NOTE: Information from the Knowledge Base is unavailable.
 Please connect to the internet to receive a detailed identification card,
 safety warnings, and look-alike analysis."""
-        
-        # Retrieve documents for predicted species
 
-        relevant_docs = []
-        for species, confidence in sorted_predictions:
-            relevant_docs.extend(self._retrieve_relevant_docs(species, top_k=3))
+
+    def _retrieve_identification_docs(self, sorted_predictions: List[Tuple[str, float]]) -> List[Dict]:
+        # Retrieve documents for predicted species
+        species_names = [species for species, _ in sorted_predictions]
+        relevant_docs = self._retrieve_relevant_docs_batch(species_names, top_k=IDENTIFICATION_CHUNKS_PER_SPECIES)
 
         self.first_retrieved_docs = relevant_docs
+        return relevant_docs
 
-        if verbose:
-            print(f"\n🔍 Retrieved documents for all candidates:")
-            for doc_data in relevant_docs[:5]:
-                doc_preview = doc_data['document'][:80].replace('\n', ' ')
-                print(f"  - {doc_preview}... (score: {doc_data['similarity']:.3f})")
 
-        # Build context with special instructions
+    def _identification_cache_key(self, relevant_docs: List[Dict],
+                                  sorted_predictions: List[Tuple[str, float]]) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        # The full prompt with confidences masked covers the template, image paths and documents;
+        # it does not depend on what the conversation already contains
         context = self._build_identification_context(relevant_docs, sorted_predictions)
+        confidences = [conf for _, conf in sorted_predictions]
+        template = self.system_instructions + mask_confidences(context, confidences)
+        return identification_key(self.model_name, template, sorted_predictions)
+
+
+    def _cached_identification(self, cache_key: Optional[str], relevant_docs: List[Dict],
+                               sorted_predictions: List[Tuple[str, float]]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        card = self.response_cache.get(cache_key)
+        RESPONSE_CACHE_LOOKUPS.inc(result="miss" if card is None else "hit")
+        if card is None:
+            return None
+
+        card = fill_confidences(card, [conf for _, conf in sorted_predictions])
+
+        # Add the exchange to the chat so follow-up questions see the card and its documents
+        context = self._build_identification_context(relevant_docs, sorted_predictions)
+        history = self.chat.get_history() + [
+            self._make_content("user", context), self._make_content("model", card)
+        ]
+        self.chat = self._create_chat(history=history)
+        self.current_identification = {
+            'primary': sorted_predictions[0],
+            'alternatives': sorted_predictions[1:],
+        }
+        return card
+
+
+    def _store_identification(self, cache_key: Optional[str], card: str,
+                              sorted_predictions: List[Tuple[str, float]]):
+        if cache_key is None:
+            return
+        template = mask_confidences(card, [conf for _, conf in sorted_predictions])
+        # Only cache cards whose confidences can all be filled in for later uploads
+        if PLACEHOLDER % 0 in template and not has_unmasked_percentages(template):
+            self.response_cache.put(cache_key, template)
+
+
+    def _start_identification(self, sorted_predictions: List[Tuple[str, float]]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        # Serve a card generated earlier for the same prediction set before assembling the prompt
+        relevant_docs = self._retrieve_identification_docs(sorted_predictions)
+        cache_key = self._identification_cache_key(relevant_docs, sorted_predictions)
+        cached = self._cached_identification(cache_key, relevant_docs, sorted_predictions)
+        if cached is not None:
+            return None, cache_key, cached
+
+        # Build context with special instructions
+        context = self._fit_context(
+            relevant_docs,
+            lambda new_docs: self._build_identification_context(new_docs, sorted_predictions),
+            kind="identification"
+        )
+        return context, cache_key, None
+
+
+    def initialize_from_predictions(self, predictions: Dict[str, float]) -> str:
+
+        # Sort by confidence
+        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+
+        # If there is not internet connection print predictions and warning
+        if not self.online_mode:
+            return self._offline_identification(sorted_predictions)
+
+        context, cache_key, cached = self._start_identification(sorted_predictions)
+        if cached is not None:
+            return cached
 
         # Generate response using chat (maintains history automatically)
         try:
-            response = self.chat.send_message(message=context)
+            card = self._generate(context)
 
             #Store current identification
             self.current_identification = {
                 'primary': sorted_predictions[0],
                 'alternatives': sorted_predictions[1:],
             }
-            print(response.text)
-            return response.text
+            self._store_identification(cache_key, card, sorted_predictions)
+            return card
         except Exception as e:
+            LLM_ERRORS.inc()
             return f"Error: {str(e)}"
 
-    def _build_image_context(self, base_dir):
-        base = Path(base_dir)
 
+    def initialize_from_predictions_stream(self, predictions: Dict[str, float]) -> Iterator[str]:
+        # Same as initialize_from_predictions, but yields text chunks as they arrive
+        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+
+        if not self.online_mode:
+            yield self._offline_identification(sorted_predictions)
+            return
+
+        context, cache_key, cached = self._start_identification(sorted_predictions)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            chunks = []
+            for text in self._generate_stream(context):
+                chunks.append(text)
+                yield text
+
+            self.current_identification = {
+                'primary': sorted_predictions[0],
+                'alternatives': sorted_predictions[1:],
+            }
+            self._store_identification(cache_key, "".join(chunks), sorted_predictions)
+        except Exception as e:
+            LLM_ERRORS.inc()
+            yield f"Error: {str(e)}"
+
+    def _build_image_context(self, species_names: List[str]) -> str:
+        # Only the predicted species' images, from the cached catalogue
         lines = []
 
-        for d in base.iterdir():
-            if d.is_dir():
-                lines.append(f"- {d.name}:")
-                for p in d.iterdir():
-                    if p.suffix.lower() in {".jpg", ".jpeg", ".png"}:
-                        lines.append(f"  - {p.as_posix()}")
+        for species in species_names:
+            paths = self.image_catalogue.images_for(species)
+            if paths:
+                lines.append(f"- {species}:")
+                lines.extend(f"  - {path}" for path in paths)
 
         return "\n".join(lines)
 
@@ -265,8 +452,8 @@ safety warnings, and look-alike analysis."""
 
         primary_species, primary_conf = predictions[0]
 
+        # System instructions are already set on the chat session
         context_parts = [
-            f"{self.system_instructions}\n",
             "\n=== COMPUTER VISION IDENTIFICATION RESULTS ===\n",
             f"PRIMARY PREDICTION: {primary_species} (Confidence: {primary_conf:.2%})\n",
         ]
@@ -277,7 +464,7 @@ safety warnings, and look-alike analysis."""
                 context_parts.append(f"{species} (Confidence: {conf:.2%})")
 
         context_parts.append("\n=== PROVIDED IMAGE PATHS ===\n")
-        context_parts.append(self._build_image_context("example_images"))
+        context_parts.append(self._build_image_context([species for species, _ in predictions]))
 
         context_parts.append("\n=== MUSHROOM KNOWLEDGE BASE ===\n")
 
@@ -285,7 +472,7 @@ safety warnings, and look-alike analysis."""
             doc = doc_data["document"]
             score = doc_data["similarity"]
 
-            context_parts.append(f"\n--- Document {i} (relevance: {score:.3f}) ---")
+            context_parts.append(f"\n--- Document {i} (id {doc_data['index']}, relevance: {score:.3f}) ---")
             context_parts.append(doc)
             context_parts.append("---\n")
 
@@ -0,0 +1,418 @@
+"""Approximate nearest neighbour indexes (IVF, optional HNSW) over the document embeddings."""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from atomic_write import atomic_path, write_atomic
+from config import (
+    ANN_INDEX, ANN_MIN_DOCUMENTS, KNOWLEDGE_BASE_ARTIFACT_DIR,
+    IVF_NLIST, IVF_NPROBE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+)
+
+ANN_MANIFEST_FILE = "ann_manifest.json"
+IVF_CENTROIDS_FILE = "ann_ivf_centroids.npy"
+IVF_VECTORS_FILE = "ann_ivf_vectors.npy"
+IVF_IDS_FILE = "ann_ivf_ids.npy"
+IVF_OFFSETS_FILE = "ann_ivf_offsets.npy"
+HNSW_FILE = "ann_hnsw.bin"
+
+# k-means trains on at most this many points per list
+TRAINING_POINTS_PER_LIST = 64
+
+
+class IVFIndex:
+    """
+    Inverted-file index: documents are bucketed by their nearest k-means
+    centroid and a query scans only the nprobe closest buckets.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, ids: np.ndarray,
+                 offsets: np.ndarray, nprobe: int = IVF_NPROBE):
+        """
+        Args:
+            centroids: Unit-length centroids of shape (nlist, dim)
+            vectors: Document vectors grouped by list, shape (n_documents, dim)
+            ids: Original document index of every row in vectors
+            offsets: Start of each list in vectors (nlist + 1 entries)
+            nprobe: Lists scanned per query
+        """
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: Optional[int] = IVF_NLIST,
+              nprobe: int = IVF_NPROBE, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Train spherical k-means and bucket every document.
+
+        Args:
+            embeddings: Unit-length document embeddings (n_documents, dim)
+            nlist: Number of lists; about 4 * sqrt(n_documents) when None
+            nprobe: Default lists scanned per query
+            iterations: k-means iterations
+            seed: Seed for sampling and initialisation
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        n_documents = len(matrix)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n_documents))
+        nlist = max(1, min(nlist, n_documents))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(n_documents, nlist * TRAINING_POINTS_PER_LIST)
+        sample = matrix[np.sort(rng.choice(n_documents, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Re-seed empty lists with random sample points
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalize_rows(sums)
+
+        assignment = _assign(matrix, centroids)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+        return cls(centroids, matrix[order], order.astype(np.int64), offsets, nprobe)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by inner product (cosine for unit-length queries).
+
+        Returns:
+            Tuple of (scores, indices), shape (n_queries, k), padded with
+            -inf / -1 when the probed lists hold fewer than k documents
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(self.nprobe, len(self.centroids))
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_indices = np.full((len(queries), k), -1, dtype=np.int64)
+
+        centroid_scores = queries @ self.centroids.T
+        for row, (query, scores_to_centroids) in enumerate(zip(queries, centroid_scores)):
+            if nprobe < len(self.centroids):
+                probe = np.argpartition(-scores_to_centroids, nprobe)[:nprobe]
+            else:
+                probe = np.arange(len(self.centroids))
+
+            # Lists are contiguous, so each probe is one slice and one GEMV
+            segments = [(self.offsets[l], self.offsets[l + 1]) for l in probe]
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in segments])
+            ids = np.concatenate([self.ids[start:end] for start, end in segments])
+
+            top_k = min(k, len(scores))
+            if top_k == 0:
+                continue
+            top = np.argpartition(-scores, top_k - 1)[:top_k] if top_k < len(scores) else np.arange(top_k)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            all_scores[row, :top_k] = scores[top]
+            all_indices[row, :top_k] = ids[top]
+        return all_scores, all_indices
+
+    def save(self, directory: str) -> Dict[str, int]:
+        for name, array in ((IVF_CENTROIDS_FILE, self.centroids), (IVF_VECTORS_FILE, self.vectors),
+                            (IVF_IDS_FILE, self.ids), (IVF_OFFSETS_FILE, self.offsets)):
+            write_atomic(os.path.join(directory, name), lambda f, array=array: np.save(f, array))
+        return {"nlist": len(self.centroids), "nprobe": self.nprobe}
+
+    @classmethod
+    def load(cls, directory: str, params: Dict[str, int]) -> "IVFIndex":
+        return cls(
+            np.load(os.path.join(directory, IVF_CENTROIDS_FILE)),
+            np.load(os.path.join(directory, IVF_VECTORS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, IVF_IDS_FILE)),
+            np.load(os.path.join(directory, IVF_OFFSETS_FILE)),
+            nprobe=IVF_NPROBE,
+        )
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph backed by the optional hnswlib package."""
+
+    kind = "hnsw"
+
+    def __init__(self, index, ef: int = HNSW_EF_SEARCH):
+        """
+        Args:
+            index: hnswlib.Index in inner-product space
+            ef: Candidate list size per query
+        """
+        self.index = index
+        self._ef_lock = threading.Lock()
+        self.ef = ef
+
+    @property
+    def ef(self) -> int:
+        return self._ef
+
+    @ef.setter
+    def ef(self, value: int) -> None:
+        # Configuration, not for use while other threads are searching
+        with self._ef_lock:
+            self._ef = value
+            self.index.set_ef(value)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, m: int = HNSW_M,
+              ef_construction: int = HNSW_EF_CONSTRUCTION, ef: int = HNSW_EF_SEARCH,
+              seed: int = 0) -> "HNSWIndex":
+        import hnswlib
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        index.init_index(max_elements=len(matrix), M=m, ef_construction=ef_construction, random_seed=seed)
+        index.add_items(matrix, np.arange(len(matrix)))
+        return cls(index, ef)
+
+    def __len__(self) -> int:
+        return self.index.get_current_count()
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self))
+        # ef must be at least k for hnswlib to return k results. It is only ever
+        # raised, never restored, so a concurrent query cannot see it drop below its k
+        if self._ef < k:
+            with self._ef_lock:
+                if self._ef < k:
+                    self._ef = k
+                    self.index.set_ef(k)
+        labels, distances = self.index.knn_query(queries, k=k)
+        # Inner-product distance is 1 - dot product
+        return (1.0 - distances).astype(np.float32), labels.astype(np.int64)
+
+    def save(self, directory: str) -> Dict[str, int]:
+        with atomic_path(os.path.join(directory, HNSW_FILE)) as tmp_path:
+            self.index.save_index(tmp_path)
+        return {"ef": self.ef}
+
+    @classmethod
+    def load(cls, directory: str, params: Dict[str, int]) -> "HNSWIndex":
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=params["dim"])
+        index.load_index(os.path.join(directory, HNSW_FILE))
+        return cls(index, HNSW_EF_SEARCH)
+
+
+ANN_INDEXES = {"ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def build_ann_index(embeddings: np.ndarray, kind: str = "ivf", **params):
+    """
+    Build an ANN index over unit-length embeddings.
+
+    Args:
+        embeddings: Document embeddings (n_documents, dim), rows L2-normalized
+        kind: "ivf" (numpy only) or "hnsw" (requires hnswlib)
+        **params: Passed to the index's build method
+
+    Returns:
+        IVFIndex or HNSWIndex
+    """
+    if kind not in ANN_INDEXES:
+        raise ValueError(f"Unknown ANN index '{kind}', expected one of {sorted(ANN_INDEXES)}")
+    return ANN_INDEXES[kind].build(embeddings, **params)
+
+
+def save_ann_index(index, directory: str, content_hash: str) -> None:
+    """Write the index next to the artifact's embeddings; the manifest goes last."""
+    params = index.save(directory)
+    dim = index.centroids.shape[1] if isinstance(index, IVFIndex) else index.index.dim
+    manifest = {"kind": index.kind, "content_hash": content_hash,
+                "n_documents": len(index), "dim": int(dim), **params}
+    write_atomic(
+        os.path.join(directory, ANN_MANIFEST_FILE),
+        lambda f: f.write(json.dumps(manifest).encode("utf-8"))
+    )
+
+
+def load_ann_index(directory: str, content_hash: str, n_documents: int, kind: str = ANN_INDEX):
+    """
+    Load the ANN index stored with an artifact, if enabled and up to date.
+
+    Args:
+        directory: Artifact directory
+        content_hash: Content hash of the loaded artifact
+        n_documents: Number of documents in the loaded artifact
+        kind: "auto" for whatever was built, "none" to disable, or a specific kind
+
+    Returns:
+        The index, or None for exact search
+    """
+    path = os.path.join(directory, ANN_MANIFEST_FILE)
+    if kind == "none" or n_documents < ANN_MIN_DOCUMENTS or not os.path.exists(path):
+        return None
+    try:
+        # A damaged manifest means no usable index, not a failed startup
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["content_hash"] != content_hash or manifest["n_documents"] != n_documents:
+            print("ANN index is stale, using exact search (rebuild with ann_index.py build).")
+            return None
+        if kind not in ("auto", manifest["kind"]):
+            return None
+        return ANN_INDEXES[manifest["kind"]].load(directory, manifest)
+    except (ImportError, OSError, ValueError, KeyError, TypeError) as e:
+        print(f"ANN index unavailable, using exact search ({e}).")
+        return None
+
+
+def recall_report(index, embeddings: np.ndarray, queries: np.ndarray, k: int = 10,
+                  settings: Optional[List[int]] = None) -> List[Dict[str, float]]:
+    """
+    Recall@k and latency of the index against exact search.
+
+    Args:
+        index: IVFIndex or HNSWIndex
+        embeddings: The unit-length embeddings the index was built from
+        queries: Unit-length query vectors
+        k: Neighbours compared per query
+        settings: nprobe (IVF) or ef (HNSW) values to sweep; the index's
+            current setting when omitted
+
+    Returns:
+        One row per setting with recall@k and mean/p95 latency per query
+    """
+    from retrieval import RetrievalEngine
+
+    exact = RetrievalEngine(embeddings, normalized=True)
+    exact_ms, exact_top = _timed_search(exact, queries, k)
+    attribute = "nprobe" if isinstance(index, IVFIndex) else "ef"
+    original = getattr(index, attribute)
+
+    rows = []
+    try:
+        for setting in settings or [original]:
+            setattr(index, attribute, setting)
+            ann_ms, ann_top = _timed_search(index, queries, k)
+            recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(ann_top, exact_top)])
+            rows.append({
+                attribute: setting,
+                f"recall@{k}": float(recall),
+                "mean_ms": float(np.mean(ann_ms)),
+                "p95_ms": float(np.percentile(ann_ms, 95)),
+                "exact_mean_ms": float(np.mean(exact_ms)),
+            })
+    finally:
+        setattr(index, attribute, original)
+    return rows
+
+
+def clustered_embeddings(n_documents: int, dim: int = 384, n_clusters: int = 1000,
+                         spread: float = 0.3, seed: int = 0) -> np.ndarray:
+    """Synthetic unit-length embeddings with topic structure, like real document corpora."""
+    rng = np.random.default_rng(seed)
+    centers = _normalize_rows(rng.standard_normal((n_clusters, dim), dtype=np.float32))
+    matrix = np.empty((n_documents, dim), dtype=np.float32)
+    chunk = 100_000
+    for start in range(0, n_documents, chunk):
+        size = min(chunk, n_documents - start)
+        rows = centers[rng.integers(0, n_clusters, size)]
+        rows += rng.standard_normal((size, dim), dtype=np.float32) * (spread / np.sqrt(dim))
+        matrix[start:start + size] = _normalize_rows(rows)
+    return matrix
+
+
+def _timed_search(index, queries: np.ndarray, k: int) -> Tuple[List[float], List[np.ndarray]]:
+    # One query at a time, as the chat issues them
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, indices = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(indices[0])
+    return latencies, results
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    # Nearest centroid by inner product, chunked to bound the score matrix
+    return np.concatenate([
+        np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+        for start in range(0, len(matrix), chunk)
+    ])
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate the ANN retrieval index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build the index for the knowledge base artifact")
+    build.add_argument("--artifact", default=KNOWLEDGE_BASE_ARTIFACT_DIR)
+    build.add_argument("--kind", default="ivf", choices=sorted(ANN_INDEXES))
+    build.add_argument("--nlist", type=int, default=IVF_NLIST)
+    build.add_argument("--m", type=int, default=HNSW_M)
+    build.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION)
+
+    report = subparsers.add_parser("report", help="Recall@k and latency against exact search")
+    report.add_argument("--artifact", default=KNOWLEDGE_BASE_ARTIFACT_DIR,
+                        help="Evaluate on this artifact's embeddings")
+    report.add_argument("--synthetic", type=int,
+                        help="Evaluate on this many clustered synthetic embeddings instead")
+    report.add_argument("--kind", default="ivf", choices=sorted(ANN_INDEXES))
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--sweep", default="1,4,8,16,32,64",
+                        help="nprobe (IVF) or ef (HNSW) values")
+    report.add_argument("--nlist", type=int, default=IVF_NLIST)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from kb_artifact import KnowledgeBaseArtifact
+
+        artifact = KnowledgeBaseArtifact(args.artifact)
+        params = {"nlist": args.nlist} if args.kind == "ivf" else {
+            "m": args.m, "ef_construction": args.ef_construction}
+        start = time.perf_counter()
+        index = build_ann_index(np.asarray(artifact.embeddings, dtype=np.float32), args.kind, **params)
+        save_ann_index(index, args.artifact, artifact.content_hash)
+        print(f"Built {args.kind} index over {len(index)} documents in "
+              f"{time.perf_counter() - start:.1f}s ({args.artifact}).")
+        return
+
+    if args.synthetic:
+        embeddings = clustered_embeddings(args.synthetic)
+    else:
+        from kb_artifact import KnowledgeBaseArtifact
+
+        embeddings = np.asarray(KnowledgeBaseArtifact(args.artifact).embeddings, dtype=np.float32)
+
+    # Held-out style queries: perturbed copies of random documents
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(embeddings), min(args.queries, len(embeddings)), replace=False)
+    noise = rng.standard_normal((len(picks), embeddings.shape[1]), dtype=np.float32)
+    queries = _normalize_rows(embeddings[picks] + noise * (0.5 / np.sqrt(embeddings.shape[1])))
+
+    params = {"nlist": args.nlist} if args.kind == "ivf" else {}
+    index = build_ann_index(embeddings, args.kind, **params)
+    for row in recall_report(index, embeddings, queries, args.k, [int(v) for v in args.sweep.split(",")]):
+        print("  ".join(f"{key}={value:.4f}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in row.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Asyncio interface to the RAG agent: async Gemini chats, blocking work in an executor."""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from batching import MicroBatcher
+from metrics import LLM_ERRORS, record_stage, span
+from predictor import ImageSource
+from RAG_Agent import MushroomRAGAgent, OFFLINE_CHAT_MESSAGE
+
+
+class AsyncMushroomRAGAgent(MushroomRAGAgent):
+    """
+    MushroomRAGAgent whose Gemini calls are awaited on client.aio.
+
+    Retrieval, prompt building and cache lookups still run synchronously, but
+    in an executor, so one event loop can serve many chats without a thread
+    blocked on each LLM response. A single agent handles one call at a time.
+    """
+
+    def __init__(self, *args, executor: Optional[Executor] = None, **kwargs):
+        """
+        Args:
+            *args, **kwargs: Passed to MushroomRAGAgent
+            executor: Runs embedding, scoring and prediction; the event loop's
+                default executor when omitted
+        """
+        self.executor = executor
+        super().__init__(*args, **kwargs)
+
+    def _create_chat(self, history: List = None):
+        return self.client.aio.chats.create(
+            model=self.model_name,
+            config=self._types().GenerateContentConfig(system_instruction=self.system_instructions),
+            history=history
+        )
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _agenerate(self, context: str) -> str:
+        with span("llm_generate", streamed=False):
+            response = await self.chat.send_message(message=context)
+        return response.text
+
+    async def _agenerate_stream(self, context: str) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        first_chunk = True
+        async for chunk in await self.chat.send_message_stream(message=context):
+            if chunk.text:
+                if first_chunk:
+                    record_stage("llm_first_chunk", time.perf_counter() - start)
+                    first_chunk = False
+                yield chunk.text
+        record_stage("llm_generate", time.perf_counter() - start, streamed=True)
+
+    async def send_message(self, user_message: str, top_k: int = 5) -> str:
+        if not self.online_mode:
+            return OFFLINE_CHAT_MESSAGE
+
+        context = await self._run(self._prepare_message, user_message, top_k)
+
+        try:
+            return await self._agenerate(context)
+        except Exception as e:
+            LLM_ERRORS.inc()
+            return f"Error: {str(e)}"
+
+    async def send_message_stream(self, user_message: str, top_k: int = 5) -> AsyncIterator[str]:
+        if not self.online_mode:
+            yield OFFLINE_CHAT_MESSAGE
+            return
+
+        context = await self._run(self._prepare_message, user_message, top_k)
+
+        try:
+            async for text in self._agenerate_stream(context):
+                yield text
+        except Exception as e:
+            LLM_ERRORS.inc()
+            yield f"Error: {str(e)}"
+
+    async def initialize_from_predictions(self, predictions: Dict[str, float]) -> str:
+        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+
+        if not self.online_mode:
+            return self._offline_identification(sorted_predictions)
+
+        context, cache_key, cached = await self._run(self._start_identification, sorted_predictions)
+        if cached is not None:
+            return cached
+
+        try:
+            card = await self._agenerate(context)
+
+            self.current_identification = {
+                'primary': sorted_predictions[0],
+                'alternatives': sorted_predictions[1:],
+            }
+            await self._run(self._store_identification, cache_key, card, sorted_predictions)
+            return card
+        except Exception as e:
+            LLM_ERRORS.inc()
+            return f"Error: {str(e)}"
+
+    async def initialize_from_predictions_stream(self, predictions: Dict[str, float]) -> AsyncIterator[str]:
+        sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+
+        if not self.online_mode:
+            yield self._offline_identification(sorted_predictions)
+            return
+
+        context, cache_key, cached = await self._run(self._start_identification, sorted_predictions)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            chunks = []
+            async for text in self._agenerate_stream(context):
+                chunks.append(text)
+                yield text
+
+            self.current_identification = {
+                'primary': sorted_predictions[0],
+                'alternatives': sorted_predictions[1:],
+            }
+            await self._run(self._store_identification, cache_key, "".join(chunks), sorted_predictions)
+        except Exception as e:
+            LLM_ERRORS.inc()
+            yield f"Error: {str(e)}"
+
+    async def identify(self, image: ImageSource, predictor, top_k: int = 3) -> Tuple[Dict[str, float], str]:
+        """
+        Classify an image and generate its identification card.
+
+        Retrieval and the example images depend on the predicted species, so
+        the card is prepared once the prediction is in.
+
+        Args:
+            image: Any source accepted by MushroomPredictor
+            predictor: MushroomPredictor or MicroBatcher
+            top_k: Number of top predictions to return
+
+        Returns:
+            (predictions, identification card)
+        """
+        predictions = await self._predict(image, predictor, top_k)
+        card = await self.initialize_from_predictions(predictions)
+        return predictions, card
+
+    async def _predict(self, image: ImageSource, predictor, top_k: int) -> Dict[str, float]:
+        # The batcher already returns a future, so no executor thread waits on it
+        if isinstance(predictor, MicroBatcher):
+            return await asyncio.wrap_future(predictor.submit(image, top_k))
+        return await self._run(predictor.predict, image, top_k)
@@ -0,0 +1,39 @@
+"""Write files so that readers see either the old or the complete new version."""
+
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Iterator
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """
+    Temporary path to write in place of path; moved over it with os.replace on success.
+
+    The temporary file sits next to the target under a unique name, so
+    concurrent writers (two processes building the same artifact) never
+    share it; it is removed if the block fails. For writers that take a
+    path, such as hnswlib's save_index.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_atomic(path: str, write: Callable[[BinaryIO], Any]) -> None:
+    """
+    Write a file through write(f), then move it into place (see atomic_path).
+
+    Args:
+        path: Target file
+        write: Writes the content to the open binary file
+    """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            write(f)
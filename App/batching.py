@@ -0,0 +1,130 @@
+"""Dynamic micro-batching in front of the CNN predictor."""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+from config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCH_MAX_QUEUE
+from predictor import ImageSource, MushroomPredictor
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the request queue is at capacity."""
+
+
+class MicroBatcher:
+    """Collects concurrent prediction requests and runs them as one batch."""
+
+    def __init__(self, predictor: MushroomPredictor,
+                 max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 max_queue_size: int = BATCH_MAX_QUEUE):
+        """
+        Start the background batching thread.
+
+        Args:
+            predictor: Predictor used for the batched forward passes
+            max_batch_size: Maximum number of images per forward pass
+            max_wait_ms: How long the first request in a batch waits for company
+            max_queue_size: Maximum number of pending requests (0 = unbounded)
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[ImageSource, int, Future]]" = queue.Queue(max_queue_size)
+
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._max_batch_seen = 0
+
+        self._worker = threading.Thread(target=self._run, name="cnn-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image: ImageSource, top_k: int = 3) -> Future:
+        """
+        Queue an image for prediction.
+
+        Args:
+            image: Any source accepted by MushroomPredictor
+            top_k: Number of top predictions to return
+
+        Returns:
+            Future resolving to a dictionary of species -> confidence
+
+        Raises:
+            QueueFullError: If the queue is at max_queue_size
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((image, top_k, future))
+        except queue.Full:
+            raise QueueFullError("Prediction queue is full") from None
+        return future
+
+    def predict(self, image: ImageSource, top_k: int = 3, timeout: float = None) -> Dict[str, float]:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(image, top_k).result(timeout=timeout)
+
+    def metrics(self) -> Dict[str, float]:
+        """Return queue depth and batch size statistics."""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "images": self._images,
+                "mean_batch_size": self._images / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    def _collect(self) -> List[Tuple[ImageSource, int, Future]]:
+        # Block for the first request, then gather more until the window closes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Skip requests whose callers already gave up
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            with self._lock:
+                self._batches += 1
+                self._images += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+            try:
+                probabilities = self.predictor.predict_proba([image for image, _, _ in batch])
+            except Exception:
+                # One undecodable image must not fail the whole batch
+                self._run_individually(batch)
+                continue
+
+            for (_, top_k, future), row in zip(batch, probabilities):
+                # A bad request (e.g. an invalid top_k) fails its own future, not the worker
+                try:
+                    future.set_result(self.predictor.top_k_predictions(row, top_k))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _run_individually(self, batch: List[Tuple[ImageSource, int, Future]]) -> None:
+        for image, top_k, future in batch:
+            try:
+                future.set_result(self.predictor.predict(image, top_k=top_k))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,361 @@
+"""Reproducible benchmarks for the predict -> retrieve -> generate pipeline."""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from cnn_backends import _labelled_images
+from config import (
+    CNN_BACKEND, EMBEDDINGS_PATH, EXAMPLE_IMAGES_DIR,
+    KNOWLEDGE_BASE_FILES, TOP_K_DOCUMENTS
+)
+from kb_artifact import load_artifact
+from knowledge_base import prepare_knowledge_base
+from lexical_index import LexicalIndex
+from llm_stub import FakeClient, FakeTypes
+from predictor import load_image_array
+from retrieval import RetrievalEngine
+
+DEFAULT_BATCH_SIZES = [1, 4, 16, 32]
+DEFAULT_KB_SIZES = [10_000, 100_000, 1_000_000]
+SAMPLE_QUESTIONS = [
+    "Is it edible?",
+    "What does the cap look like?",
+    "Which dangerous look-alikes should I watch for?",
+    "When and where does it fruit?",
+    "Does it stain blue when cut?",
+]
+
+
+def time_call(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    Time a callable.
+
+    Args:
+        func: Zero-argument callable to measure
+        repeat: Measured runs
+        warmup: Unmeasured runs first (lazy loading, caches)
+
+    Returns:
+        Latency statistics in milliseconds
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        "runs": repeat,
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "min_ms": float(samples.min()),
+    }
+
+
+def bench_decode(image_paths: List[str], repeat: int) -> Dict[str, Any]:
+    """Decode and resize latency for single images, and throughput over the corpus."""
+    single = time_call(lambda: load_image_array(image_paths[0]), repeat)
+    corpus = time_call(lambda: [load_image_array(path) for path in image_paths], max(1, repeat // 5))
+    return {
+        "single": single,
+        "images": len(image_paths),
+        "images_per_s": len(image_paths) / (corpus["mean_ms"] / 1000),
+    }
+
+
+def bench_predict(image_paths: List[str], batch_sizes: List[int], repeat: int,
+                  backend: str = CNN_BACKEND) -> Dict[str, Any]:
+    """Forward-pass and decode+predict latency and throughput per batch size."""
+    from predictor import MushroomPredictor
+
+    try:
+        predictor = MushroomPredictor(backend=backend)
+        predictor.predict(image_paths[0])
+    except Exception as e:
+        return {"skipped": f"CNN model unavailable ({e})"}
+
+    results = {"backend": backend}
+    for batch_size in batch_sizes:
+        paths = [image_paths[i % len(image_paths)] for i in range(batch_size)]
+        arrays = np.stack([load_image_array(path) for path in paths])
+        forward = time_call(lambda: predictor.backend.predict(arrays), repeat)
+        end_to_end = time_call(lambda: predictor.predict_proba(paths), repeat)
+        results[f"batch_{batch_size}"] = {
+            "forward": forward,
+            "decode_and_predict": end_to_end,
+            "images_per_s": batch_size / (end_to_end["mean_ms"] / 1000),
+        }
+    return results
+
+
+def bench_knowledge_base(repeat: int) -> Dict[str, Any]:
+    """JSON parsing, BM25 indexing, embedding loading and artifact opening."""
+    documents = prepare_knowledge_base(KNOWLEDGE_BASE_FILES)
+    lexical_index = LexicalIndex.build(documents)
+    results = {
+        "prepare_knowledge_base": time_call(
+            lambda: prepare_knowledge_base(KNOWLEDGE_BASE_FILES, return_index=True), repeat, warmup=0
+        ),
+        "build_lexical_index": time_call(lambda: LexicalIndex.build(documents), repeat, warmup=0),
+        "lexical_search": time_call(lambda: lexical_index.search("Amanita phalloides", TOP_K_DOCUMENTS), repeat),
+        "documents": len(documents),
+    }
+    if os.path.exists(EMBEDDINGS_PATH):
+        results["load_embeddings"] = time_call(lambda: np.load(EMBEDDINGS_PATH), repeat, warmup=0)
+    if load_artifact() is not None:
+        results["load_artifact"] = time_call(load_artifact, repeat, warmup=0)
+    else:
+        results["load_artifact"] = {"skipped": "artifact missing or stale (run kb_artifact.py)"}
+    return results
+
+
+def synthetic_embeddings(n_documents: int, dim: int, seed: int, chunk: int = 100_000) -> np.ndarray:
+    """Unit-length random document embeddings, generated in chunks to bound peak memory."""
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((n_documents, dim), dtype=np.float32)
+    for start in range(0, n_documents, chunk):
+        rows = rng.standard_normal((min(chunk, n_documents - start), dim), dtype=np.float32)
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+        matrix[start:start + len(rows)] = rows
+    return matrix
+
+
+class SyntheticDocuments:
+    """Placeholder document texts for a scaled knowledge base."""
+
+    def __init__(self, n_documents: int):
+        self.n_documents = n_documents
+
+    def __len__(self) -> int:
+        return self.n_documents
+
+    def __getitem__(self, index: int) -> str:
+        return f"Synthetic document {index}"
+
+
+def bench_retrieval(kb_sizes: List[int], repeat: int, seed: int,
+                    retriever=None, dim: int = 384) -> Dict[str, Any]:
+    """
+    Similarity search and full _retrieve_relevant_docs on scaled knowledge bases.
+
+    Args:
+        kb_sizes: Synthetic knowledge base sizes
+        repeat: Measured runs per size
+        seed: Seed for the synthetic embeddings and queries
+        retriever: Real RetrievalService; its document matrix is swapped for
+            each synthetic one to time encoding plus search end to end
+        dim: Embedding dimension when no retriever is given
+    """
+    from RAG_Agent import MushroomRAGAgent
+
+    if retriever is not None:
+        dim = retriever.engine.doc_matrix.shape[1]
+        original = (retriever.engine, retriever.knowledge_base, retriever.name_index, retriever.lexical_index)
+
+    rng = np.random.default_rng(seed + 1)
+    results = {}
+    try:
+        for n_documents in kb_sizes:
+            embeddings = synthetic_embeddings(n_documents, dim, seed)
+            engine = RetrievalEngine(embeddings, normalized=True)
+            query = rng.standard_normal((1, dim), dtype=np.float32)
+            batch = rng.standard_normal((3, dim), dtype=np.float32)
+            entry = {
+                "search_1_query": time_call(lambda: engine.search(query, TOP_K_DOCUMENTS), repeat),
+                "search_3_queries": time_call(lambda: engine.search(batch, TOP_K_DOCUMENTS), repeat),
+            }
+
+            if retriever is not None:
+                retriever.engine = engine
+                retriever.knowledge_base = SyntheticDocuments(n_documents)
+                retriever.name_index = {}
+                retriever.lexical_index = None
+                agent = MushroomRAGAgent(api_key="", retriever=retriever, client=FakeClient(),
+                                         genai_types=FakeTypes)
+                questions = iter(f"{q} ({i})" for i in range(10 ** 9) for q in SAMPLE_QUESTIONS)
+                # Unique questions miss the query cache; a repeated one hits it
+                entry["retrieve_uncached"] = time_call(
+                    lambda: agent._retrieve_relevant_docs(next(questions), top_k=5), repeat)
+                entry["retrieve_cached"] = time_call(
+                    lambda: agent._retrieve_relevant_docs(SAMPLE_QUESTIONS[0], top_k=5), repeat)
+            results[f"documents_{n_documents}"] = entry
+            del embeddings, engine
+    finally:
+        if retriever is not None:
+            retriever.engine, retriever.knowledge_base, retriever.name_index, retriever.lexical_index = original
+    return results
+
+
+def bench_context(retriever, repeat: int) -> Dict[str, Any]:
+    """Prompt assembly and a full fake-LLM turn, isolating everything except the network."""
+    from RAG_Agent import MushroomRAGAgent
+
+    predictions = {"Amanita muscaria": 0.82, "Amanita pantherina": 0.12, "Amanita rubescens": 0.06}
+    sorted_predictions = sorted(predictions.items(), key=lambda x: x[1], reverse=True)
+
+    def new_agent():
+        agent = MushroomRAGAgent(api_key="", retriever=retriever, client=FakeClient(),
+                                 genai_types=FakeTypes)
+        agent.response_cache = None
+        return agent
+
+    agent = new_agent()
+    relevant_docs = retriever.retrieve_batch([s for s, _ in sorted_predictions], top_k=3)
+    context = agent._build_identification_context(relevant_docs, sorted_predictions)
+
+    def follow_up_turns():
+        chat_agent = new_agent()
+        chat_agent.initialize_from_predictions(predictions)
+        for question in SAMPLE_QUESTIONS:
+            chat_agent.send_message(question)
+
+    return {
+        "identification_prompt_chars": len(context),
+        "build_identification_context": time_call(
+            lambda: agent._build_identification_context(relevant_docs, sorted_predictions), repeat),
+        "initialize_from_predictions": time_call(
+            lambda: new_agent().initialize_from_predictions(predictions), repeat),
+        "identification_and_5_follow_ups": time_call(follow_up_turns, max(1, repeat // 5)),
+    }
+
+
+def bench_end_to_end(image_paths: List[str], retriever, repeat: int) -> Dict[str, Any]:
+    """Image -> CNN -> retrieval -> identification card, with the fake LLM client."""
+    from predictor import MushroomPredictor
+    from RAG_Agent import MushroomRAGAgent
+
+    try:
+        predictor = MushroomPredictor()
+    except Exception as e:
+        return {"skipped": f"CNN model unavailable ({e})"}
+
+    paths = iter(image_paths[i % len(image_paths)] for i in range(10 ** 9))
+
+    def identify():
+        agent = MushroomRAGAgent(api_key="", retriever=retriever, client=FakeClient(),
+                                 genai_types=FakeTypes)
+        agent.response_cache = None
+        agent.initialize_from_predictions(predictor.predict(next(paths), top_k=3))
+
+    return {"identify_image": time_call(identify, repeat)}
+
+
+def environment() -> Dict[str, Any]:
+    """Commit and machine details so results can be compared across runs."""
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], prefix: str = "") -> List[str]:
+    """Mean-latency ratios (current / baseline) for every timing present in both results."""
+    lines = []
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if not isinstance(value, dict) or not isinstance(other, dict):
+            continue
+        if "mean_ms" in value and "mean_ms" in other:
+            ratio = value["mean_ms"] / other["mean_ms"] if other["mean_ms"] else float("inf")
+            lines.append(f"{prefix}{key}: {other['mean_ms']:.2f} -> {value['mean_ms']:.2f} ms ({ratio:.2f}x)")
+        else:
+            lines.extend(compare(other, value, f"{prefix}{key}."))
+    return lines
+
+
+def _load_retriever():
+    from kb_artifact import load_or_build_artifact
+    from startup import create_retrieval_service
+
+    try:
+        return create_retrieval_service(load_or_build_artifact())
+    except Exception as e:
+        print(f"Retrieval benchmarks need the embedding model ({e}).", file=sys.stderr)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the mushroom identification pipeline.")
+    parser.add_argument("--suites", default="decode,predict,knowledge_base,retrieval,context,end_to_end",
+                        help="Comma-separated suites to run")
+    parser.add_argument("--images", default=EXAMPLE_IMAGES_DIR, help="Image corpus directory")
+    parser.add_argument("--max-images", type=int, default=200, help="Images used from the corpus")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, DEFAULT_BATCH_SIZES)))
+    parser.add_argument("--kb-sizes", default=",".join(map(str, DEFAULT_KB_SIZES)),
+                        help="Synthetic knowledge base sizes for the retrieval suite")
+    parser.add_argument("--backend", default=CNN_BACKEND)
+    parser.add_argument("--repeat", type=int, default=20, help="Measured runs per timing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    suites = set(args.suites.split(","))
+    image_paths = [path for path, _ in _labelled_images(args.images)][:args.max_images]
+    if not image_paths and suites & {"decode", "predict", "end_to_end"}:
+        parser.error(f"No images found in {args.images}")
+
+    retriever = None
+    if suites & {"retrieval", "context", "end_to_end"}:
+        retriever = _load_retriever()
+
+    results: Dict[str, Any] = {"environment": environment(), "settings": vars(args)}
+    # Keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        if "decode" in suites:
+            results["decode"] = bench_decode(image_paths, args.repeat)
+        if "predict" in suites:
+            batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+            results["predict"] = bench_predict(image_paths, batch_sizes, args.repeat, args.backend)
+        if "knowledge_base" in suites:
+            results["knowledge_base"] = bench_knowledge_base(max(1, args.repeat // 4))
+        if "retrieval" in suites:
+            kb_sizes = [int(size) for size in args.kb_sizes.split(",")]
+            results["retrieval"] = bench_retrieval(kb_sizes, args.repeat, args.seed, retriever)
+        if "context" in suites:
+            results["context"] = bench_context(retriever, args.repeat) if retriever else {
+                "skipped": "embedding model unavailable"}
+        if "end_to_end" in suites:
+            results["end_to_end"] = bench_end_to_end(image_paths, retriever, args.repeat) if retriever else {
+                "skipped": "embedding model unavailable"}
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, results)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
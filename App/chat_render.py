@@ -0,0 +1,167 @@
+"""Chat messages pre-parsed into text/image segments, and a thumbnail cache for their images."""
+
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from atomic_write import write_atomic
+from config import THUMBNAIL_SIZE, THUMBNAIL_QUALITY, THUMBNAIL_CACHE_SIZE, THUMBNAIL_CACHE_DIR
+
+# Image tags as instructed in MushroomRAGAgent's system prompt
+IMAGE_TAG_PATTERN = re.compile(r'<img src="([^"]+)"/>')
+
+TEXT = "text"
+IMAGE = "image"
+
+Segment = Tuple[str, str]
+
+
+def parse_segments(content: str) -> List[Segment]:
+    """
+    Split a message into ("text", text) and ("image", path) segments.
+
+    Whitespace around image tags is dropped and empty text segments are
+    skipped, matching how the bubbles are rendered.
+    """
+    segments = []
+    last_pos = 0
+    for match in IMAGE_TAG_PATTERN.finditer(content):
+        text = content[last_pos:match.start()].strip()
+        if text:
+            segments.append((TEXT, text))
+        segments.append((IMAGE, match.group(1)))
+        last_pos = match.end()
+    text = content[last_pos:].strip()
+    if text:
+        segments.append((TEXT, text))
+    return segments
+
+
+def make_message(role: str, content: str) -> Dict:
+    """Chat message with its segments parsed once, when it is appended."""
+    segments = parse_segments(content) if role == "assistant" else [(TEXT, content)]
+    return {"role": role, "content": content, "segments": segments}
+
+
+class ThumbnailCache:
+    """
+    Downscaled JPEG copies of catalogue images, keyed by a hash of the file content.
+
+    Thumbnails live in a bounded in-memory LRU and, optionally, on disk, so a
+    rerun sends a few tens of kilobytes per image instead of re-reading and
+    re-encoding the full-resolution file. A file is hashed again only when
+    its size or modification time changes.
+    """
+
+    def __init__(self, max_entries: int = THUMBNAIL_CACHE_SIZE,
+                 cache_dir: Optional[str] = THUMBNAIL_CACHE_DIR,
+                 size: int = THUMBNAIL_SIZE,
+                 quality: int = THUMBNAIL_QUALITY):
+        """
+        Args:
+            max_entries: Thumbnails kept in memory
+            cache_dir: Directory for thumbnails shared across restarts (None disables it)
+            size: Longest thumbnail side in pixels
+            quality: JPEG quality
+        """
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.size = size
+        self.quality = quality
+        self._thumbnails: "OrderedDict[str, bytes]" = OrderedDict()
+        # path -> (mtime_ns, size in bytes, content digest)
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def thumbnail(self, path: str) -> bytes:
+        """
+        JPEG thumbnail of an image file.
+
+        Raises:
+            OSError: If the file is missing or not a readable image
+        """
+        key = f"{self._digest(path)}-{self.size}"
+        with self._lock:
+            data = self._thumbnails.get(key)
+            if data is not None:
+                self._thumbnails.move_to_end(key)
+                return data
+
+        data = self._load(key)
+        if data is None:
+            data = self._render(path)
+            self._save(key, data)
+
+        with self._lock:
+            self._thumbnails[key] = data
+            self._thumbnails.move_to_end(key)
+            while len(self._thumbnails) > self.max_entries:
+                self._thumbnails.popitem(last=False)
+        return data
+
+    def _digest(self, path: str) -> str:
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def _render(self, path: str) -> bytes:
+        with Image.open(path) as img:
+            if img.format == "JPEG" and max(img.size) <= self.size:
+                # Already small enough; re-encoding would only lose quality
+                with open(path, "rb") as f:
+                    return f.read()
+            img.draft("RGB", (self.size, self.size))  # JPEG: decode at reduced scale
+            img = img.convert("RGB")
+            img.thumbnail((self.size, self.size))
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+        return buffer.getvalue()
+
+    def _load(self, key: str) -> Optional[bytes]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.jpg"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save(self, key: str, data: bytes) -> None:
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, f"{key}.jpg")
+        try:
+            write_atomic(path, lambda f: f.write(data))
+        except OSError as e:
+            print(f"Could not write thumbnail {path} ({e}).")
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_thumbnail_cache() -> ThumbnailCache:
+    """Process-wide thumbnail cache configured from config."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ThumbnailCache()
+        return _default_cache
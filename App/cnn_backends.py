@@ -0,0 +1,269 @@
+"""Pluggable inference backends for the mushroom CNN (Keras or TFLite)."""
+
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    CNN_BACKEND, CNN_MODEL_PATH, TFLITE_MODEL_PATH, TFLITE_NUM_THREADS,
+    CALIBRATION_IMAGES_PER_SPECIES, EXAMPLE_IMAGES_DIR, MUSHROOM_SPECIES
+)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+class KerasBackend:
+    """Runs the original Keras .h5 model through TensorFlow."""
+
+    def __init__(self, model_path: str = CNN_MODEL_PATH):
+        from tensorflow.keras.models import load_model
+
+        self.model = load_model(model_path)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Return class probabilities for a float32 batch of shape (n, H, W, 3)."""
+        # predict_on_batch skips the per-call setup of model.predict
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteBackend:
+    """Runs a converted (optionally quantized) TFLite model on the CPU."""
+
+    def __init__(self, model_path: str = TFLITE_MODEL_PATH,
+                 num_threads: Optional[int] = TFLITE_NUM_THREADS):
+        """
+        Load the TFLite model, preferring the lightweight runtimes over full TensorFlow.
+
+        Args:
+            model_path: Path to the .tflite model
+            num_threads: Interpreter threads (None lets the runtime decide)
+        """
+        self.interpreter = _tflite_interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+
+        # The interpreter holds mutable tensors and cannot run concurrently
+        self._lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Return class probabilities for a float32 batch of shape (n, H, W, 3)."""
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(batch)
+
+            self.interpreter.set_tensor(self._input["index"], _quantize(batch, self._input))
+            self.interpreter.invoke()
+            return _dequantize(self.interpreter.get_tensor(self._output["index"]), self._output)
+
+
+BACKENDS = {
+    "keras": (KerasBackend, CNN_MODEL_PATH),
+    "tflite": (TFLiteBackend, TFLITE_MODEL_PATH),
+}
+
+
+def create_backend(name: str = CNN_BACKEND, model_path: Optional[str] = None):
+    """
+    Instantiate an inference backend by name.
+
+    Args:
+        name: "keras" or "tflite"
+        model_path: Model file; defaults to the backend's configured path
+
+    Returns:
+        Backend exposing predict(batch) -> probabilities
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CNN backend '{name}', expected one of {sorted(BACKENDS)}")
+    backend_class, default_path = BACKENDS[name]
+    return backend_class(model_path or default_path)
+
+
+def convert_to_tflite(keras_path: str = CNN_MODEL_PATH,
+                      output_path: str = TFLITE_MODEL_PATH,
+                      quantization: Optional[str] = None,
+                      calibration_dir: str = EXAMPLE_IMAGES_DIR,
+                      calibration_samples: int = 200) -> str:
+    """
+    Convert the Keras model to TFLite with optional post-training quantization.
+
+    Args:
+        keras_path: Source .h5 model
+        output_path: Destination .tflite file
+        quantization: None, "dynamic", "float16" or "int8" (int8 weights and
+            activations, calibrated on images from calibration_dir)
+        calibration_dir: Image directory for the int8 representative dataset;
+            the first CALIBRATION_IMAGES_PER_SPECIES images of each species,
+            which check_parity leaves out
+        calibration_samples: Maximum number of calibration images
+
+    Returns:
+        The output path
+    """
+    import tensorflow as tf
+    from predictor import load_image_array
+
+    model = tf.keras.models.load_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantization is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        calibration, _ = split_images(calibration_dir)
+        paths = [path for path, _ in calibration][:calibration_samples]
+
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            for path in paths:
+                yield [load_image_array(path)[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization not in (None, "dynamic"):
+        raise ValueError(f"Unknown quantization '{quantization}'")
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(output_path).write_bytes(converter.convert())
+    return output_path
+
+
+def check_parity(reference, candidate, image_dir: str = EXAMPLE_IMAGES_DIR,
+                 batch_size: int = 16, held_out: bool = True) -> Dict[str, float]:
+    """
+    Compare two backends on a held-out image set labelled by directory name.
+
+    Args:
+        reference: Baseline backend (usually Keras)
+        candidate: Backend under test (e.g. quantized TFLite)
+        image_dir: Directory of <species>/<image> files
+        batch_size: Images per forward pass
+        held_out: Skip the images convert_to_tflite calibrates on; set False
+            when image_dir is not the calibration directory
+
+    Returns:
+        Top-1/top-3 agreement between the backends, accuracy of each against
+        the directory labels and the largest probability difference
+    """
+    from predictor import load_image_array
+
+    images = split_images(image_dir)[1] if held_out else _labelled_images(image_dir)
+    if not images:
+        raise ValueError(f"No images found in {image_dir}")
+
+    reference_probs, candidate_probs = [], []
+    for start in range(0, len(images), batch_size):
+        batch = np.stack([load_image_array(path) for path, _ in images[start:start + batch_size]])
+        reference_probs.append(reference.predict(batch))
+        candidate_probs.append(candidate.predict(batch))
+    reference_probs = np.concatenate(reference_probs)
+    candidate_probs = np.concatenate(candidate_probs)
+
+    labels = np.array([MUSHROOM_SPECIES.index(label) for _, label in images])
+    reference_top1 = reference_probs.argmax(axis=1)
+    candidate_top1 = candidate_probs.argmax(axis=1)
+    reference_top3 = np.argsort(-reference_probs, axis=1)[:, :3]
+    candidate_top3 = np.argsort(-candidate_probs, axis=1)[:, :3]
+
+    return {
+        "images": len(images),
+        "top1_agreement": float(np.mean(reference_top1 == candidate_top1)),
+        "top3_agreement": float(np.mean([set(r) == set(c) for r, c in zip(reference_top3, candidate_top3)])),
+        "reference_accuracy": float(np.mean(reference_top1 == labels)),
+        "candidate_accuracy": float(np.mean(candidate_top1 == labels)),
+        "max_abs_diff": float(np.max(np.abs(reference_probs - candidate_probs))),
+    }
+
+
+def split_images(image_dir: str, per_species: int = CALIBRATION_IMAGES_PER_SPECIES) -> Tuple[list, list]:
+    """
+    Split labelled images into disjoint calibration and parity sets.
+
+    The first per_species images (in name order) of every species calibrate
+    int8 quantization, so calibration covers all classes and the parity check
+    measures images the quantized model was not calibrated on.
+
+    Returns:
+        (calibration, held_out) lists of (path, species) pairs
+    """
+    calibration, held_out = [], []
+    seen: Dict[str, int] = {}
+    for path, species in _labelled_images(image_dir):
+        seen[species] = seen.get(species, 0) + 1
+        (calibration if seen[species] <= per_species else held_out).append((path, species))
+    return calibration, held_out
+
+
+def _tflite_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+def _quantize(batch: np.ndarray, details: dict) -> np.ndarray:
+    if details["dtype"] == np.float32:
+        return batch.astype(np.float32)
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(details["dtype"])
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+
+def _dequantize(output: np.ndarray, details: dict) -> np.ndarray:
+    if details["dtype"] == np.float32:
+        return output
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+def _labelled_images(image_dir: str) -> List[tuple]:
+    # (path, species) pairs for species the CNN knows about
+    species = set(MUSHROOM_SPECIES)
+    return [
+        (str(path), directory.name)
+        for directory in sorted(Path(image_dir).iterdir())
+        if directory.is_dir() and directory.name in species
+        for path in sorted(directory.iterdir())
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and validate CNN backends.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Convert the Keras model to TFLite")
+    convert.add_argument("--output", default=TFLITE_MODEL_PATH)
+    convert.add_argument("--quantization", choices=["dynamic", "float16", "int8"])
+
+    parity = subparsers.add_parser("parity", help="Compare a TFLite model with the Keras model")
+    parity.add_argument("--model", default=TFLITE_MODEL_PATH)
+    parity.add_argument("--images", default=EXAMPLE_IMAGES_DIR)
+    parity.add_argument("--include-calibration", action="store_true",
+                        help="Also compare on the images used for int8 calibration")
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        print(f"Wrote {convert_to_tflite(output_path=args.output, quantization=args.quantization)}")
+    else:
+        report = check_parity(KerasBackend(), TFLiteBackend(args.model), args.images,
+                              held_out=not args.include_calibration)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,8 +9,15 @@ load_dotenv()
 # API Configuration
 API_KEY = os.getenv("API_KEY")
 
+# Startup Configuration
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "1") != "0"  # Render first, load models in the background
+
 # Model Configuration
 CNN_MODEL_PATH = "Model/mushroomCNNclasifier.h5"
+CNN_BACKEND = os.getenv("CNN_BACKEND", "keras")  # "keras" or "tflite"
+TFLITE_MODEL_PATH = "Model/mushroomCNNclasifier.tflite"
+TFLITE_NUM_THREADS = None  # None lets the TFLite runtime decide
+CALIBRATION_IMAGES_PER_SPECIES = 1  # Example images for int8 calibration; parity checks use the others
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 GEMINI_MODEL_NAME = "gemini-2.5-flash-lite"
 
@@ -23,15 +30,99 @@ KNOWLEDGE_BASE_FILES = [
     "Knowledge_base/first_nature.json",
     "Knowledge_base/others.json"
 ]
-EMBEDDINGS_PATH = "Knowledge_base/embeddings.npy"
+EMBEDDINGS_PATH = "Knowledge_base/embeddings.npy"  # Legacy one-row-per-record matrix; the artifact embeds chunks
+KNOWLEDGE_BASE_ARTIFACT_DIR = "Knowledge_base/artifact"
+EMBEDDINGS_DTYPE = "float32"  # "float16" halves the artifact size, but loads as a float32 copy instead of a memory map
+ENCODE_BATCH_SIZE = 64
+CHUNK_MAX_CHARS = 1000  # About the embedding model's 256-token input limit
+SECTION_MIN_CHARS = 200  # Shorter fields are grouped into the record's overview chunk
+
+# Knowledge Base Ingestion Configuration
+INGEST_WORKERS = 8  # Concurrent page fetches per source
+INGEST_RATE_LIMIT = 2.0  # Requests per second to any one host
+INGEST_TIMEOUT = 20  # Seconds per request
+INGEST_RETRIES = 3  # Retries on connection errors, 429 and 5xx
+INGEST_USER_AGENT = "MushroomScraper/1.0"
+INGEST_CACHE_PATH = "cache/http_cache.sqlite3"  # Page bodies with their ETag / Last-Modified
+INGEST_CHECKPOINT_DIR = "cache/ingestion"  # Parsed records per source, for resuming
+
+# Approximate Nearest Neighbour Index Configuration
+ANN_INDEX = os.getenv("ANN_INDEX", "auto")  # "auto" uses a built index when present, "none" disables it
+ANN_MIN_DOCUMENTS = 20000  # Below this exact search is as fast, so no index is used
+IVF_NLIST = None  # Inverted lists; None picks about 4 * sqrt(n_documents)
+IVF_NPROBE = 16  # Lists scanned per query: higher = better recall, slower
+HNSW_M = 16  # Graph degree: higher = better recall, more memory
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # Candidate list size per query: higher = better recall, slower
+
+# Hybrid Retrieval Configuration
+RETRIEVAL_FUSION = os.getenv("RETRIEVAL_FUSION", "rrf")  # "rrf" fuses BM25 and embeddings, "dense" or "lexical" uses one
+RRF_K = 60  # Reciprocal rank fusion offset: higher = flatter rank weighting
+FUSION_CANDIDATES = 50  # Documents taken from each ranker before fusing
+LEXICAL_FAST_PATH_MAX_TOKENS = 3  # Short exact-term queries up to this length skip the embedding model
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Query Embedding Cache Configuration
+QUERY_CACHE_SIZE = 10000
+QUERY_CACHE_PATH = None  # e.g. "Knowledge_base/query_cache.npz" to persist across restarts
 
 # Image Processing Configuration
 IMAGE_SIZE = (224, 224)
-TEMP_IMAGE_PATH = "temp/temp_img.jpg"
+EXAMPLE_IMAGES_DIR = "example_images"
+PREDICT_BATCH_SIZE = 32  # Images per CNN forward pass
+DECODE_WORKERS = min(8, os.cpu_count() or 1)  # Threads decoding/resizing images
+
+# Chat Rendering Configuration
+CHAT_IMAGE_WIDTH = 250  # Display width of images in chat answers
+THUMBNAIL_SIZE = 500  # Longest thumbnail side in pixels (2x the display width for sharp HiDPI rendering)
+THUMBNAIL_QUALITY = 85  # JPEG quality of thumbnails
+THUMBNAIL_CACHE_SIZE = 256  # Thumbnails kept in memory
+THUMBNAIL_CACHE_DIR = "cache/thumbnails"  # None keeps thumbnails in memory only
+
+# Micro-batching Configuration
+BATCH_MAX_SIZE = 16  # Maximum images per batched forward pass
+BATCH_MAX_WAIT_MS = 10  # How long a request waits for others to join its batch
+BATCH_MAX_QUEUE = 256  # Pending requests before new ones are rejected
+
+# Inference Service Configuration
+SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))  # Requests processed concurrently
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "64"))  # Running + queued before 503
+SERVICE_REQUEST_TIMEOUT = float(os.getenv("SERVICE_REQUEST_TIMEOUT", "30"))  # Seconds before 504
+SERVICE_MAX_BODY_BYTES = 20 * 1024 * 1024
+SERVICE_MAX_BATCH = 64  # Images per /predict batch request
+SERVICE_MAX_TOP_K_DOCUMENTS = 50  # Largest top_k accepted by /retrieve
 
 # RAG Configuration
 TOP_K_DOCUMENTS = 3
+CHAT_CONTEXT_CHARS = 6000  # Retrieved chunk text per chat prompt
+IDENTIFICATION_CONTEXT_CHARS = 10000  # Retrieved chunk text per identification prompt
+IDENTIFICATION_CHUNKS_PER_SPECIES = 20  # Candidates per species; the context budget decides how many are sent
+IDENTIFICATION_PRIMARY_SHARE = 0.5  # Share of the identification budget for the top prediction
 CONFIDENCE_THRESHOLD = 0.90
+PROMPT_TOKEN_BUDGET = 32000  # History + new prompt, estimated at ~4 characters per token
+HISTORY_KEEP_RECENT_TURNS = 3  # Recent turns never compacted (the first turn is always kept)
+HISTORY_SUMMARY_CHARS = 400  # Characters kept from a compacted answer
+
+# Identification Card Cache Configuration
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_PATH = "cache/response_cache.sqlite3"
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600  # Cards expire so knowledge base edits show up
+RESPONSE_CACHE_MAX_ENTRIES = 5000  # Least recently used cards beyond this are evicted
+
+# Species-name chunks are ordered by section: toxicity, look-alikes, then morphology
+SECTION_PRIORITY = [
+    r"toxic|poison|edib|psychoactive",
+    r"confusion|similar|look-?alike",
+    r"\b(?:cap|pileus|stipe|stem|gills|lamellae|pores|hymenophore|fruiting body|sporocarp|description)\b",
+]
+
+# Classifier labels without a record of their own -> record covering them
+SPECIES_ALIASES = {
+    "Amanita amerirubescens": "Amanita rubescens",  # The American blusher, described with A. rubescens
+}
 
 # Mushroom Species List
 MUSHROOM_SPECIES = [
@@ -0,0 +1,133 @@
+"""Track what the chat already contains and keep prompts within a token budget."""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from config import PROMPT_TOKEN_BUDGET, HISTORY_KEEP_RECENT_TURNS, HISTORY_SUMMARY_CHARS
+
+# Matches the document headers written by MushroomRAGAgent's context builders
+DOCUMENT_HEADER_PATTERN = re.compile(r"^--- Document \d+ \(id (\d+),", re.MULTILINE)
+QUESTION_PATTERN = re.compile(r"=== USER QUESTION ===\n(.*?)\n\nYour response", re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def content_text(content: Any) -> str:
+    """Concatenate the text parts of a chat history entry."""
+    return "".join(getattr(part, "text", None) or "" for part in getattr(content, "parts", None) or [])
+
+
+class ConversationContext:
+    """Per-chat bookkeeping of sent documents, history size and prompt sizes."""
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET,
+                 keep_recent_turns: int = HISTORY_KEEP_RECENT_TURNS,
+                 summary_chars: int = HISTORY_SUMMARY_CHARS):
+        """
+        Args:
+            token_budget: Maximum estimated tokens of history plus the new prompt
+            keep_recent_turns: Most recent turns that are never compacted
+            summary_chars: Characters kept from a compacted model answer
+        """
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_chars = summary_chars
+        self.turn_stats: List[Dict[str, int]] = []
+
+    def documents_in_history(self, history: List[Any]) -> Set[int]:
+        """Document indices whose full text is still present in the chat history."""
+        indices = set()
+        for content in history:
+            if getattr(content, "role", None) == "user":
+                indices.update(int(i) for i in DOCUMENT_HEADER_PATTERN.findall(content_text(content)))
+        return indices
+
+    def select_new_documents(self, relevant_docs: List[Dict], history: List[Any]) -> List[Dict]:
+        """Drop documents the model has already seen in this conversation."""
+        already_sent = self.documents_in_history(history)
+        return [doc for doc in relevant_docs if doc["index"] not in already_sent]
+
+    def fit_history(self, history: List[Any], prompt: str,
+                    make_content: Callable[[str, str], Any]) -> Optional[List[Any]]:
+        """
+        Compact the history so that history plus prompt fit the token budget.
+
+        The first turn (the identification card) and the most recent turns are
+        kept verbatim. Older turns are first summarized (question only, answer
+        truncated), then dropped, oldest first.
+
+        Args:
+            history: Current chat history (alternating user/model entries)
+            prompt: The message about to be sent
+            make_content: Builds a history entry from (role, text)
+
+        Returns:
+            The compacted history, or None if nothing was summarized or dropped
+        """
+        texts = [content_text(content) for content in history]
+        prompt_tokens = estimate_tokens(prompt)
+        if sum(estimate_tokens(t) for t in texts) + prompt_tokens <= self.token_budget:
+            return None
+
+        turns = [list(pair) for pair in zip(history[0::2], history[1::2])]
+        turn_texts = [list(pair) for pair in zip(texts[0::2], texts[1::2])]
+        trailing = history[len(turns) * 2:]
+        compactable = list(range(1, max(1, len(turns) - self.keep_recent_turns)))
+
+        def total_tokens() -> int:
+            return sum(estimate_tokens(t) for pair in turn_texts if pair for t in pair) + prompt_tokens
+
+        changed = False
+        # Summarize, oldest first
+        for i in compactable:
+            if total_tokens() <= self.token_budget:
+                break
+            question = self._summarize_question(turn_texts[i][0])
+            answer = self._summarize_answer(turn_texts[i][1])
+            turns[i] = [make_content("user", question), make_content("model", answer)]
+            turn_texts[i] = [question, answer]
+            changed = True
+
+        # Still too long: drop summarized turns, oldest first
+        for i in compactable:
+            if total_tokens() <= self.token_budget:
+                break
+            turns[i] = []
+            turn_texts[i] = []
+            changed = True
+
+        if not changed:
+            # Over budget, but only the card and the recent turns are left
+            return None
+        return [content for pair in turns for content in pair] + list(trailing)
+
+    def record_turn(self, prompt: str, history: List[Any], new_documents: int,
+                    skipped_documents: int, compacted: bool) -> Dict[str, int]:
+        """Store and return the size report for the prompt being sent."""
+        stats = {
+            "turn": len(self.turn_stats) + 1,
+            "prompt_chars": len(prompt),
+            "prompt_tokens": estimate_tokens(prompt),
+            "history_tokens": sum(estimate_tokens(content_text(c)) for c in history),
+            "new_documents": new_documents,
+            "skipped_documents": skipped_documents,
+            "compacted": int(compacted),
+        }
+        self.turn_stats.append(stats)
+        return stats
+
+    def reset(self) -> None:
+        self.turn_stats = []
+
+    def _summarize_question(self, text: str) -> str:
+        match = QUESTION_PATTERN.search(text)
+        question = match.group(1).strip() if match else text[:self.summary_chars]
+        return f"[Earlier question, documents omitted] {question}"
+
+    def _summarize_answer(self, text: str) -> str:
+        if len(text) <= self.summary_chars:
+            return text
+        return f"{text[:self.summary_chars]} [...truncated]"
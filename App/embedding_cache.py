@@ -0,0 +1,111 @@
+"""Bounded LRU cache of query embeddings, optionally persisted to disk."""
+
+import atexit
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from atomic_write import write_atomic
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase and collapse whitespace (the MiniLM tokenizer is uncased)."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU mapping (model name, normalized query) to its embedding."""
+
+    def __init__(self, max_size: int = 10000, path: Optional[str] = None):
+        """
+        Initialize the cache and load persisted entries if present.
+
+        Args:
+            max_size: Maximum number of cached embeddings
+            path: Optional .npz file to load from and save to on exit
+        """
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding and mark it as recently used, or None."""
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name: str, text: str, vector: np.ndarray) -> None:
+        """Store an embedding, evicting the least recently used entry when full."""
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+    def save(self) -> None:
+        """Persist the cache to its .npz file (oldest entries first)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._entries:
+                return
+            keys = list(self._entries.keys())
+            vectors = np.stack(list(self._entries.values()))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Unique temp name: several worker processes may save at exit together
+        write_atomic(self.path, lambda f: np.savez(
+            f,
+            models=np.array([k[0] for k in keys]),
+            texts=np.array([k[1] for k in keys]),
+            vectors=vectors
+        ))
+
+    def load(self) -> None:
+        """Load persisted entries, ignoring a missing or unreadable file."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                models, texts, vectors = data["models"], data["texts"], data["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Query embedding cache unreadable ({e}).")
+            return
+        with self._lock:
+            for model_name, text, vector in zip(models, texts, vectors):
+                self._entries[(str(model_name), str(text))] = vector
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
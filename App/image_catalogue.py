@@ -0,0 +1,72 @@
+"""In-memory index of the example image catalogue, refreshed on directory changes."""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from config import EXAMPLE_IMAGES_DIR
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+class ExampleImageCatalogue:
+    """Maps species name -> example image paths without rescanning on every request."""
+
+    def __init__(self, base_dir: str = EXAMPLE_IMAGES_DIR):
+        """
+        Args:
+            base_dir: Directory containing one sub-directory of images per species
+        """
+        self.base_dir = Path(base_dir)
+        self._images: Dict[str, Tuple[int, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def images_for(self, species: str) -> List[str]:
+        """
+        Image paths for one species, rescanned only when its directory changes.
+
+        Args:
+            species: Species (directory) name
+
+        Returns:
+            Sorted POSIX paths relative to the working directory, empty if unknown
+        """
+        directory = self.base_dir / species
+        mtime = _mtime(directory)
+        if mtime is None:
+            return []
+
+        with self._lock:
+            cached = self._images.get(species)
+            if cached is not None and cached[0] == mtime:
+                return list(cached[1])
+
+        paths = sorted(
+            (directory / entry.name).as_posix()
+            for entry in os.scandir(directory)
+            if entry.is_file() and Path(entry.name).suffix.lower() in IMAGE_SUFFIXES
+        )
+        with self._lock:
+            self._images[species] = (mtime, paths)
+        return list(paths)
+
+
+_default_catalogue = None
+_default_lock = threading.Lock()
+
+
+def default_catalogue() -> ExampleImageCatalogue:
+    """Process-wide catalogue for config.EXAMPLE_IMAGES_DIR."""
+    global _default_catalogue
+    with _default_lock:
+        if _default_catalogue is None:
+            _default_catalogue = ExampleImageCatalogue()
+        return _default_catalogue
+
+
+def _mtime(path: Path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
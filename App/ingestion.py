@@ -0,0 +1,593 @@
+"""Concurrent, resumable scraping of the knowledge base sources."""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse
+
+from atomic_write import atomic_path
+from config import (
+    INGEST_WORKERS, INGEST_RATE_LIMIT, INGEST_TIMEOUT, INGEST_RETRIES, INGEST_USER_AGENT,
+    INGEST_CACHE_PATH, INGEST_CHECKPOINT_DIR, MUSHROOM_SPECIES
+)
+from metrics import PAGES_FETCHED
+
+Record = Tuple[str, Dict]
+
+# Wikipedia sections that carry no species information
+UNWANTED_SECTIONS = {
+    "References", "External links", "See also", "Sources", "Further reading", "Gallery", "Works cited"
+}
+
+
+class PageCache:
+    """SQLite store of fetched pages with their validators, for conditional GETs."""
+
+    def __init__(self, path: str = INGEST_CACHE_PATH):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a non-persistent cache)
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+            "fetched REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Optional[str]]]:
+        """Return {"body", "etag", "last_modified"} of a cached page, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"body": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def put(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, body, etag, last_modified, fetched) VALUES (?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, time.time())
+            )
+            self._db.commit()
+
+
+class RateLimiter:
+    """Spaces requests to each host at least 1 / rate seconds apart."""
+
+    def __init__(self, rate: float = INGEST_RATE_LIMIT):
+        """
+        Args:
+            rate: Requests per second per host (0 disables the limit)
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        """Block until the caller may send its request to host."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    HTTP GETs through one pooled requests.Session per worker thread.
+
+    Every request honours the per-host rate limit, and pages seen before are
+    revalidated with If-None-Match / If-Modified-Since, so unchanged pages
+    cost a 304 instead of a download.
+    """
+
+    def __init__(self, cache: Optional[PageCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 timeout: float = INGEST_TIMEOUT,
+                 retries: int = INGEST_RETRIES,
+                 pool_size: int = INGEST_WORKERS,
+                 user_agent: str = INGEST_USER_AGENT):
+        """
+        Args:
+            cache: Page cache for conditional requests (None disables caching)
+            rate_limiter: Per-host limiter; a default one when omitted
+            timeout: Seconds per request
+            retries: Retries on connection errors, 429 and 5xx responses
+            pool_size: Keep-alive connections per host and session
+            user_agent: User-Agent header
+        """
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.user_agent = user_agent
+        self._local = threading.local()
+
+    def _session(self):
+        # Deferred so importing this module does not require requests
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=self.retries, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True)
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = self.user_agent
+            self._local.session = session
+        return session
+
+    def get(self, url: str) -> str:
+        """
+        Fetch a page body, revalidating a cached copy when there is one.
+
+        Raises:
+            requests.HTTPError: On a 4xx/5xx response (after retries)
+        """
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        self.rate_limiter.wait(urlparse(url).netloc)
+        response = self._session().get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            PAGES_FETCHED.inc(result="not_modified")
+            return cached["body"]
+        response.raise_for_status()
+
+        PAGES_FETCHED.inc(result="downloaded")
+        if "charset" not in response.headers.get("Content-Type", ""):
+            # requests would assume ISO-8859-1; detect the encoding from the body instead
+            response.encoding = response.apparent_encoding
+        body = response.text
+        if self.cache:
+            self.cache.put(url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return body
+
+
+def _soup(html: str):
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, "html.parser")
+
+
+class Source:
+    """A knowledge base source: how to list its pages and turn one page into a record."""
+
+    name = ""
+    output_file = ""
+    default_base_url = ""
+
+    def __init__(self, base_url: Optional[str] = None):
+        """
+        Args:
+            base_url: Site root; a local server with saved pages can stand in
+                for the real site
+        """
+        self.base_url = (base_url or self.default_base_url).rstrip("/")
+
+    def page_urls(self, fetcher: Fetcher) -> List[str]:
+        """URLs of the species pages, in output order."""
+        raise NotImplementedError
+
+    def parse(self, url: str, body: str) -> Optional[Record]:
+        """(record name, record) of one page, or None if the page has no species data."""
+        raise NotImplementedError
+
+
+class WikipediaSource(Source):
+    """Plain-text Wikipedia extracts of the CNN's species, split into sections."""
+
+    name = "wikipedia"
+    output_file = "wikipedia.json"
+    default_base_url = "https://en.wikipedia.org"
+
+    def page_urls(self, fetcher: Fetcher) -> List[str]:
+        return [
+            f"{self.base_url}/w/api.php?" + urlencode({
+                "action": "query", "format": "json", "titles": species,
+                "prop": "extracts", "explaintext": 1, "redirects": 1
+            })
+            for species in MUSHROOM_SPECIES
+        ]
+
+    def parse(self, url: str, body: str) -> Optional[Record]:
+        title = parse_qs(urlparse(url).query)["titles"][0]
+        page = next(iter(json.loads(body).get("query", {}).get("pages", {}).values()), None)
+        if page is None or "missing" in page:
+            return None
+        return title, self.extract_sections(page.get("extract", ""))
+
+    @staticmethod
+    def extract_sections(text: str) -> Dict[str, str]:
+        parts = re.split(r"\n={2,3} ([^=\n]+) ={2,3}\n", text)
+        sections = {"Introduction": parts[0].strip()}
+        for section_name, content in zip(parts[1::2], parts[2::2]):
+            section_name = section_name.strip()
+            if section_name in UNWANTED_SECTIONS:
+                continue
+            # Keep the titles of deeper sub-headers as plain text
+            content = re.sub(r"(=+)\s*([^=\n]+?)\s*\1", lambda m: m.group(2).strip(), content).strip()
+            if content:
+                sections[section_name] = content
+        return sections
+
+
+class MushroomWorldSource(Source):
+    """Species pages listed on mushroom.world's name list."""
+
+    name = "mushroom_world"
+    output_file = "mushroom_world.json"
+    default_base_url = "https://www.mushroom.world"
+
+    def page_urls(self, fetcher: Fetcher) -> List[str]:
+        index_url = f"{self.base_url}/mushrooms/namelist"
+        soup = _soup(fetcher.get(index_url))
+        return [urljoin(index_url, a["href"]) for a in soup.find_all("a", class_="alist-link", href=True)]
+
+    def parse(self, url: str, body: str) -> Optional[Record]:
+        soup = _soup(body)
+        caption = soup.find("b", class_="mush-captiontext")
+        if caption is None:
+            return None
+        scientific_name = caption.find(string=True, recursive=False).strip()
+        common_name = soup.find("span", class_="mush-commonname")
+
+        record = {
+            "Scientific name": scientific_name,
+            "Common name": common_name.get_text(strip=True).strip("()") if common_name else "Unknown",
+        }
+        for info in soup.select(".mush-info"):
+            label = info.select_one(".mush-labelus")
+            text = info.select_one(".mush-textus, .mush-longtextus")
+            if label and text:
+                record[label.get_text(strip=True)] = text.get_text(" ", strip=True)
+        return scientific_name, record
+
+
+class WildFoodUKSource(Source):
+    """Wild Food UK's mushroom guide."""
+
+    name = "wild_food_uk"
+    output_file = "wild_food_uk.json"
+    default_base_url = "https://www.wildfooduk.com"
+
+    def page_urls(self, fetcher: Fetcher) -> List[str]:
+        index_url = f"{self.base_url}/mushroom-guide/?_per_page=300"
+        soup = _soup(fetcher.get(index_url))
+        links = (td.find("a", href=True) for td in soup.find_all("td", class_="mushroom-image"))
+        return [urljoin(index_url, a["href"]) for a in links if a]
+
+    def parse(self, url: str, body: str) -> Optional[Record]:
+        soup = _soup(body)
+        table = soup.select_one("div.wp-container-core-group-is-layout-0b691c38 table")
+        if table is None:
+            return None
+        edibility = soup.find("div", class_="mush-icon-label")
+        description = soup.select_one("div.entry-content p")
+        record = {"Description": description.get_text(strip=True) if description else "(no data)"}
+
+        for header in table.find_all("td", class_="spec-header"):
+            key = header.get_text(strip=True)
+            value_td = header.find_next_sibling("td")
+            value = value_td.get_text(" ", strip=True).replace("\xa0", " ") if value_td else ""
+
+            if key == "Mushroom Type":
+                record["Edibility"] = edibility.get_text(strip=True) if edibility else "(no data)"
+            elif key == "Common Names" and value:
+                record[key] = self.common_names(value) or value
+            else:
+                record[key] = value or "(no data)"
+
+        content = soup.find("div", id="mushroom-content")
+        for header in content.find_all("h2") if content else []:
+            paragraph = header.find_next_sibling("p")
+            value = paragraph.get_text(" ", strip=True).replace("\xa0", " ") if paragraph else ""
+            record[header.get_text(strip=True)] = value or "(no data)"
+
+        name = record.get("Scientific Name")
+        return (name, record) if name else None
+
+    @staticmethod
+    def common_names(value: str) -> Dict[str, str]:
+        # "Deathcap (EN), Death Cap (US)" -> {"EN": "Deathcap", "US": "Death Cap"}
+        names = {}
+        for part in value.split(","):
+            part = part.strip()
+            if "(" in part and ")" in part:
+                name = part[:part.rfind("(")].strip()
+                lang = part[part.rfind("(") + 1:part.rfind(")")].strip()
+                if name and lang:
+                    names[lang] = name
+        return names
+
+
+class MykowebSource(Source):
+    """Species pages of MykoWeb's California Fungi."""
+
+    name = "mykoweb"
+    output_file = "mykoweb.json"
+    default_base_url = "https://www.mykoweb.com"
+
+    def page_urls(self, fetcher: Fetcher) -> List[str]:
+        index_url = f"{self.base_url}/CAF/species_index.html"
+        soup = _soup(fetcher.get(index_url))
+        urls = {
+            urljoin(index_url, a["href"].replace(" ", "_"))
+            for a in soup.find_all("a", href=True) if a["href"].startswith("species/")
+        }
+        return sorted(urls)
+
+    def parse(self, url: str, body: str) -> Optional[Record]:
+        soup = _soup(body)
+        species = soup.select_one("span.species")
+        if species is None:
+            return None
+
+        record = {"Scientific name": species.get_text(strip=True)}
+        synonyms = {"Common Name": None, "Synonyms": None, "Misapplied name": None}
+        for p in soup.select("p.spsyn"):
+            text = p.get_text(" ", strip=True)
+            for label in synonyms:
+                if text.startswith(f"{label}:"):
+                    synonyms[label] = text[len(label) + 1:].strip()
+        record.update(synonyms)
+
+        for li in soup.select("#species_wrap > ul > li"):
+            title = li.select_one("div.spli")
+            desc = li.select_one("p.spdesc")
+            if not title or not desc:
+                continue
+            section_name = title.get_text(strip=True)
+            text = re.sub(r"\s+", " ", desc.get_text(" ", strip=True))
+            text = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", text)
+            record[section_name] = re.sub(r"\s+\.", ".", text)
+            if section_name.lower() == "comments":
+                break
+        return record["Scientific name"], record
+
+
+# Scraped sources only. first_nature.json (first-nature.com) came from a one-off scrape whose
+# scraper is not in the repository, and others.json holds hand-written records; neither can be
+# regenerated here, so both files are maintained by hand and never overwritten by this module.
+SOURCES = {
+    source.name: source
+    for source in (WildFoodUKSource, MushroomWorldSource, WikipediaSource, MykowebSource)
+}
+
+
+class Checkpoint:
+    """Append-only JSON-lines log of finished pages, so a rerun skips them."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def done_urls(self) -> set:
+        """URLs already parsed (with or without a record)."""
+        return {entry["url"] for _, entry in self._entries()}
+
+    def append(self, url: str, record: Optional[Record]) -> None:
+        entry = {"url": url}
+        if record is not None:
+            entry["name"], entry["record"] = record
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def records(self, urls: List[str]) -> Iterator[Record]:
+        """
+        Stream the logged records in the order of urls, one line in memory at a time.
+
+        A first pass maps each URL to its line offset; the second reads the
+        lines back in page order.
+        """
+        offsets = {entry["url"]: offset for offset, entry in self._entries() if "record" in entry}
+        if not offsets:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for url in urls:
+                if url in offsets:
+                    f.seek(offsets[url])
+                    entry = json.loads(f.readline())
+                    yield entry["name"], entry["record"]
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _entries(self) -> Iterator[Tuple[int, Dict]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    yield offset, json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut off by a crash; its page is fetched again
+                    continue
+
+
+def write_knowledge_base(records: Iterator[Record], path: str) -> int:
+    """
+    Stream records into the JSON object format prepare_knowledge_base reads.
+
+    The output matches json.dump(..., indent=2, ensure_ascii=False); the file
+    is replaced atomically once complete. Later records with an already
+    written name are dropped.
+
+    Returns:
+        Number of records written
+    """
+    written = set()
+    with atomic_path(path) as tmp_path, open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for name, record in records:
+            if name in written:
+                continue
+            body = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            f.write(f"{',' if written else ''}\n  {json.dumps(name, ensure_ascii=False)}: {body}")
+            written.add(name)
+        f.write("\n}" if written else "}")
+    return len(written)
+
+
+def ingest_source(source: Source, fetcher: Fetcher, output_dir: str = "Knowledge_base",
+                  checkpoint_dir: str = INGEST_CHECKPOINT_DIR, workers: int = INGEST_WORKERS,
+                  fresh: bool = False) -> Dict[str, int]:
+    """
+    Scrape one source into output_dir/<source.output_file>.
+
+    Pages are fetched by a pool of worker threads with at most 2 * workers in
+    flight. Every parsed page is appended to the checkpoint as soon as it is
+    done, so an interrupted run resumes where it stopped. Failed pages are
+    reported and retried on the next run; until none fail, the existing
+    knowledge base file is left as it is.
+
+    Args:
+        source: Source to scrape
+        fetcher: Shared fetcher (sessions, rate limits, page cache)
+        output_dir: Knowledge base directory
+        checkpoint_dir: Directory for the per-source checkpoints
+        workers: Concurrent page fetches
+        fresh: Ignore the checkpoint of an earlier run
+
+    Returns:
+        Page and record counts of the run ("records" is None if nothing was written)
+    """
+    checkpoint = Checkpoint(os.path.join(checkpoint_dir, f"{source.name}.jsonl"))
+    if fresh:
+        checkpoint.clear()
+
+    urls = source.page_urls(fetcher)
+    done = checkpoint.done_urls()
+    pending = iter([url for url in urls if url not in done])
+    stats = {"pages": len(urls), "resumed": len(done & set(urls)), "fetched": 0, "failed": 0}
+
+    def scrape(url: str) -> Optional[Record]:
+        return source.parse(url, fetcher.get(url))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"ingest-{source.name}") as pool:
+        in_flight = {}
+        while True:
+            # Keep the queue bounded instead of submitting every page up front
+            while len(in_flight) < 2 * workers:
+                url = next(pending, None)
+                if url is None:
+                    break
+                in_flight[pool.submit(scrape, url)] = url
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url = in_flight.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"Failed to scrape {url} ({e}).")
+                    continue
+                checkpoint.append(url, record)
+                stats["fetched"] += 1
+
+    if stats["failed"]:
+        # A partial file would replace the complete one of an earlier run
+        stats["records"] = None
+        return stats
+
+    os.makedirs(output_dir, exist_ok=True)
+    stats["records"] = write_knowledge_base(
+        checkpoint.records(urls), os.path.join(output_dir, source.output_file)
+    )
+    return stats
+
+
+def ingest(source_names: List[str], output_dir: str = "Knowledge_base",
+           base_url: Optional[str] = None, workers: int = INGEST_WORKERS,
+           rate_limit: float = INGEST_RATE_LIMIT, cache_path: Optional[str] = INGEST_CACHE_PATH,
+           checkpoint_dir: str = INGEST_CHECKPOINT_DIR, fresh: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Scrape several sources at once; each host is rate limited on its own.
+
+    Args:
+        source_names: Keys of SOURCES
+        base_url: Site root override for every source (e.g. a local test server)
+        cache_path: Page cache database (None disables conditional requests)
+        Other arguments: See ingest_source and Fetcher
+
+    Returns:
+        Per-source stats
+    """
+    fetcher = Fetcher(cache=PageCache(cache_path) if cache_path else None,
+                      rate_limiter=RateLimiter(rate_limit), pool_size=workers)
+    sources = [SOURCES[name](base_url) for name in source_names]
+
+    with ThreadPoolExecutor(max_workers=len(sources) or 1) as pool:
+        futures = {
+            source.name: pool.submit(ingest_source, source, fetcher, output_dir, checkpoint_dir, workers, fresh)
+            for source in sources
+        }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape the knowledge base sources.")
+    parser.add_argument("sources", nargs="*", default=list(SOURCES), choices=list(SOURCES),
+                        help="Sources to scrape (all by default)")
+    parser.add_argument("--output-dir", default="Knowledge_base", help="Knowledge base directory")
+    parser.add_argument("--base-url", help="Site root override, e.g. a local server with saved pages")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Concurrent fetches per source")
+    parser.add_argument("--rate", type=float, default=INGEST_RATE_LIMIT,
+                        help="Requests per second per host (0 = unlimited)")
+    parser.add_argument("--cache", default=INGEST_CACHE_PATH, help="Page cache database")
+    parser.add_argument("--no-cache", action="store_true", help="Always download full pages")
+    parser.add_argument("--checkpoint-dir", default=INGEST_CHECKPOINT_DIR, help="Resume checkpoints")
+    parser.add_argument("--fresh", action="store_true", help="Ignore checkpoints of earlier runs")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = ingest(args.sources, args.output_dir, args.base_url, args.workers, args.rate,
+                     None if args.no_cache else args.cache, args.checkpoint_dir, args.fresh)
+    for name, stats in results.items():
+        records = "not written" if stats["records"] is None else f"{stats['records']} records"
+        print(f"{name}: {records} from {stats['pages']} pages "
+              f"({stats['resumed']} resumed, {stats['fetched']} fetched, {stats['failed']} failed).")
+    print(f"Finished in {time.perf_counter() - start:.1f}s.")
+
+    if any(stats["failed"] for stats in results.values()):
+        print("Some pages failed; run again to retry them.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
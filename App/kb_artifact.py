@@ -0,0 +1,381 @@
+"""Precompiled, versioned knowledge base artifact with memory-mapped loading."""
+
+import argparse
+import hashlib
+import json
+import os
+from collections.abc import Sequence
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from atomic_write import write_atomic
+from config import (
+    KNOWLEDGE_BASE_FILES, KNOWLEDGE_BASE_ARTIFACT_DIR,
+    EMBEDDING_MODEL_NAME, EMBEDDINGS_DTYPE, ENCODE_BATCH_SIZE, CHUNK_MAX_CHARS, SECTION_MIN_CHARS,
+    SECTION_PRIORITY, SPECIES_ALIASES, BM25_K1, BM25_B
+)
+from knowledge_base import (
+    prepare_knowledge_base, NAME_FIELDS, SYNONYM_FIELDS, BINOMIAL_PATTERN, INFRASPECIFIC_PATTERN
+)
+from lexical_index import LexicalIndex, TOKEN_PATTERN, STOPWORDS
+
+# Bump when the document format or artifact layout changes
+ARTIFACT_VERSION = 6
+
+MANIFEST_FILE = "manifest.json"
+DOCUMENTS_FILE = "documents.bin"
+OFFSETS_FILE = "offsets.npy"
+EMBEDDINGS_FILE = "embeddings.npy"
+HASHES_FILE = "doc_hashes.npy"
+
+# Below this many documents per core a single process encodes faster
+MIN_DOCUMENTS_PER_WORKER = 64
+
+
+class DocumentStore(Sequence):
+    """Read-only sequence of documents decoded on access from a memory-mapped blob."""
+
+    def __init__(self, documents_path: str, offsets_path: str):
+        """
+        Memory-map the document text and offsets.
+
+        Args:
+            documents_path: Path to the concatenated UTF-8 document text
+            offsets_path: Path to the int64 offsets array (n_documents + 1)
+        """
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        if os.path.getsize(documents_path) > 0:
+            self.text = np.memmap(documents_path, dtype=np.uint8, mode="r")
+        else:
+            self.text = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.text[start:end].tobytes().decode("utf-8")
+
+
+class KnowledgeBaseArtifact:
+    """Loaded knowledge base artifact: section chunks, their embeddings and indexes."""
+
+    def __init__(self, artifact_dir: str):
+        """
+        Load an artifact directory without parsing the JSON sources.
+
+        Args:
+            artifact_dir: Directory written by build_artifact
+        """
+        self.artifact_dir = artifact_dir
+        with open(os.path.join(artifact_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.documents = DocumentStore(
+            os.path.join(artifact_dir, DOCUMENTS_FILE),
+            os.path.join(artifact_dir, OFFSETS_FILE)
+        )
+        self.embeddings = np.load(os.path.join(artifact_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.metadata: List[Dict[str, str]] = self.manifest["metadata"]
+        self.name_index: Dict[str, List[int]] = self.manifest["name_index"]
+        self.lexical_index = LexicalIndex.load(artifact_dir)
+
+        n_documents = self.manifest["n_documents"]
+        if (len(self.documents) != n_documents or self.embeddings.shape[0] != n_documents
+                or len(self.lexical_index) != n_documents):
+            raise ValueError(f"Artifact in {artifact_dir} is inconsistent with its manifest")
+
+    @property
+    def content_hash(self) -> str:
+        return self.manifest["content_hash"]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+
+def _build_settings() -> Dict:
+    # Every setting that changes the chunks, the name index or the lexical index
+    return {
+        "version": ARTIFACT_VERSION,
+        "chunk_max_chars": CHUNK_MAX_CHARS,
+        "section_min_chars": SECTION_MIN_CHARS,
+        "section_priority": SECTION_PRIORITY,
+        "species_aliases": SPECIES_ALIASES,
+        "name_fields": sorted(NAME_FIELDS),
+        "synonym_fields": sorted(SYNONYM_FIELDS),
+        "binomial_pattern": BINOMIAL_PATTERN.pattern,
+        "infraspecific_pattern": INFRASPECIFIC_PATTERN.pattern,
+        "token_pattern": TOKEN_PATTERN.pattern,
+        "stopwords": sorted(STOPWORDS),
+        "bm25_k1": BM25_K1,
+        "bm25_b": BM25_B,
+    }
+
+
+def compute_content_hash(file_paths: List[str]) -> str:
+    """
+    Hash the knowledge base sources together with every setting the artifact is built from.
+
+    Args:
+        file_paths: Knowledge base JSON files, in load order
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(json.dumps(_build_settings(), sort_keys=True).encode())
+    for file_path in file_paths:
+        digest.update(os.path.basename(file_path).encode())
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def document_hashes(documents: List[str]) -> np.ndarray:
+    """Return a fixed-size content hash per document."""
+    return np.array(
+        [hashlib.blake2b(doc.encode("utf-8"), digest_size=16).digest() for doc in documents],
+        dtype="S16"
+    )
+
+
+def encode_documents(documents: List[str], embedding_model_name: str,
+                     batch_size: int = ENCODE_BATCH_SIZE,
+                     workers: Optional[int] = None) -> np.ndarray:
+    """
+    Encode documents in batches, spread across CPU worker processes when worthwhile.
+
+    Args:
+        documents: Texts to encode
+        embedding_model_name: SentenceTransformer model name
+        batch_size: Encoding batch size
+        workers: Number of worker processes (defaults to the CPU count)
+
+    Returns:
+        float32 embedding matrix of shape (len(documents), dim)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(embedding_model_name)
+    workers = min(workers or os.cpu_count() or 1, len(documents) // MIN_DOCUMENTS_PER_WORKER)
+
+    if workers > 1:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        try:
+            embeddings = model.encode_multi_process(documents, pool, batch_size=batch_size)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        embeddings = model.encode(documents, batch_size=batch_size)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _previous_embeddings(artifact_dir: str, embedding_model_name: str) -> Dict[bytes, np.ndarray]:
+    # Map document hash -> embedding row of the artifact currently on disk
+    try:
+        with open(os.path.join(artifact_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("embedding_model") != embedding_model_name:
+            return {}
+        hashes = np.load(os.path.join(artifact_dir, HASHES_FILE))
+        embeddings = np.load(os.path.join(artifact_dir, EMBEDDINGS_FILE))
+    except (OSError, ValueError, KeyError):
+        return {}
+    if len(hashes) != embeddings.shape[0]:
+        return {}
+    return {bytes(h): row for h, row in zip(hashes, embeddings.astype(np.float32))}
+
+
+def update_embeddings(documents: List[str], hashes: np.ndarray, artifact_dir: str,
+                      embedding_model_name: str, workers: Optional[int] = None) -> np.ndarray:
+    """
+    Reuse embeddings of unchanged documents and encode only new or changed ones.
+
+    Args:
+        documents: Current documents
+        hashes: Content hashes of the current documents
+        artifact_dir: Directory holding the previous artifact, if any
+        embedding_model_name: SentenceTransformer model name
+        workers: Number of encoding worker processes
+
+    Returns:
+        float32 embedding matrix aligned with documents
+    """
+    previous = _previous_embeddings(artifact_dir, embedding_model_name)
+    missing = [i for i, h in enumerate(hashes) if bytes(h) not in previous]
+    print(f"Re-encoding {len(missing)} of {len(documents)} documents.")
+
+    encoded = None
+    if missing:
+        encoded = encode_documents([documents[i] for i in missing], embedding_model_name,
+                                   workers=workers)
+    if encoded is not None:
+        dim = encoded.shape[1]
+    elif previous:
+        dim = len(next(iter(previous.values())))
+    else:
+        # Empty knowledge base: nothing to encode, but queries still need a matching width
+        from sentence_transformers import SentenceTransformer
+
+        dim = SentenceTransformer(embedding_model_name).get_sentence_embedding_dimension()
+
+    embeddings = np.empty((len(documents), dim), dtype=np.float32)
+    for i, h in enumerate(hashes):
+        if bytes(h) in previous:
+            embeddings[i] = previous[bytes(h)]
+    if missing:
+        embeddings[missing] = encoded
+    return embeddings
+
+
+def build_artifact(file_paths: List[str] = KNOWLEDGE_BASE_FILES,
+                   artifact_dir: str = KNOWLEDGE_BASE_ARTIFACT_DIR,
+                   embedding_model_name: str = EMBEDDING_MODEL_NAME,
+                   dtype: str = EMBEDDINGS_DTYPE,
+                   embeddings: Optional[np.ndarray] = None,
+                   workers: Optional[int] = None) -> KnowledgeBaseArtifact:
+    """
+    Compile the knowledge base sources into a single artifact directory.
+
+    Args:
+        file_paths: Knowledge base JSON files, in load order
+        artifact_dir: Output directory
+        embedding_model_name: SentenceTransformer model used for the embeddings
+        dtype: Storage dtype for the embedding matrix ("float16" or "float32");
+            only float32 is searched straight from the memory map, float16 is
+            converted into a float32 copy when loaded
+        embeddings: Precomputed embeddings aligned with the documents; when
+            omitted, only documents missing from the previous artifact are encoded
+        workers: Number of encoding worker processes
+
+    Returns:
+        The freshly written artifact
+    """
+    content_hash = compute_content_hash(file_paths)
+    documents, name_index, metadata, lexical_index = prepare_knowledge_base(
+        file_paths, return_index=True, return_metadata=True, return_lexical=True
+    )
+
+    hashes = document_hashes(documents)
+
+    if embeddings is None:
+        embeddings = update_embeddings(documents, hashes, artifact_dir,
+                                       embedding_model_name, workers)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.shape[0] != len(documents):
+        raise ValueError(
+            f"Got {embeddings.shape[0]} embeddings for {len(documents)} documents"
+        )
+
+    # Store L2-normalized rows so loaders can search without copying
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings = (embeddings / norms).astype(dtype)
+
+    encoded = [doc.encode("utf-8") for doc in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(doc) for doc in encoded])
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "content_hash": content_hash,
+        "embedding_model": embedding_model_name,
+        "dtype": dtype,
+        "normalized": True,
+        "n_documents": len(documents),
+        "dim": int(embeddings.shape[1]),
+        "sources": [os.path.basename(p) for p in file_paths],
+        "metadata": metadata,
+        "name_index": name_index,
+    }
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    write_atomic(os.path.join(artifact_dir, DOCUMENTS_FILE), lambda f: f.write(b"".join(encoded)))
+    write_atomic(os.path.join(artifact_dir, OFFSETS_FILE), lambda f: np.save(f, offsets))
+    write_atomic(os.path.join(artifact_dir, EMBEDDINGS_FILE), lambda f: np.save(f, embeddings))
+    write_atomic(os.path.join(artifact_dir, HASHES_FILE), lambda f: np.save(f, hashes))
+    lexical_index.save(artifact_dir)
+    # Manifest goes last: it is what marks the artifact as complete
+    write_atomic(
+        os.path.join(artifact_dir, MANIFEST_FILE),
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    )
+    return KnowledgeBaseArtifact(artifact_dir)
+
+
+def load_artifact(file_paths: List[str] = KNOWLEDGE_BASE_FILES,
+                  artifact_dir: str = KNOWLEDGE_BASE_ARTIFACT_DIR,
+                  embedding_model_name: str = EMBEDDING_MODEL_NAME,
+                  dtype: str = EMBEDDINGS_DTYPE) -> Optional[KnowledgeBaseArtifact]:
+    """
+    Load the artifact if it exists and matches the sources, embedding model and dtype.
+
+    Returns:
+        The artifact, or None when it is missing, unreadable or stale
+    """
+    if not os.path.exists(os.path.join(artifact_dir, MANIFEST_FILE)):
+        return None
+    try:
+        artifact = KnowledgeBaseArtifact(artifact_dir)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Knowledge base artifact unreadable ({e}).")
+        return None
+
+    if artifact.manifest.get("version") != ARTIFACT_VERSION:
+        return None
+    if artifact.embedding_model != embedding_model_name:
+        return None
+    if artifact.manifest.get("dtype") != dtype or artifact.embeddings.dtype != np.dtype(dtype):
+        return None
+    if artifact.content_hash != compute_content_hash(file_paths):
+        return None
+    return artifact
+
+
+def load_or_build_artifact(file_paths: List[str] = KNOWLEDGE_BASE_FILES,
+                           artifact_dir: str = KNOWLEDGE_BASE_ARTIFACT_DIR,
+                           embedding_model_name: str = EMBEDDING_MODEL_NAME,
+                           dtype: str = EMBEDDINGS_DTYPE) -> KnowledgeBaseArtifact:
+    """Load a valid artifact, rebuilding it first when it is missing or stale."""
+    artifact = load_artifact(file_paths, artifact_dir, embedding_model_name, dtype)
+    if artifact is None:
+        print("Knowledge base artifact missing or stale, rebuilding...")
+        artifact = build_artifact(file_paths, artifact_dir, embedding_model_name, dtype)
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the knowledge base artifact.")
+    parser.add_argument("--output", default=KNOWLEDGE_BASE_ARTIFACT_DIR,
+                        help="Artifact output directory")
+    parser.add_argument("--dtype", default=EMBEDDINGS_DTYPE, choices=["float16", "float32"],
+                        help="Storage dtype for the embedding matrix")
+    parser.add_argument("--seed-embeddings",
+                        help="Reuse an existing embeddings .npy aligned with the current documents")
+    parser.add_argument("--workers", type=int,
+                        help="Encoding worker processes (defaults to the CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild even if the artifact is up to date")
+    args = parser.parse_args()
+
+    if not args.force and load_artifact(artifact_dir=args.output, dtype=args.dtype) is not None:
+        print(f"Artifact in {args.output} is up to date.")
+        return
+
+    seed = np.load(args.seed_embeddings) if args.seed_embeddings else None
+    artifact = build_artifact(artifact_dir=args.output, dtype=args.dtype,
+                              embeddings=seed, workers=args.workers)
+    print(f"Wrote {len(artifact.documents)} documents to {args.output} "
+          f"(hash {artifact.content_hash[:12]}).")
+
+
+if __name__ == "__main__":
+    main()
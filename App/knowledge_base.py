@@ -1,20 +1,180 @@
 import json
+import os
+import re
 
-def prepare_knowledge_base(file_paths):
+from config import CHUNK_MAX_CHARS, SECTION_MIN_CHARS, SECTION_PRIORITY, SPECIES_ALIASES
+from lexical_index import LexicalIndex
+
+NAME_FIELDS = {"scientific name"}
+SYNONYM_FIELDS = {"synonyms"}
+BINOMIAL_PATTERN = re.compile(r"^\s*([A-Z][a-z]+)\s+([a-z][a-z-]+)")
+# Varieties/forms/subspecies ("Boletus edulis f. aereus") name a different taxon
+INFRASPECIFIC_PATTERN = re.compile(r"\b(?:var|f|subsp|ssp)\.")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+OVERVIEW_SECTION = "overview"
+SECTION_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in SECTION_PRIORITY]
+
+
+def normalize_species_name(name):
+    return re.sub(r"[^a-z]", "", name.lower())
+
+
+def _record_names(mushroom_name, mushroom_info):
+    names = [mushroom_name]
+    synonyms = []
+    for label, value in mushroom_info.items():
+        if not isinstance(value, str):
+            continue
+        label = label.lower()
+        if label in NAME_FIELDS:
+            names.append(value)
+        elif label in SYNONYM_FIELDS:
+            for synonym in re.split(r"[;,]", value):
+                match = BINOMIAL_PATTERN.match(synonym)
+                if match and not INFRASPECIFIC_PATTERN.search(synonym):
+                    synonyms.append(f"{match.group(1)} {match.group(2)}")
+    return names, synonyms
+
+
+def _records(data):
+    # Some scrapes wrap their records with run statistics: {"metadata": ..., "fungi_data": {...}}
+    if isinstance(data.get("fungi_data"), dict):
+        return data["fungi_data"]
+    return data
+
+
+def _format_value(value):
+    if isinstance(value, dict):
+        return "; ".join(f"{label}: {item}" for label, item in value.items())
+    return str(value)
+
+
+def _sections(mushroom_info):
+    # (label, text) pairs; a nested dict of long passages gives one section per entry
+    for label, value in mushroom_info.items():
+        if label.startswith("_") or value is None:
+            continue
+        if isinstance(value, dict) and any(len(str(item)) >= SECTION_MIN_CHARS for item in value.values()):
+            for sub_label, item in value.items():
+                if item is not None:
+                    yield f"{label} - {sub_label}", _format_value(item)
+        else:
+            yield label, _format_value(value)
+
+
+def _pack(parts, max_chars, separator):
+    # Greedily join parts into pieces of at most max_chars (an oversized part is cut)
+    pieces = []
+    current = ""
+    for part in parts:
+        while len(part) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(part[:max_chars])
+            part = part[max_chars:]
+        if current and len(current) + len(separator) + len(part) > max_chars:
+            pieces.append(current)
+            current = part
+        else:
+            current = f"{current}{separator}{part}" if current else part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_record(mushroom_name, mushroom_info, max_chars=CHUNK_MAX_CHARS, min_section_chars=SECTION_MIN_CHARS):
+    """
+    Split one species record into (section, text) chunks.
+
+    Short fields (names, edibility, season, ...) are grouped into overview
+    chunks; every longer section gets its own chunks, split at sentence
+    boundaries. Each chunk starts with the record name so it stands alone
+    in a prompt and in the embedding space.
+    """
+    overview = []
+    sections = []
+    for label, text in _sections(mushroom_info):
+        if len(label) + len(text) + 2 < min_section_chars:
+            overview.append(f"{label}: {text}")
+        else:
+            for piece in _pack(SENTENCE_BOUNDARY.split(text), max_chars, " "):
+                sections.append((label, f"{mushroom_name}\n{label}: {piece}"))
+
+    chunks = [(OVERVIEW_SECTION, f"{mushroom_name}\n{piece}") for piece in _pack(overview, max_chars, "\n")]
+    if not chunks and not sections:
+        chunks.append((OVERVIEW_SECTION, mushroom_name))
+    return chunks + sections
+
+
+def _interleave(chunk_lists):
+    # First chunk of every record, then every second chunk, ...
+    longest = max((len(chunks) for chunks in chunk_lists), default=0)
+    return [chunks[i] for i in range(longest) for chunks in chunk_lists if i < len(chunks)]
+
+
+def _section_rank(section, is_main_record):
+    # The main record's overview (names, edibility) first, then SECTION_PRIORITY, then the rest
+    if section == OVERVIEW_SECTION:
+        return 0 if is_main_record else len(SECTION_PATTERNS) + 1
+    for rank, pattern in enumerate(SECTION_PATTERNS, start=1):
+        if pattern.search(section):
+            return rank
+    return len(SECTION_PATTERNS) + 2
+
+
+def prepare_knowledge_base(file_paths, return_index=False, return_metadata=False, return_lexical=False):
     knowledge_base = []
+    record_chunks = []
+    name_index = {}
+    synonym_index = {}
+    metadata = []
 
     for file_path in file_paths:
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        documents = []
+        source = os.path.basename(file_path)
+
+        for mushroom_name, mushroom_info in _records(data).items():
+            record = len(record_chunks)
+            record_chunks.append([])
+            for section, chunk in chunk_record(mushroom_name, mushroom_info):
+                record_chunks[record].append(len(knowledge_base))
+                knowledge_base.append(chunk)
+                metadata.append({"source": source, "name": mushroom_name, "section": section, "record": record})
+
+            # Index the record under its name, scientific name and synonyms
+            names, synonyms = _record_names(mushroom_name, mushroom_info)
+            for index, record_names in ((name_index, names), (synonym_index, synonyms)):
+                for name in record_names:
+                    key = normalize_species_name(name)
+                    if key and record not in index.setdefault(key, []):
+                        index[key].append(record)
+
+    # Records of the species itself rank before records listing it as a synonym
+    for key, records in synonym_index.items():
+        own = name_index.setdefault(key, [])
+        own.extend(r for r in records if r not in own)
 
-        for mushroom_name, mushroom_info in data.items():
-            doc_parts = [mushroom_name]
-            for label, value in mushroom_info.items():
-                doc_parts.append(f"{label}: {value}")
+    # Labels the records only mention elsewhere resolve to the record covering them
+    for alias, name in SPECIES_ALIASES.items():
+        key = normalize_species_name(alias)
+        if key not in name_index and normalize_species_name(name) in name_index:
+            name_index[key] = name_index[normalize_species_name(name)]
 
-            full_document = "\n".join(doc_parts)
-            documents.append(full_document)
+    # Map names to chunks ordered by section, interleaving records within a section
+    for key, records in name_index.items():
+        chunks = _interleave([record_chunks[r] for r in records])
+        name_index[key] = sorted(
+            chunks, key=lambda idx: _section_rank(metadata[idx]["section"], metadata[idx]["record"] == records[0])
+        )
 
-        knowledge_base.extend(documents)
-    return knowledge_base
\ No newline at end of file
+    results = [knowledge_base]
+    if return_index:
+        results.append(name_index)
+    if return_metadata:
+        results.append(metadata)
+    if return_lexical:
+        # BM25 over the same documents, for exact terms and Latin names
+        results.append(LexicalIndex.build(knowledge_base))
+    return tuple(results) if len(results) > 1 else knowledge_base
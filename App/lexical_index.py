@@ -0,0 +1,185 @@
+"""BM25 inverted index with array-backed (CSR) postings."""
+
+import json
+import os
+import re
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from atomic_write import write_atomic
+from config import BM25_K1, BM25_B
+
+VOCABULARY_FILE = "lexical_vocabulary.json"
+INDPTR_FILE = "lexical_indptr.npy"
+DOC_IDS_FILE = "lexical_doc_ids.npy"
+TERM_FREQS_FILE = "lexical_term_freqs.npy"
+DOC_LENGTHS_FILE = "lexical_doc_lengths.npy"
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+STOPWORDS = frozenset("""
+    a about an and any are as at be but by can could do does for from has have how i if in is it its
+    me more my no not of on or other should show so tell than that the their them then there these
+    they this to was what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase letter runs of two or more characters, without stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    Okapi BM25 over the knowledge base documents.
+
+    Postings are stored per term as contiguous slices of two flat arrays
+    (document ids and term frequencies), so a query term is one slice and one
+    vectorized score update.
+    """
+
+    def __init__(self, vocabulary: List[str], indptr: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Args:
+            vocabulary: Terms, ordered by term id
+            indptr: Start of each term's postings (len(vocabulary) + 1 entries)
+            doc_ids: Document id of every posting (int32)
+            term_freqs: Term frequency of every posting (uint16)
+            doc_lengths: Token count of every document
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.vocabulary = vocabulary
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.k1 = k1
+        self.b = b
+        n_documents = len(self.doc_lengths)
+        self.avg_length = float(self.doc_lengths.mean()) if n_documents else 0.0
+        doc_freqs = np.diff(np.asarray(indptr)).astype(np.float32)
+        self.idf = np.log1p((n_documents - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        # Per-document part of the BM25 denominator, computed once
+        self._length_norm = k1 * (1 - b + b * self.doc_lengths / max(self.avg_length, 1e-9))
+
+    @classmethod
+    def build(cls, documents: Sequence[str]) -> "LexicalIndex":
+        """Tokenize every document and assemble the postings arrays."""
+        postings = {}
+        doc_lengths = np.zeros(len(documents), dtype=np.int32)
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths[doc_id] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        vocabulary = sorted(postings)
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(postings[term]) for term in vocabulary])
+        doc_ids = np.empty(indptr[-1], dtype=np.int32)
+        term_freqs = np.empty(indptr[-1], dtype=np.uint16)
+        for i, term in enumerate(vocabulary):
+            entries = np.array(postings[term], dtype=np.int64)
+            doc_ids[indptr[i]:indptr[i + 1]] = entries[:, 0]
+            term_freqs[indptr[i]:indptr[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+        return cls(vocabulary, indptr, doc_ids, term_freqs, doc_lengths)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def is_precise(self, query: str, max_tokens: int) -> bool:
+        """
+        Whether the query is a short keyword or name lookup that BM25 answers alone.
+
+        True when it has no stopwords (it is not a sentence), at most
+        max_tokens tokens, and every token occurs in the knowledge base.
+        """
+        raw_tokens = [t for t in TOKEN_PATTERN.findall(query.lower()) if len(t) > 1]
+        if not raw_tokens or len(raw_tokens) > max_tokens:
+            return False
+        return all(t not in STOPWORDS and t in self.term_ids for t in raw_tokens)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term, count in Counter(tokenize(query)).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            scores[doc_ids] += count * self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._length_norm[doc_ids])
+        return scores
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documents by BM25.
+
+        Returns:
+            Tuple of (scores, indices) sorted by descending score; only
+            documents containing at least one query term are returned
+        """
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return scores[order], order
+
+    def save(self, directory: str) -> None:
+        # Replaced files leave indexes that still memory-map the old postings intact
+        write_atomic(
+            os.path.join(directory, VOCABULARY_FILE),
+            lambda f: f.write(json.dumps(self.vocabulary, ensure_ascii=False).encode("utf-8"))
+        )
+        for name, array in ((INDPTR_FILE, self.indptr), (DOC_IDS_FILE, self.doc_ids),
+                            (TERM_FREQS_FILE, self.term_freqs),
+                            (DOC_LENGTHS_FILE, self.doc_lengths.astype(np.int32))):
+            write_atomic(os.path.join(directory, name), lambda f, array=array: np.save(f, array))
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        """Load a saved index; postings are memory-mapped."""
+        with open(os.path.join(directory, VOCABULARY_FILE), "r", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        return cls(
+            vocabulary,
+            np.load(os.path.join(directory, INDPTR_FILE)),
+            np.load(os.path.join(directory, DOC_IDS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, TERM_FREQS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, DOC_LENGTHS_FILE)),
+        )
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int,
+                           weights: Sequence[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse ranked document lists by reciprocal rank.
+
+    Args:
+        rankings: Document indices per ranker, best first
+        k: Number of fused documents to return
+        rrf_k: Rank offset; larger values flatten the rank weighting
+        weights: Per-ranker weights (all 1 when omitted)
+
+    Returns:
+        Tuple of (scores, indices) sorted by descending fused score, scores
+        scaled to (0, 1] where 1 means ranked first by every ranker
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, idx in enumerate(ranking):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + weight / (rrf_k + rank + 1)
+
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    max_score = sum(weight / (rrf_k + 1) for weight in weights)
+    scores = np.array([score / max_score for _, score in best], dtype=np.float32)
+    indices = np.array([idx for idx, _ in best], dtype=np.int64)
+    return scores, indices
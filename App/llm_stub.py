@@ -0,0 +1,176 @@
+"""Local stand-in for the google-genai chat client, for tests and benchmarks."""
+
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+
+class FakeResponse:
+    """Mimics GenerateContentResponse: only the .text attribute is used."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakePart:
+    """Mimics a text Part."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeContent:
+    """Mimics a history Content entry."""
+
+    def __init__(self, role: str, text: str = "", parts: Optional[List[FakePart]] = None):
+        self.role = role
+        self.parts = parts if parts is not None else [FakePart(text)]
+
+
+class FakeGenerateContentConfig:
+    """Mimics GenerateContentConfig: only the system instruction is used."""
+
+    def __init__(self, system_instruction: Optional[str] = None):
+        self.system_instruction = system_instruction
+
+
+class FakeTypes:
+    """Mimics google.genai.types for the classes the agents construct."""
+
+    Content = FakeContent
+    Part = FakePart
+    GenerateContentConfig = FakeGenerateContentConfig
+
+
+class FakeChat:
+    """Chat session that answers from a canned reply function, optionally chunked."""
+
+    def __init__(self, reply: Callable[[str], str], chunk_size: int = 16,
+                 chunk_delay: float = 0.0, history: Optional[list] = None,
+                 config: Optional[FakeGenerateContentConfig] = None):
+        """
+        Args:
+            reply: Maps the sent message to the full response text
+            chunk_size: Characters per streamed chunk
+            chunk_delay: Seconds to sleep before each chunk (simulates latency)
+            history: Initial history entries
+            config: Config the chat was created with
+        """
+        self.reply = reply
+        self.config = config
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.history = list(history or [])
+        self.sent_messages: List[str] = []
+
+    def send_message(self, message: str, config=None) -> FakeResponse:
+        return FakeResponse("".join(chunk.text for chunk in self.send_message_stream(message)))
+
+    def send_message_stream(self, message: str, config=None) -> Iterator[FakeResponse]:
+        self.sent_messages.append(message)
+        text = self.reply(message)
+        for start in range(0, len(text), self.chunk_size):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield FakeResponse(text[start:start + self.chunk_size])
+        self.history.append(FakeContent("user", message))
+        self.history.append(FakeContent("model", text))
+
+    def get_history(self, curated: bool = False) -> list:
+        return list(self.history)
+
+
+class FakeChats:
+    """Mimics client.chats."""
+
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+
+    def create(self, model: str, config=None, history: Optional[list] = None) -> FakeChat:
+        chat = FakeChat(self._client.reply, self._client.chunk_size,
+                        self._client.chunk_delay, history, config)
+        self._client.created_chats.append(chat)
+        return chat
+
+
+class FakeAsyncChat:
+    """Mimics the chat returned by client.aio.chats.create."""
+
+    def __init__(self, chat: FakeChat):
+        self._chat = chat
+
+    @property
+    def sent_messages(self) -> List[str]:
+        return self._chat.sent_messages
+
+    async def send_message(self, message: str, config=None) -> FakeResponse:
+        chunks = [chunk.text async for chunk in await self.send_message_stream(message)]
+        return FakeResponse("".join(chunks))
+
+    async def send_message_stream(self, message: str, config=None) -> AsyncIterator[FakeResponse]:
+        chat = self._chat
+        chat.sent_messages.append(message)
+        text = chat.reply(message)
+
+        async def chunks():
+            for start in range(0, len(text), chat.chunk_size):
+                # Yield to the event loop like a real network read would
+                await asyncio.sleep(chat.chunk_delay)
+                yield FakeResponse(text[start:start + chat.chunk_size])
+            chat.history.append(FakeContent("user", message))
+            chat.history.append(FakeContent("model", text))
+
+        return chunks()
+
+    def get_history(self, curated: bool = False) -> list:
+        return self._chat.get_history(curated)
+
+
+class FakeAsyncChats:
+    """Mimics client.aio.chats."""
+
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+
+    def create(self, model: str, config=None, history: Optional[list] = None) -> FakeAsyncChat:
+        return FakeAsyncChat(self._client.chats.create(model, config, history))
+
+
+class FakeAio:
+    """Mimics client.aio."""
+
+    def __init__(self, client: "FakeClient"):
+        self.chats = FakeAsyncChats(client)
+
+
+class FakeClient:
+    """
+    Drop-in for genai.Client; pass it to MushroomRAGAgent(client=..., genai_types=FakeTypes)
+    or AsyncMushroomRAGAgent, so nothing here needs the google-genai SDK.
+    """
+
+    def __init__(self, reply: Optional[Callable[[str], str]] = None,
+                 chunk_size: int = 16, chunk_delay: float = 0.0):
+        """
+        Args:
+            reply: Maps the sent message to the response text; defaults to a
+                short canned identification card with one example image
+            chunk_size: Characters per streamed chunk
+            chunk_delay: Seconds to sleep before each chunk
+        """
+        self.reply = reply or default_reply
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.created_chats: List[FakeChat] = []
+        self.chats = FakeChats(self)
+        self.aio = FakeAio(self)
+
+
+def default_reply(message: str) -> str:
+    return (
+        "Name: Fly Agaric (Amanita muscaria)\n"
+        "Safety Status:\n💀 DEADLY POISONOUS\n"
+        "Image of primary prediction:\n"
+        '<img src="example_images/Amanita muscaria/16medium.jpg"/>\n'
+        f"(prompt was {len(message)} characters)"
+    )
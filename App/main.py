@@ -2,17 +2,14 @@
 
 import streamlit as st
 from PIL import Image
-import numpy as np
-import re
+import importlib
 
-from config import (
-    API_KEY, KNOWLEDGE_BASE_FILES, EMBEDDINGS_PATH,
-    GEMINI_MODEL_NAME, EMBEDDING_MODEL_NAME, TEMP_IMAGE_PATH
-)
+from chat_render import IMAGE, IMAGE_TAG_PATTERN, default_thumbnail_cache, make_message
+from config import API_KEY, CHAT_IMAGE_WIDTH, GEMINI_MODEL_NAME, LAZY_STARTUP
 from styles import CUSTOM_CSS
-from knowledge_base import prepare_knowledge_base
-from predictor import MushroomPredictor
+from kb_artifact import load_or_build_artifact
 from RAG_Agent import MushroomRAGAgent
+from startup import Warmup, create_batcher, create_retrieval_service
 
 # Page configuration
 st.set_page_config(
@@ -26,22 +23,71 @@ st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 
 @st.cache_resource
-def load_predictor():
-    """Load the CNN predictor model."""
-    return MushroomPredictor()
-
-
-@st.cache_resource
-def load_knowledge_base():
-    """Load knowledge base and embeddings."""
-    kb = prepare_knowledge_base(KNOWLEDGE_BASE_FILES)
-    emb = np.load(EMBEDDINGS_PATH)
-    return kb, emb
+def start_warmup():
+    """Load heavy models in background threads so the page renders immediately."""
+    warmup = Warmup()
+    warmup.add_phase("knowledge_base", load_or_build_artifact)
+    warmup.add_phase("retrieval", create_retrieval_service, after=["knowledge_base"])
+    warmup.add_phase("predictor", create_batcher)
+    warmup.add_phase("llm_client", lambda: importlib.import_module("google.genai"))
+    return warmup.start() if LAZY_STARTUP else warmup.run()
 
 
 # Initialize resources
-predictor = load_predictor()
-knowledge_base, embeddings = load_knowledge_base()
+warmup = start_warmup()
+
+thumbnails = default_thumbnail_cache()
+
+
+def show_image(img_path):
+    """Show a catalogue image from its cached thumbnail."""
+    try:
+        st.image(thumbnails.thumbnail(img_path), width=CHAT_IMAGE_WIDTH)
+    except Exception:
+        st.error(f"Image not found: {img_path}")
+
+
+def render_segments(segments, role_class):
+    """Render a message parsed by chat_render.make_message."""
+    for kind, value in segments:
+        if kind == IMAGE:
+            show_image(value)
+        else:
+            st.markdown(f'<div class="{role_class}">{value}</div>', unsafe_allow_html=True)
+
+
+def render_stream(chunks, role_class="assistant-bubble"):
+    """Render streamed text incrementally; images appear once their tag is complete."""
+    full_text = ""
+    pending = ""
+    placeholder = st.empty()
+    for chunk in chunks:
+        full_text += chunk
+        pending += chunk
+
+        # Flush every completed <img> tag: text before it becomes final
+        while match := IMAGE_TAG_PATTERN.search(pending):
+            text_before = pending[:match.start()].strip()
+            if text_before:
+                placeholder.markdown(f'<div class="{role_class}">{text_before}</div>', unsafe_allow_html=True)
+            else:
+                placeholder.empty()
+            show_image(match.group(1))
+            pending = pending[match.end():]
+            placeholder = st.empty()
+
+        # Hold back a tag that is still being streamed
+        visible = pending
+        tag_start = pending.rfind("<")
+        if tag_start != -1 and ">" not in pending[tag_start:]:
+            visible = pending[:tag_start]
+        if visible.strip():
+            placeholder.markdown(f'<div class="{role_class}">{visible.strip()}</div>', unsafe_allow_html=True)
+
+    # The stream is over, so a held-back "<" was plain text after all
+    if pending.strip():
+        placeholder.markdown(f'<div class="{role_class}">{pending.strip()}</div>', unsafe_allow_html=True)
+    return full_text
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -50,6 +96,10 @@ if "agent" not in st.session_state:
     st.session_state["agent"] = None
 if "active_file" not in st.session_state:
     st.session_state["active_file"] = None
+if "image" not in st.session_state:
+    st.session_state["image"] = None
+if "pending_predictions" not in st.session_state:
+    st.session_state["pending_predictions"] = None
 
 # Create UI layout
 upload_ui, chat_ui = st.columns([1, 2])
@@ -65,47 +115,66 @@ with upload_ui:
         type=["png", "jpg", "jpeg"]
     )
 
+    # Startup readiness and timing report
+    if not warmup.is_ready():
+        st.caption("⏳ Loading models in the background...")
+    with st.expander("Startup status"):
+        for phase, info in warmup.report().items():
+            seconds = f"{info['seconds']:.2f}s" if info["seconds"] is not None else "..."
+            st.text(f"{phase}: {info['status']} ({seconds})")
+
     if file is not None:
         # Check if new file uploaded
         if st.session_state["active_file"] != file.name:
             st.session_state["active_file"] = file.name
             st.session_state["messages"] = []
 
-            # Initialize RAG agent
-            st.session_state["agent"] = MushroomRAGAgent(
-                api_key=API_KEY,
-                knowledge_base=knowledge_base,
-                model_name=GEMINI_MODEL_NAME,
-                embedding_model=EMBEDDING_MODEL_NAME,
-                embeddings=embeddings
-            )
-
-            # Save temporary image
-            with open(TEMP_IMAGE_PATH, "wb") as f:
-                f.write(file.getbuffer())
-
-            # Get predictions
-            predictions = predictor.predict(TEMP_IMAGE_PATH, top_k=3)
-
-            # Generate initial identification
-            with st.spinner("Analyzing your mushroom..."):
-                initial_info = st.session_state["agent"].initialize_from_predictions(
-                    predictions
+            # Decode the upload once; reused for display and inference
+            st.session_state["image"] = Image.open(file).convert("RGB")
+
+            # Wait for the models if the background warm-up is still running
+            try:
+                with st.spinner("Loading models..."):
+                    batcher = warmup.result("predictor")
+                    retriever = warmup.result("retrieval")
+            except RuntimeError:
+                # Reported with a retry button below; the upload is processed again afterwards
+                st.session_state["active_file"] = None
+                st.session_state["agent"] = None
+            else:
+                # Initialize RAG agent
+                st.session_state["agent"] = MushroomRAGAgent(
+                    api_key=API_KEY,
+                    model_name=GEMINI_MODEL_NAME,
+                    retriever=retriever
                 )
-                st.session_state["messages"].append({
-                    "role": "assistant",
-                    "content": initial_info
-                })
-            st.rerun()
+
+                # Get predictions straight from the decoded image; the
+                # identification card is streamed in the chat section below
+                with st.spinner("Analyzing your mushroom..."):
+                    st.session_state["pending_predictions"] = batcher.predict(
+                        st.session_state["image"], top_k=3
+                    )
 
         # Display image
-        st.image(Image.open(file), width='stretch')
+        st.image(st.session_state["image"], width='stretch')
     else:
         # Reset state when no file
         st.session_state["active_file"] = None
+        st.session_state["image"] = None
+        st.session_state["pending_predictions"] = None
         st.session_state["agent"] = None
         st.session_state["messages"] = []
 
+    # start_warmup() is cached for the process, so failed phases are restarted in place
+    # (checked after the upload, which may have waited for a phase that failed)
+    failed = {phase: info["error"] for phase, info in warmup.report().items() if info["status"] == "failed"}
+    if failed:
+        st.error("Loading failed: " + "; ".join(f"{phase} ({error})" for phase, error in failed.items()))
+        if st.button("Retry loading"):
+            warmup.retry()
+            st.rerun()
+
 # Chat section
 with chat_ui:
     st.markdown(
@@ -117,46 +186,34 @@ with chat_ui:
     if st.session_state["agent"]:
         # Display messages
         with chat_container:
+            # Segments were parsed when each message was appended
             for msg in st.session_state["messages"]:
-                role_class = "user-bubble" if msg["role"] == "user" else "assistant-bubble"
                 if msg["role"] == "user":
                     c1, c2 = st.columns([1, 4])
                     with c2:
-                        st.markdown(f'<div class="{role_class}">{msg["content"]}</div>', unsafe_allow_html=True)
+                        render_segments(msg["segments"], "user-bubble")
                 else:
                     c1, c2 = st.columns([4, 1])
                     with c1:
-                        content = msg["content"]
-                        role_class = "assistant-bubble"
-                        matches = list(re.finditer(r'<img src="([^"]+)"/>', content))
-
-                        if not matches:
-                            st.markdown(f'<div class="{role_class}">{content}</div>', unsafe_allow_html=True)
-                        else:
-                            last_pos = 0
-                            for match in matches:
-                                text_before = content[last_pos:match.start()].strip()
-                                if text_before:
-                                    st.markdown(f'<div class="{role_class}">{text_before}</div>', unsafe_allow_html=True)
-                                img_path = match.group(1)
-                                try:
-                                    st.image(img_path, width = 250)
-                                except Exception:
-                                    st.error(f"Image not found: {img_path}")
-                                
-                                last_pos = match.end()
-                            text_after = content[last_pos:].strip()
-                            if text_after:
-                                st.markdown(f'<div class="{role_class}">{text_after}</div>', unsafe_allow_html=True)
-                        
-                                
+                        render_segments(msg["segments"], "assistant-bubble")
+
+        # Stream the initial identification for a new upload
+        if st.session_state["pending_predictions"] is not None:
+            with chat_container:
+                c1, c2 = st.columns([4, 1])
+                with c1:
+                    initial_info = render_stream(
+                        st.session_state["agent"].initialize_from_predictions_stream(
+                            st.session_state["pending_predictions"]
+                        )
+                    )
+            st.session_state["pending_predictions"] = None
+            st.session_state["messages"].append(make_message("assistant", initial_info))
+            st.rerun()
 
         # Chat input
         if prompt := st.chat_input("Ask a follow-up question..."):
-            st.session_state["messages"].append({
-                "role": "user",
-                "content": prompt
-            })
+            st.session_state["messages"].append(make_message("user", prompt))
             st.rerun()
 
         # Process last user message
@@ -165,13 +222,11 @@ with chat_ui:
             with chat_container:
                 c1, c2 = st.columns([4, 1])
                 with c1:
-                    with st.spinner("Searching for information..."):
-                        last_prompt = st.session_state["messages"][-1]["content"]
-                        response = st.session_state["agent"].send_message(last_prompt)
-                        st.session_state["messages"].append({
-                            "role": "assistant",
-                            "content": response
-                        })
-                        st.rerun()
+                    last_prompt = st.session_state["messages"][-1]["content"]
+                    response = render_stream(
+                        st.session_state["agent"].send_message_stream(last_prompt)
+                    )
+                    st.session_state["messages"].append(make_message("assistant", response))
+                    st.rerun()
     else:
         st.info("🌲 Please upload a mushroom photo to start the analysis.")
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Stage timing spans and counters, exported as Prometheus text or to a tracing hook."""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+TOKEN_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class SpanRecord:
+    """A finished timing span, in the shape OpenTelemetry exporters expect."""
+
+    name: str
+    start_time_ns: int
+    end_time_ns: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (bucket counts, sum, count)
+        self._series: Dict[LabelKey, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Count, sum and mean of one label set."""
+        with self._lock:
+            _, total, count = self._series.get(_label_key(labels), [None, 0.0, 0])
+        return {"count": count, "sum": total, "mean": total / count if count else 0.0}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    bucket_key = key + (("le", _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_key)} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named counters and histograms plus stage spans feeding a latency histogram."""
+
+    def __init__(self, namespace: str = "mushroom"):
+        """
+        Args:
+            namespace: Prefix of every metric name
+        """
+        self.namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        self._exporters: List[Callable[[SpanRecord], None]] = []
+        self._current_span = contextvars.ContextVar(f"{namespace}_span", default=None)
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram("stage_duration_seconds", "Wall-clock time per pipeline stage")
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        """Get or create a counter (the namespace and "_total" are added)."""
+        return self._get_or_create(f"{self.namespace}_{name}_total", lambda full: Counter(full, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """Get or create a histogram (the namespace is added)."""
+        return self._get_or_create(f"{self.namespace}_{name}", lambda full: Histogram(full, help_text, buckets))
+
+    def add_exporter(self, exporter: Callable[[SpanRecord], None]) -> None:
+        """Call exporter with every finished span (e.g. opentelemetry_exporter(tracer))."""
+        with self._lock:
+            self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter: Callable[[SpanRecord], None]) -> None:
+        with self._lock:
+            self._exporters.remove(exporter)
+
+    @contextmanager
+    def span(self, stage: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """
+        Time a pipeline stage.
+
+        Args:
+            stage: Stage name, used as the "stage" label
+            **attributes: Span attributes for exporters
+
+        Yields:
+            The attribute dict, so the block can add attributes (e.g. sizes)
+        """
+        parent = self._current_span.get()
+        token = self._current_span.set(stage)
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._current_span.reset(token)
+            self.record_stage(stage, time.perf_counter() - start, start_ns, parent, error, **attributes)
+
+    def record_stage(self, stage: str, seconds: float, start_time_ns: Optional[int] = None,
+                     parent: Optional[str] = None, error: Optional[str] = None, **attributes) -> None:
+        """Record a stage timed by the caller (e.g. across the chunks of a stream)."""
+        self.stage_seconds.observe(seconds, stage=stage)
+        if not self._exporters:
+            return
+        if start_time_ns is None:
+            start_time_ns = time.time_ns() - int(seconds * 1e9)
+        record = SpanRecord(stage, start_time_ns, start_time_ns + int(seconds * 1e9), attributes, parent, error)
+        for exporter in list(self._exporters):
+            try:
+                exporter(record)
+            except Exception as e:
+                print(f"Metrics exporter failed ({e}).")
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, full_name: str, factory: Callable[[str], Any]) -> Any:
+        with self._lock:
+            if full_name not in self._metrics:
+                self._metrics[full_name] = factory(full_name)
+            return self._metrics[full_name]
+
+
+def opentelemetry_exporter(tracer) -> Callable[[SpanRecord], None]:
+    """
+    Replay finished spans on an OpenTelemetry tracer.
+
+    Args:
+        tracer: opentelemetry.trace.Tracer (the package stays optional)
+
+    Returns:
+        Exporter for MetricsRegistry.add_exporter
+    """
+    def export(record: SpanRecord) -> None:
+        span = tracer.start_span(record.name, start_time=record.start_time_ns, attributes={
+            key: value for key, value in record.attributes.items()
+            if isinstance(value, (str, bool, int, float))
+        })
+        if record.error:
+            span.set_attribute("error.type", record.error)
+        span.end(end_time=record.end_time_ns)
+
+    return export
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# Process-wide registry shared by the app, the service and the benchmarks
+REGISTRY = MetricsRegistry()
+span = REGISTRY.span
+record_stage = REGISTRY.record_stage
+
+CNN_BATCH_SIZE = REGISTRY.histogram("cnn_batch_size", "Images per CNN forward pass", SIZE_BUCKETS)
+IMAGES_PREDICTED = REGISTRY.counter("images_predicted", "Images classified by the CNN")
+QUERY_CACHE_LOOKUPS = REGISTRY.counter("query_cache_lookups", "Query embedding cache lookups by result")
+RESPONSE_CACHE_LOOKUPS = REGISTRY.counter("response_cache_lookups", "Identification card cache lookups by result")
+DOCUMENTS_RETRIEVED = REGISTRY.counter("documents_retrieved", "Documents returned by retrieval, by source")
+PROMPT_CHARS = REGISTRY.counter("prompt_chars", "Characters sent to the LLM, by prompt kind")
+PROMPT_TOKENS = REGISTRY.histogram("prompt_tokens", "Estimated tokens per prompt", TOKEN_BUCKETS)
+HISTORY_TOKENS = REGISTRY.histogram("history_tokens", "Estimated chat history tokens per turn", TOKEN_BUCKETS)
+LLM_ERRORS = REGISTRY.counter("llm_errors", "Failed LLM calls")
+PAGES_FETCHED = REGISTRY.counter("pages_fetched", "Knowledge base pages fetched during ingestion, by result")
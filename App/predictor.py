@@ -1,45 +1,146 @@
 """CNN model predictor for mushroom species identification."""
 
+import io
+import os
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from typing import BinaryIO, Dict, List, Optional, Sequence, Union
 
-from config import CNN_MODEL_PATH, IMAGE_SIZE, MUSHROOM_SPECIES
+from cnn_backends import create_backend
+from metrics import CNN_BATCH_SIZE, IMAGES_PREDICTED, span
+from config import (
+    CNN_BACKEND, IMAGE_SIZE, MUSHROOM_SPECIES,
+    PREDICT_BATCH_SIZE, DECODE_WORKERS
+)
+
+# Anything predict/predict_batch accepts: a path, encoded bytes, a binary
+# file-like object, a decoded array (H, W, 3) or a PIL image. Nothing is
+# written to disk; in-memory sources are decoded straight from the buffer.
+ImageSource = Union[str, os.PathLike, bytes, BinaryIO, np.ndarray, Image.Image]
+
+
+def load_image_array(source: ImageSource, target_size=IMAGE_SIZE) -> np.ndarray:
+    """
+    Decode and resize an image into the float32 array the CNN expects.
+
+    Matches keras.preprocessing.image.load_img (RGB, nearest-neighbour resize)
+    followed by img_to_array.
+
+    Args:
+        source: Image path, bytes, file-like object, array or PIL image
+        target_size: (height, width) of the model input
+
+    Returns:
+        Array of shape (height, width, 3)
+    """
+    if isinstance(source, np.ndarray):
+        if source.shape == (*target_size, 3):
+            return source.astype(np.float32)
+        # Other sizes, grayscale (H, W) and RGBA (H, W, 4) go through PIL like a file would
+        img = Image.fromarray(np.clip(source, 0, 255).astype(np.uint8))
+    elif isinstance(source, Image.Image):
+        img = source
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(source))
+    else:
+        # Uploaded buffers may already have been read (e.g. for display)
+        if hasattr(source, "seek"):
+            source.seek(0)
+        img = Image.open(source)
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    height, width = target_size
+    if img.size != (width, height):
+        img = img.resize((width, height), Image.NEAREST)
+    return np.asarray(img, dtype=np.float32)
 
 
 class MushroomPredictor:
     """Handles CNN-based mushroom species prediction."""
 
-    def __init__(self, model_path: str = CNN_MODEL_PATH):
+    def __init__(self, model_path: Optional[str] = None, decode_workers: int = DECODE_WORKERS,
+                 backend: str = CNN_BACKEND):
         """
         Initialize the predictor with a trained CNN model.
 
         Args:
-            model_path: Path to the trained Keras model
+            model_path: Path to the trained model; defaults to the backend's
+                configured model file
+            decode_workers: Threads used to decode and resize images in parallel
+            backend: Inference backend, "keras" or "tflite"
         """
-        self.model = load_model(model_path)
+        self.backend = create_backend(backend, model_path)
         self.species = MUSHROOM_SPECIES
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers)
 
-    def predict(self, img_path: str, top_k: int = 3) -> Dict[str, float]:
+    def predict(self, img_path: ImageSource, top_k: int = 3) -> Dict[str, float]:
         """
         Predict mushroom species from an image.
 
         Args:
-            img_path: Path to the image file
+            img_path: Path to the image file (or any other ImageSource)
             top_k: Number of top predictions to return
 
         Returns:
             Dictionary mapping species names to confidence scores
         """
-        # Load and preprocess image
-        img = image.load_img(img_path, target_size=IMAGE_SIZE)
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
+        return self.predict_batch([img_path], top_k=top_k)[0]
+
+    def predict_batch(self, images: Sequence[ImageSource], top_k: int = 3) -> List[Dict[str, float]]:
+        """
+        Predict mushroom species for many images with batched forward passes.
+
+        Args:
+            images: Image paths, bytes, file-like objects, arrays or PIL images
+            top_k: Number of top predictions to return per image
+
+        Returns:
+            One dictionary per image mapping species names to confidence scores
+        """
+        probabilities = self.predict_proba(images)
+        return [self.top_k_predictions(row, top_k) for row in probabilities]
+
+    def predict_proba(self, images: Sequence[ImageSource]) -> np.ndarray:
+        """
+        Decode images in parallel and return the raw class probabilities.
+
+        Args:
+            images: Image paths, bytes, file-like objects, arrays or PIL images
+
+        Returns:
+            Array of shape (n_images, n_species)
+        """
+        if len(images) == 0:
+            return np.empty((0, len(self.species)), dtype=np.float32)
+
+        # Decode and resize in parallel, then stack into one tensor
+        with span("image_decode", images=len(images)):
+            arrays = list(self._decode_pool.map(load_image_array, images))
+            batch = np.stack(arrays)
+
+        outputs = []
+        for start in range(0, len(batch), PREDICT_BATCH_SIZE):
+            chunk = batch[start:start + PREDICT_BATCH_SIZE]
+            with span("cnn_forward", batch_size=len(chunk)):
+                outputs.append(self.backend.predict(chunk))
+            CNN_BATCH_SIZE.observe(len(chunk))
+        IMAGES_PREDICTED.inc(len(batch))
+        return np.concatenate(outputs).reshape(len(batch), -1)
 
-        # Get predictions
-        predictions = self.model.predict(img_array)
-        predictions_flat = predictions.ravel()
+    def top_k_predictions(self, probabilities: np.ndarray, top_k: int = 3) -> Dict[str, float]:
+        """
+        Select the top-k species from one row of class probabilities.
+
+        Args:
+            probabilities: Class probabilities for a single image
+            top_k: Number of top predictions to return
+
+        Returns:
+            Dictionary mapping species names to confidence scores, highest first
+        """
+        predictions_flat = np.ravel(probabilities)
 
         # Get top k predictions
         indexes = np.argpartition(predictions_flat, -top_k)[-top_k:]
@@ -50,4 +151,4 @@ class MushroomPredictor:
         indexes, values = indexes[sorted_idx], values[sorted_idx]
         species_names = [self.species[i] for i in indexes]
 
-        return dict(zip(species_names, values))
\ No newline at end of file
+        return dict(zip(species_names, values))
@@ -0,0 +1,141 @@
+"""Persistent TTL/LRU cache of identification cards keyed by prediction set."""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from config import (
+    CONFIDENCE_THRESHOLD, RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES
+)
+
+PLACEHOLDER = "{{CONFIDENCE_%d}}"
+PLACEHOLDER_PATTERN = re.compile(r"\{\{CONFIDENCE_(\d+)\}\}")
+PERCENTAGE_PATTERN = re.compile(r"\d+(?:[.,]\d+)?\s?%")
+
+
+def confidence_bucket(primary_confidence: float) -> str:
+    """The identification prompt only changes at the expert-verification threshold."""
+    return "low" if primary_confidence < CONFIDENCE_THRESHOLD else "high"
+
+
+def mask_confidences(text: str, confidences: Sequence[float]) -> str:
+    """Replace each formatted confidence (e.g. "87.00%") with a numbered placeholder."""
+    for i, confidence in enumerate(confidences):
+        formatted = re.escape(f"{confidence:.2%}")
+        text = re.sub(rf"(?<![\d.]){formatted}", PLACEHOLDER % i, text)
+    return text
+
+
+def has_unmasked_percentages(template: str) -> bool:
+    """True if a percentage survived masking (e.g. the model rounded "87.00%" to "87%")."""
+    return PERCENTAGE_PATTERN.search(template) is not None
+
+
+def fill_confidences(template: str, confidences: Sequence[float]) -> str:
+    """Inverse of mask_confidences for a new set of confidence values."""
+    return PLACEHOLDER_PATTERN.sub(lambda m: f"{confidences[int(m.group(1))]:.2%}", template)
+
+
+def identification_key(model_name: str, prompt_template: str,
+                       predictions: List[Tuple[str, float]]) -> str:
+    """
+    Cache key for an identification card.
+
+    Args:
+        model_name: LLM model name
+        prompt_template: System instructions plus the identification prompt with
+            confidences masked (covers the template and the retrieved documents)
+        predictions: Predictions sorted by confidence
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    template_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    species = [species for species, _ in predictions]
+    bucket = confidence_bucket(predictions[0][1])
+    payload = json.dumps([model_name, template_hash, species, bucket])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed cache with a time-to-live and least-recently-used eviction."""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a non-persistent cache)
+            ttl_seconds: Entries older than this are treated as missing
+            max_entries: Least recently used entries beyond this are evicted
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value if present and not expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store a value and evict expired and least recently used entries."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_response_cache() -> ResponseCache:
+    """Process-wide cache at config.RESPONSE_CACHE_PATH."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,336 @@
+"""Vectorized similarity search over the knowledge base embeddings, fused with BM25."""
+
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    QUERY_CACHE_SIZE, QUERY_CACHE_PATH,
+    RETRIEVAL_FUSION, RRF_K, FUSION_CANDIDATES, LEXICAL_FAST_PATH_MAX_TOKENS
+)
+from embedding_cache import QueryEmbeddingCache
+from knowledge_base import normalize_species_name
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from metrics import DOCUMENTS_RETRIEVED, QUERY_CACHE_LOOKUPS, span
+
+
+class RetrievalEngine:
+    """Cosine-similarity search over a pre-normalized embedding matrix, exact or via an ANN index."""
+
+    def __init__(self, embeddings: np.ndarray, normalized: bool = False, ann_index=None):
+        """
+        Initialize the engine and L2-normalize the document matrix once.
+
+        Args:
+            embeddings: Document embeddings of shape (n_documents, dim)
+            normalized: Rows are already unit length; a float32 (memory-mapped)
+                matrix is then used without copying. Other dtypes (a float16
+                artifact) are converted into a float32 copy, since numpy has
+                no fast float16 matrix product
+            ann_index: Optional ann_index.IVFIndex / HNSWIndex built from the
+                same embeddings; search() then uses it instead of a full scan
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError(f"Expected a 2D embedding matrix, got shape {matrix.shape}")
+        self.doc_matrix = matrix if normalized else _normalize_rows(matrix)
+        self.ann_index = ann_index
+
+    def __len__(self) -> int:
+        return self.doc_matrix.shape[0]
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Compute cosine similarity of every query against every document.
+
+        Args:
+            queries: Query embeddings of shape (dim,) or (n_queries, dim)
+
+        Returns:
+            Similarity matrix of shape (n_queries, n_documents)
+        """
+        query_matrix = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        return query_matrix @ self.doc_matrix.T
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k most similar documents for each query in a single GEMM.
+
+        Args:
+            queries: Query embeddings of shape (dim,) or (n_queries, dim)
+            k: Number of documents to return per query
+
+        Returns:
+            Tuple of (scores, indices), both of shape (n_queries, k) and
+            sorted by descending similarity
+        """
+        if self.ann_index is not None:
+            query_matrix = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+            return self.ann_index.search(query_matrix, k)
+
+        similarities = self.scores(queries)
+        k = min(k, similarities.shape[1])
+        if k <= 0:
+            empty = np.empty((similarities.shape[0], 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+
+        # Partial sort: select the top-k, then order only those k
+        if k < similarities.shape[1]:
+            top = np.argpartition(similarities, -k, axis=1)[:, -k:]
+        else:
+            top = np.tile(np.arange(k), (similarities.shape[0], 1))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+
+        indices = np.take_along_axis(top, order, axis=1)
+        scores = np.take_along_axis(top_scores, order, axis=1)
+        return scores, indices
+
+
+class RetrievalService:
+    """Process-wide retrieval over the knowledge base, shared by all chat sessions."""
+
+    def __init__(self, knowledge_base: Sequence[str], embedding_model: str,
+                 embeddings: Optional[np.ndarray] = None,
+                 name_index: Optional[Dict[str, List[int]]] = None,
+                 normalized: bool = False,
+                 query_cache: Optional[QueryEmbeddingCache] = None,
+                 ann_index=None,
+                 lexical_index: Optional[LexicalIndex] = None,
+                 fusion: str = RETRIEVAL_FUSION):
+        """
+        Load the embedding model and prepare the document matrix.
+
+        Args:
+            knowledge_base: Documents, aligned with the embedding rows
+            embedding_model: SentenceTransformer model name
+            embeddings: Precomputed document embeddings; encoded when omitted
+            name_index: Normalized species name -> document indices
+            normalized: Embedding rows are already unit length
+            query_cache: Query embedding cache; a new one sized from config
+                is created when omitted
+            ann_index: Optional approximate index over the same embeddings
+            lexical_index: BM25 index over the same documents; built when
+                omitted unless fusion is "dense"
+            fusion: "rrf" (BM25 and embeddings, reciprocal rank fusion),
+                "dense" (embeddings only) or "lexical" (BM25 only)
+        """
+        if fusion not in ("rrf", "dense", "lexical"):
+            raise ValueError(f"Unknown retrieval fusion '{fusion}'")
+
+        # Deferred: importing sentence-transformers pulls in torch
+        from sentence_transformers import SentenceTransformer
+
+        self.knowledge_base = knowledge_base
+        self.name_index = name_index or {}
+        self.embedding_model_name = embedding_model
+        self.embedding_model = SentenceTransformer(embedding_model)
+
+        # The tokenizer is not safe to call from several threads at once
+        self._encode_lock = threading.Lock()
+
+        if query_cache is None:
+            query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_PATH)
+        self.query_cache = query_cache
+
+        if embeddings is None:
+            embeddings = self._encode_uncached(list(knowledge_base))
+        self.engine = RetrievalEngine(embeddings, normalized=normalized, ann_index=ann_index)
+
+        self.fusion = fusion
+        if lexical_index is None and fusion != "dense":
+            lexical_index = LexicalIndex.build(knowledge_base)
+        self.lexical_index = lexical_index if fusion != "dense" else None
+
+    def encode(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode a batch of queries, running the model only for cache misses.
+
+        Args:
+            queries: Query texts
+
+        Returns:
+            Embedding matrix of shape (n_queries, dim)
+        """
+        vectors = [self.query_cache.get(self.embedding_model_name, q) for q in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        QUERY_CACHE_LOOKUPS.inc(len(queries) - len(missing), result="hit")
+        QUERY_CACHE_LOOKUPS.inc(len(missing), result="miss")
+
+        if missing:
+            encoded = self._encode_uncached([queries[i] for i in missing])
+            for i, vector in zip(missing, encoded):
+                self.query_cache.put(self.embedding_model_name, queries[i], vector)
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        with self._encode_lock, span("query_encode", queries=len(texts)):
+            return np.atleast_2d(self.embedding_model.encode(texts))
+
+    def lookup_species(self, name: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Resolve a species name from the exact name index.
+
+        Args:
+            name: Species name as typed or predicted
+            top_k: Maximum number of documents to return
+
+        Returns:
+            Matching documents (similarity 1.0), empty if the name is unknown
+        """
+        indices = self.name_index.get(normalize_species_name(name), [])
+        return [self._result(idx, 1.0) for idx in indices[:top_k]]
+
+    def retrieve(self, query: str, top_k: int = 5, max_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most relevant documents for a single query.
+
+        Args:
+            query: Species name or free-text question
+            top_k: Number of documents to return
+            max_chars: Total document text budget (see within_budget)
+
+        Returns:
+            List of {"document", "similarity", "index"} dicts
+        """
+        return within_budget(self.retrieve_per_query([query], top_k)[0], max_chars)
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, max_chars: Optional[int] = None,
+                       shares: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents for several queries, merged and de-duplicated by index.
+
+        Args:
+            queries: Species names or questions, in priority order
+            top_k: Number of documents per query
+            max_chars: Total document text budget (see within_budget)
+            shares: Fraction of max_chars for each query's documents; budget a
+                query leaves unused passes to the next. None shares one budget
+                in query order
+
+        Returns:
+            Merged list in query order, keeping the best similarity per document
+        """
+        hits_per_query = self.retrieve_per_query(queries, top_k)
+        if max_chars is None:
+            max_chars, shares = float("inf"), [1.0] * len(queries)
+        elif shares is None:
+            shares = [1.0] + [0.0] * (len(queries) - 1)
+
+        merged = {}
+        used = 0
+        allowance = 0.0
+        for hits, share in zip(hits_per_query, shares):
+            allowance += share * max_chars
+            for doc_data in hits:
+                idx = doc_data["index"]
+                if idx in merged:
+                    merged[idx]["similarity"] = max(merged[idx]["similarity"], doc_data["similarity"])
+                    continue
+                # Oversized hits are skipped so shorter ones can use the rest (the first is always kept)
+                size = len(doc_data["document"])
+                if merged and used + size > allowance:
+                    continue
+                merged[idx] = doc_data
+                used += size
+        return list(merged.values())
+
+    def retrieve_per_query(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve documents for several queries with one encode call and one search.
+
+        Species names resolve from the name index and short exact-term queries
+        from BM25 alone; only the rest run the embedding model, and with "rrf"
+        fusion their dense ranking is merged with the BM25 ranking.
+
+        Args:
+            queries: Species names or questions
+            top_k: Number of documents per query
+
+        Returns:
+            One result list per query
+        """
+        # Resolve known species names from the index
+        hits_per_query = [self.lookup_species(query, top_k) for query in queries]
+        missed = [i for i, hits in enumerate(hits_per_query) if not hits]
+        DOCUMENTS_RETRIEVED.inc(sum(len(hits) for hits in hits_per_query), source="name_index")
+
+        # Lexical fast path: keyword and Latin-name queries need no transformer
+        dense = []
+        for i in missed:
+            if self.lexical_index is not None and (
+                self.fusion == "lexical" or self.lexical_index.is_precise(queries[i], LEXICAL_FAST_PATH_MAX_TOKENS)
+            ):
+                hits_per_query[i] = self._lexical_search(queries[i], top_k)
+                DOCUMENTS_RETRIEVED.inc(len(hits_per_query[i]), source="lexical")
+                if hits_per_query[i] or self.fusion == "lexical":
+                    continue
+            dense.append(i)
+
+        if dense:
+            # Encode all remaining queries in a single pass and score them together
+            query_embeddings = self.encode([queries[i] for i in dense])
+            n_candidates = top_k if self.lexical_index is None else max(top_k, FUSION_CANDIDATES)
+            with span("similarity_search", queries=len(dense), documents=len(self.engine)):
+                scores, indices = self.engine.search(query_embeddings, n_candidates)
+            for i, query_scores, query_indices in zip(dense, scores, indices):
+                query_indices = query_indices[query_scores > 0]
+                if self.lexical_index is None:
+                    hits_per_query[i] = [
+                        self._result(int(idx), float(score))
+                        for score, idx in zip(query_scores[query_scores > 0], query_indices)
+                    ]
+                    DOCUMENTS_RETRIEVED.inc(len(hits_per_query[i]), source="semantic")
+                    continue
+
+                _, lexical_indices = self.lexical_index.search(queries[i], n_candidates)
+                fused_scores, fused_indices = reciprocal_rank_fusion(
+                    [query_indices, lexical_indices], top_k, RRF_K
+                )
+                hits_per_query[i] = [
+                    self._result(int(idx), float(score)) for score, idx in zip(fused_scores, fused_indices)
+                ]
+                DOCUMENTS_RETRIEVED.inc(len(hits_per_query[i]), source="hybrid")
+        return hits_per_query
+
+    def _lexical_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        # BM25 scores scaled so the best match has similarity 1.0
+        with span("lexical_search", documents=len(self.lexical_index)):
+            scores, indices = self.lexical_index.search(query, top_k)
+        if not len(scores):
+            return []
+        return [self._result(int(idx), float(score / scores[0])) for score, idx in zip(scores, indices)]
+
+    def _result(self, idx: int, similarity: float) -> Dict[str, Any]:
+        return {
+            "document": self.knowledge_base[idx],
+            "similarity": similarity,
+            "index": idx
+        }
+
+
+def within_budget(hits: List[Dict[str, Any]], max_chars: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Keep hits in rank order while their documents fit in max_chars.
+
+    A hit that does not fit is skipped, so a shorter one further down can
+    still use the rest of the budget. The first hit is always kept.
+    """
+    if max_chars is None:
+        return hits
+    selected = []
+    used = 0
+    for hit in hits:
+        size = len(hit["document"])
+        if selected and used + size > max_chars:
+            continue
+        selected.append(hit)
+        used += size
+    return selected
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
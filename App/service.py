@@ -0,0 +1,339 @@
+"""Headless HTTP inference service: prediction, retrieval and identification without the UI."""
+
+import argparse
+import base64
+import binascii
+import json
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import UnidentifiedImageError
+
+from batching import QueueFullError
+from config import (
+    API_KEY, GEMINI_MODEL_NAME, LAZY_STARTUP, MUSHROOM_SPECIES, TOP_K_DOCUMENTS,
+    SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS, SERVICE_MAX_PENDING,
+    SERVICE_REQUEST_TIMEOUT, SERVICE_MAX_BODY_BYTES, SERVICE_MAX_BATCH,
+    SERVICE_MAX_TOP_K_DOCUMENTS
+)
+from kb_artifact import load_or_build_artifact
+from metrics import REGISTRY, span
+from RAG_Agent import MushroomRAGAgent
+from startup import Warmup, create_batcher, create_retrieval_service
+
+
+SPECIES_SET = frozenset(MUSHROOM_SPECIES)
+
+
+class ServiceError(Exception):
+    """Request failure with the HTTP status to report."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def create_llm_client():
+    """Shared Gemini client, or None to answer identifications offline."""
+    if not API_KEY:
+        print("Brak klucza API.")
+        return None
+    import google.genai as genai
+
+    return genai.Client(api_key=API_KEY)
+
+
+def create_warmup() -> Warmup:
+    """Same startup phases as the Streamlit app, with a real client instead of an import."""
+    warmup = Warmup()
+    warmup.add_phase("knowledge_base", load_or_build_artifact)
+    warmup.add_phase("retrieval", create_retrieval_service, after=["knowledge_base"])
+    warmup.add_phase("predictor", create_batcher)
+    warmup.add_phase("llm_client", create_llm_client)
+    return warmup
+
+
+class InferenceService:
+    """Runs requests on a bounded worker pool with per-request timeouts."""
+
+    def __init__(self, warmup: Warmup, workers: int = SERVICE_WORKERS,
+                 max_pending: int = SERVICE_MAX_PENDING,
+                 timeout: float = SERVICE_REQUEST_TIMEOUT):
+        """
+        Args:
+            warmup: Started (or finished) warm-up providing the models
+            workers: Requests processed concurrently
+            max_pending: Running plus queued requests before new ones get 503
+            timeout: Seconds a request may take before it gets 504
+        """
+        self.warmup = warmup
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        # One agent per worker thread, reused across requests
+        self._agents = threading.local()
+        self.routes: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "/predict": self.predict,
+            "/retrieve": self.retrieve,
+            "/identify": self.identify,
+        }
+
+    def handle(self, path: str, payload: Dict[str, Any]) -> Any:
+        """
+        Run one request on the worker pool.
+
+        Raises:
+            ServiceError: 404 for unknown paths, 503 when the pool is saturated,
+                504 when the request exceeds the timeout
+        """
+        route = self.routes.get(path)
+        if route is None:
+            raise ServiceError(404, f"Unknown endpoint {path}")
+
+        # Backpressure: reject instead of queueing without bound
+        if not self._slots.acquire(blocking=False):
+            raise ServiceError(503, "Server is busy, retry later")
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(self._timed, path, route, payload)
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # The worker finishes in the background and frees its slot then
+            raise ServiceError(504, f"Request exceeded {self.timeout:.0f}s") from None
+
+    def health(self) -> Tuple[int, Dict[str, Any]]:
+        ready = self.warmup.is_ready()
+        body = {
+            "status": "ready" if ready else "loading",
+            "phases": self.warmup.report(),
+            "pending": self._pending,
+        }
+        return (200 if ready else 503), body
+
+    def predict(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        top_k = _top_k(payload, 3, len(MUSHROOM_SPECIES))
+        if "images" in payload:
+            images = [_decode_image(image) for image in payload["images"]]
+            if not images or len(images) > SERVICE_MAX_BATCH:
+                raise ServiceError(400, f"'images' must hold 1 to {SERVICE_MAX_BATCH} images")
+            return {"predictions": self._predict_many(images, top_k)}
+        return {"predictions": self._predict_many([_decode_image(payload.get("image"))], top_k)[0]}
+
+    def retrieve(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        top_k = _top_k(payload, TOP_K_DOCUMENTS, SERVICE_MAX_TOP_K_DOCUMENTS)
+        queries = payload.get("queries", [payload.get("query")])
+        if not queries or not all(isinstance(query, str) and query for query in queries):
+            raise ServiceError(400, "Provide 'query' or 'queries' as non-empty strings")
+
+        results = self._resource("retrieval").retrieve_per_query(queries, top_k)
+        if "queries" in payload:
+            return {"results": results}
+        return {"results": results[0]}
+
+    def identify(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        predictions = payload.get("predictions")
+        if predictions is None:
+            top_k = _top_k(payload, 3, len(MUSHROOM_SPECIES))
+            predictions = self._predict_many([_decode_image(payload.get("image"))], top_k)[0]
+        else:
+            predictions = _validate_predictions(predictions)
+
+        agent = self._agent()
+        card = agent.initialize_from_predictions(predictions)
+        return {"predictions": predictions, "card": card}
+
+    def _timed(self, path: str, route: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any]) -> Any:
+        with span("request", endpoint=path):
+            return route(payload)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _predict_many(self, images: List[bytes], top_k: int) -> List[Dict[str, float]]:
+        # Submitted individually so the micro-batcher can merge them with other requests
+        batcher = self._resource("predictor")
+        try:
+            futures = [batcher.submit(image, top_k) for image in images]
+        except QueueFullError:
+            raise ServiceError(503, "Prediction queue is full, retry later") from None
+        results = [future.result(timeout=self.timeout) for future in futures]
+        return [{species: float(conf) for species, conf in result.items()} for result in results]
+
+    def _agent(self) -> MushroomRAGAgent:
+        # The service keeps no conversation state: the worker's agent starts each request afresh
+        retriever = self._resource("retrieval")
+        client = self._optional_resource("llm_client")
+        agent = getattr(self._agents, "agent", None)
+        if agent is None or agent.client is not client or agent.retriever is not retriever:
+            # Built on first use, and again once a lazily loaded client becomes ready
+            agent = MushroomRAGAgent(
+                api_key=None,
+                model_name=GEMINI_MODEL_NAME,
+                retriever=retriever,
+                client=client
+            )
+            self._agents.agent = agent
+        else:
+            agent.reset()
+        return agent
+
+    def _resource(self, phase: str) -> Any:
+        if not self.warmup.is_ready(phase):
+            report = self.warmup.report()[phase]
+            raise ServiceError(503, f"'{phase}' is {report['status']}, retry later")
+        return self.warmup.result(phase)
+
+    def _optional_resource(self, phase: str) -> Optional[Any]:
+        try:
+            return self._resource(phase)
+        except ServiceError:
+            return None
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+
+def _top_k(payload: Dict[str, Any], default: int, maximum: int) -> int:
+    top_k = payload.get("top_k", default)
+    # bool is an int subclass, but {"top_k": true} is a client bug
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= maximum:
+        raise ServiceError(400, f"'top_k' must be an integer from 1 to {maximum}")
+    return top_k
+
+
+def _validate_predictions(predictions: Any) -> Dict[str, float]:
+    # Species names become catalogue paths, so only known labels are accepted
+    if not isinstance(predictions, dict) or not predictions:
+        raise ServiceError(400, "'predictions' must map species to confidence")
+    unknown = [species for species in predictions if species not in SPECIES_SET]
+    if unknown:
+        raise ServiceError(400, f"Unknown species {unknown[:3]}")
+    for species, confidence in predictions.items():
+        if (not isinstance(confidence, (int, float)) or isinstance(confidence, bool)
+                or not math.isfinite(confidence)):
+            raise ServiceError(400, f"Confidence of '{species}' must be a finite number")
+    return {species: float(confidence) for species, confidence in predictions.items()}
+
+
+def _decode_image(data: Any) -> bytes:
+    if isinstance(data, bytes):
+        return data
+    if not isinstance(data, str) or not data:
+        raise ServiceError(400, "Provide the image as a base64 string")
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ServiceError(400, "Image is not valid base64") from None
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog large enough for load tests."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_handler(service: InferenceService):
+    """Request handler class bound to a service instance."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(*service.health())
+            elif self.path == "/metrics":
+                self._send_text(200, REGISTRY.render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+        def do_POST(self):
+            try:
+                payload = self._read_payload()
+                self._send(200, service.handle(self.path, payload))
+            except ServiceError as e:
+                self._send(e.status, {"error": str(e)})
+            except (ValueError, TypeError, UnidentifiedImageError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def _read_payload(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                # rfile.read(-1) would block until the client closes the connection
+                raise ServiceError(400, "Invalid Content-Length")
+            if length > SERVICE_MAX_BODY_BYTES:
+                raise ServiceError(413, "Request body too large")
+            body = self.rfile.read(length)
+
+            # Raw uploads: POST /predict or /identify with an image content type
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("image/"):
+                return {"image": body}
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise ServiceError(400, f"Invalid JSON ({e})") from None
+            if not isinstance(payload, dict):
+                raise ServiceError(400, "Request body must be a JSON object")
+            return payload
+
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            self._send_text(status, json.dumps(body, ensure_ascii=False), "application/json; charset=utf-8")
+
+        def _send_text(self, status: int, text: str, content_type: str) -> None:
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            if status == 503:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the headless mushroom inference service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Concurrent requests")
+    parser.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING,
+                        help="Running plus queued requests before returning 503")
+    parser.add_argument("--timeout", type=float, default=SERVICE_REQUEST_TIMEOUT,
+                        help="Seconds per request before returning 504")
+    args = parser.parse_args()
+
+    # Lazy startup serves /health (503 "loading") while the models load
+    warmup = create_warmup()
+    warmup.start() if LAZY_STARTUP else warmup.run()
+
+    service = InferenceService(warmup, args.workers, args.max_pending, args.timeout)
+    server = ServiceHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port} ({args.workers} workers).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
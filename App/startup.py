@@ -0,0 +1,163 @@
+"""Background warm-up of heavy models with per-phase timing and readiness."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ann_index import load_ann_index
+from batching import MicroBatcher
+from config import EMBEDDING_MODEL_NAME
+from predictor import MushroomPredictor
+from retrieval import RetrievalService
+
+
+def create_batcher() -> MicroBatcher:
+    """Load the CNN predictor and micro-batch concurrent requests through it."""
+    return MicroBatcher(MushroomPredictor())
+
+
+def create_retrieval_service(artifact) -> RetrievalService:
+    """Load the shared embedding model over the knowledge base artifact."""
+    return RetrievalService(
+        artifact.documents,
+        embedding_model=EMBEDDING_MODEL_NAME,
+        embeddings=artifact.embeddings,
+        name_index=artifact.name_index,
+        normalized=artifact.manifest["normalized"],
+        ann_index=load_ann_index(artifact.artifact_dir, artifact.content_hash, len(artifact.documents)),
+        lexical_index=artifact.lexical_index
+    )
+
+
+class Warmup:
+    """Runs named startup phases in background threads, honouring dependencies."""
+
+    def __init__(self):
+        self._phases: Dict[str, Callable[..., Any]] = {}
+        self._dependencies: Dict[str, List[str]] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._results: Dict[str, Any] = {}
+        self._errors: Dict[str, BaseException] = {}
+        self._timings: Dict[str, float] = {}
+        self._started_at: Optional[float] = None
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, load: Callable[..., Any], after: Optional[List[str]] = None) -> "Warmup":
+        """
+        Register a startup phase.
+
+        Args:
+            name: Phase name, used for results and the timing report
+            load: Callable producing the phase result; it receives the results
+                of the phases listed in `after` as positional arguments
+            after: Phases that must finish first
+
+        Returns:
+            self, for chaining
+        """
+        self._phases[name] = load
+        self._dependencies[name] = list(after or [])
+        self._done[name] = threading.Event()
+        return self
+
+    def start(self) -> "Warmup":
+        """Start every phase in its own daemon thread."""
+        self._started_at = time.perf_counter()
+        for name in self._phases:
+            threading.Thread(target=self._run, args=(name,), name=f"warmup-{name}", daemon=True).start()
+        return self
+
+    def run(self) -> "Warmup":
+        """Run all phases and block until they finish (eager startup)."""
+        self.start()
+        self.wait()
+        return self
+
+    def retry(self) -> List[str]:
+        """
+        Start failed phases again, including those that failed because a dependency did.
+
+        Returns:
+            Names of the restarted phases
+        """
+        with self._lock:
+            failed = [name for name in self._phases if name in self._errors]
+            # Reset every event first so restarted phases wait for their restarted dependencies
+            for name in failed:
+                del self._errors[name]
+                self._done[name] = threading.Event()
+            if failed:
+                self._started_at = time.perf_counter()
+                self._finished = False
+        for name in failed:
+            threading.Thread(target=self._run, args=(name,), name=f"warmup-{name}", daemon=True).start()
+        return failed
+
+    def is_ready(self, name: Optional[str] = None) -> bool:
+        """Whether one phase (or all phases) finished successfully."""
+        names = [name] if name else list(self._phases)
+        return all(self._done[n].is_set() and n not in self._errors for n in names)
+
+    def wait(self, name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Block until one phase (or all phases) finished; returns False on timeout."""
+        names = [name] if name else list(self._phases)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for n in names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._done[n].wait(remaining):
+                return False
+        return True
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """
+        Wait for a phase and return its result.
+
+        Raises:
+            TimeoutError: If the phase does not finish within timeout
+            RuntimeError: If the phase (or one of its dependencies) failed
+        """
+        if not self.wait(name, timeout):
+            raise TimeoutError(f"Startup phase '{name}' is still running")
+        if name in self._errors:
+            raise RuntimeError(f"Startup phase '{name}' failed: {self._errors[name]}") from self._errors[name]
+        return self._results[name]
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Per-phase status and wall-clock seconds since its dependencies were ready."""
+        with self._lock:
+            report = {}
+            for name in self._phases:
+                if name in self._errors:
+                    status = "failed"
+                elif self._done[name].is_set():
+                    status = "ready"
+                else:
+                    status = "loading"
+                report[name] = {"status": status, "seconds": self._timings.get(name)}
+                if name in self._errors:
+                    report[name]["error"] = str(self._errors[name])
+            return report
+
+    def _run(self, name: str) -> None:
+        try:
+            dependencies = [self.result(dependency) for dependency in self._dependencies[name]]
+            start = time.perf_counter()
+            result = self._phases[name](*dependencies)
+            with self._lock:
+                self._timings[name] = time.perf_counter() - start
+                self._results[name] = result
+        except BaseException as e:
+            with self._lock:
+                self._errors[name] = e
+            print(f"Startup phase '{name}' failed ({e}).")
+        finally:
+            self._done[name].set()
+
+        with self._lock:
+            if self._finished or not all(event.is_set() for event in self._done.values()):
+                return
+            self._finished = True
+            total = time.perf_counter() - self._started_at
+            timings = ", ".join(f"{n}: {t:.2f}s" for n, t in self._timings.items())
+        print(f"Startup finished in {total:.2f}s ({timings}).")
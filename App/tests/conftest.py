@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture(autouse=True)
+def app_dir(monkeypatch):
+    # config paths are relative to App/
+    monkeypatch.chdir(APP_DIR)
+
+
+@pytest.fixture
+def no_sdk(monkeypatch):
+    # The fake LLM path must not touch google-genai, installed or not
+    monkeypatch.setitem(sys.modules, "google.genai", None)
+
+
+class FakeRetriever:
+    """Returns one canned document per known species name, like the name index."""
+
+    documents = {
+        "Amanita muscaria": "Amanita muscaria\nToxicity: contains ibotenic acid and muscimol.",
+        "Amanita pantherina": "Amanita pantherina\nSimilar species: often confused with A. rubescens.",
+    }
+
+    def __init__(self):
+        self.batches = []
+
+    def retrieve(self, query, top_k=5, max_chars=None):
+        return [{"document": f"{query}\nNo notes.", "similarity": 0.5, "index": 99}]
+
+    def retrieve_per_query(self, queries, top_k=5):
+        return [self.retrieve(query, top_k) for query in queries]
+
+    def retrieve_batch(self, queries, top_k=5, max_chars=None, shares=None):
+        self.batches.append((queries, shares))
+        return [
+            {"document": self.documents[query], "similarity": 1.0, "index": i}
+            for i, query in enumerate(queries) if query in self.documents
+        ]
+
+
+@pytest.fixture
+def retriever():
+    return FakeRetriever()
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+import ann_index
+from ann_index import ANN_MANIFEST_FILE, build_ann_index, clustered_embeddings, load_ann_index, save_ann_index
+
+
+@pytest.fixture
+def saved_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_index, "ANN_MIN_DOCUMENTS", 0)
+    embeddings = clustered_embeddings(500, dim=16, n_clusters=20)
+    save_ann_index(build_ann_index(embeddings, "ivf", nlist=8), str(tmp_path), "hash")
+    return str(tmp_path), embeddings
+
+
+def test_saved_index_loads_and_leaves_no_temp_files(saved_index):
+    directory, embeddings = saved_index
+
+    index = load_ann_index(directory, "hash", len(embeddings))
+
+    assert index is not None and len(index) == len(embeddings)
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+    _, indices = index.search(embeddings[:5], 1)
+    assert np.array_equal(indices[:, 0], np.arange(5))
+
+
+def test_stale_index_falls_back_to_exact_search(saved_index):
+    directory, embeddings = saved_index
+
+    assert load_ann_index(directory, "other hash", len(embeddings)) is None
+
+
+@pytest.mark.parametrize("manifest", ["{not json", "[]", '{"kind": "ivf"}'])
+def test_damaged_manifest_falls_back_to_exact_search(saved_index, manifest):
+    directory, embeddings = saved_index
+    with open(os.path.join(directory, ANN_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        f.write(manifest)
+
+    assert load_ann_index(directory, "hash", len(embeddings)) is None
+
+
+class FakeHNSW:
+    """Checks hnswlib's requirement that ef is at least k for every query."""
+
+    def __init__(self, n_documents):
+        self.n_documents = n_documents
+        self.ef = None
+
+    def set_ef(self, ef):
+        self.ef = ef
+
+    def get_current_count(self):
+        return self.n_documents
+
+    def knn_query(self, queries, k):
+        assert self.ef >= k
+        return np.zeros((len(queries), k), dtype=np.uint64), np.zeros((len(queries), k), dtype=np.float32)
+
+
+def test_hnsw_ef_never_drops_below_a_concurrent_query_k():
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = ann_index.HNSWIndex(FakeHNSW(1000), ef=4)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda k: index.search(np.ones(4), k), [2, 50, 8, 30] * 50))
+
+    assert [labels.shape[1] for _, labels in results] == [2, 50, 8, 30] * 50
+    assert index.ef == 50
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from async_agent import AsyncMushroomRAGAgent
+from image_catalogue import ExampleImageCatalogue
+from llm_stub import FakeClient, FakeTypes
+
+pytestmark = pytest.mark.usefixtures("no_sdk")
+
+PREDICTIONS = {"Amanita muscaria": 0.8, "Amanita pantherina": 0.2}
+
+
+class FakePredictor:
+    def predict(self, image, top_k=3):
+        return dict(list(PREDICTIONS.items())[:top_k])
+
+
+class RecordingCatalogue(ExampleImageCatalogue):
+    def __init__(self):
+        super().__init__()
+        self.requested = []
+
+    def images_for(self, species):
+        self.requested.append(species)
+        return super().images_for(species)
+
+
+def test_identify_looks_up_only_the_predicted_species(retriever):
+    client = FakeClient(chunk_size=8)
+    catalogue = RecordingCatalogue()
+    agent = AsyncMushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                                  genai_types=FakeTypes, image_catalogue=catalogue, response_cache=None)
+
+    predictions, card = asyncio.run(agent.identify(b"image", FakePredictor(), top_k=2))
+
+    assert predictions == PREDICTIONS
+    assert card.startswith("Name: Fly Agaric")
+    assert set(catalogue.requested) == set(PREDICTIONS)
+    assert "PRIMARY PREDICTION: Amanita muscaria" in client.created_chats[-1].sent_messages[0]
+
+
+def test_streamed_card_and_chat_use_the_async_client(retriever):
+    client = FakeClient(chunk_size=8)
+    agent = AsyncMushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                                  genai_types=FakeTypes, response_cache=None)
+
+    async def conversation():
+        chunks = [chunk async for chunk in agent.initialize_from_predictions_stream(PREDICTIONS)]
+        answer = await agent.send_message("Is it edible?")
+        return chunks, answer
+
+    chunks, answer = asyncio.run(conversation())
+
+    assert len(chunks) > 1 and "".join(chunks).startswith("Name: Fly Agaric")
+    assert answer.startswith("Name: Fly Agaric")
+    assert agent.current_identification["primary"] == ("Amanita muscaria", 0.8)
+    assert len(agent.get_history()) == 4
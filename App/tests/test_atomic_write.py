@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from atomic_write import write_atomic
+
+
+def test_replaces_the_file(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"old")
+
+    write_atomic(str(path), lambda f: f.write(b"new"))
+
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["data.bin"]
+
+
+def test_failed_write_keeps_the_old_file_and_no_temp_file(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"old")
+
+    def fail(f):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_atomic(str(path), fail)
+
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["data.bin"]
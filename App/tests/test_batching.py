@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class FakePredictor:
+    """Images are species indices; "bad" cannot be decoded."""
+
+    species = ["Amanita muscaria", "Boletus edulis", "Cantharellus cibarius"]
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.batches = []
+
+    def predict_proba(self, images):
+        self.batches.append(list(images))
+        self.started.set()
+        self.gate.wait(5)
+        if "bad" in images:
+            raise ValueError("cannot identify image file")
+        return np.eye(len(self.species), dtype=np.float32)[images]
+
+    def top_k_predictions(self, probabilities, top_k=3):
+        order = np.argsort(probabilities)[::-1][:top_k]
+        return {self.species[i]: float(probabilities[i]) for i in order}
+
+    def predict(self, image, top_k=3):
+        if image == "bad":
+            raise ValueError("cannot identify image file")
+        return self.top_k_predictions(np.eye(len(self.species))[image], top_k)
+
+
+def test_cancelled_requests_are_not_predicted():
+    model = FakePredictor()
+    model.gate.clear()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=0)
+
+    first = batcher.submit(0, top_k=1)
+    assert model.started.wait(5)
+    # Queued while the first batch is running; the caller of the second gives up
+    cancelled, kept = batcher.submit(1, top_k=1), batcher.submit(2, top_k=1)
+    assert cancelled.cancel()
+    model.gate.set()
+
+    assert first.result(5) == {"Amanita muscaria": 1.0}
+    assert kept.result(5) == {"Cantharellus cibarius": 1.0}
+    assert cancelled.cancelled()
+    assert model.batches == [[0], [2]]
+
+
+def test_a_bad_image_fails_only_its_own_request():
+    model = FakePredictor()
+    # The batch closes as soon as all three requests are in
+    batcher = MicroBatcher(model, max_batch_size=3, max_wait_ms=5000)
+
+    futures = [batcher.submit(image, top_k=1) for image in (0, "bad", 1)]
+
+    assert futures[0].result(5) == {"Amanita muscaria": 1.0}
+    assert futures[2].result(5) == {"Boletus edulis": 1.0}
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert model.batches == [[0, "bad", 1]]
@@ -0,0 +1,31 @@
+import pytest
+
+from benchmark import bench_context, compare, time_call
+
+pytestmark = pytest.mark.usefixtures("no_sdk")
+
+
+def test_time_call_skips_warmup_runs():
+    calls = []
+
+    stats = time_call(lambda: calls.append(1), repeat=5, warmup=2)
+
+    assert len(calls) == 7 and stats["runs"] == 5
+    assert 0 <= stats["min_ms"] <= stats["p50_ms"] <= stats["p95_ms"]
+
+
+def test_compare_reports_ratios_for_nested_timings():
+    baseline = {"predict": {"batch_4": {"mean_ms": 10.0}}, "decode": {"mean_ms": 2.0}}
+    current = {"predict": {"batch_4": {"mean_ms": 5.0}}, "decode": {"mean_ms": 2.0}, "new": {"mean_ms": 1.0}}
+
+    assert compare(baseline, current) == [
+        "predict.batch_4: 10.00 -> 5.00 ms (0.50x)",
+        "decode: 2.00 -> 2.00 ms (1.00x)",
+    ]
+
+
+def test_context_suite_runs_with_the_fake_llm(retriever):
+    results = bench_context(retriever, repeat=1)
+
+    assert results["identification_prompt_chars"] > 0
+    assert results["initialize_from_predictions"]["runs"] == 1
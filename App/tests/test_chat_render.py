@@ -0,0 +1,51 @@
+import os
+
+from PIL import Image
+
+from chat_render import IMAGE, TEXT, ThumbnailCache, make_message, parse_segments
+
+
+def test_message_is_split_into_text_and_image_segments():
+    content = 'Name: Fly Agaric\n<img src="a/1.jpg"/>\n  <img src="a/2.jpg"/> Edible: no'
+
+    assert parse_segments(content) == [
+        (TEXT, "Name: Fly Agaric"), (IMAGE, "a/1.jpg"), (IMAGE, "a/2.jpg"), (TEXT, "Edible: no"),
+    ]
+
+
+def test_only_assistant_messages_render_image_tags():
+    tag = '<img src="a/1.jpg"/>'
+
+    assert make_message("user", tag)["segments"] == [(TEXT, tag)]
+    assert make_message("assistant", tag)["segments"] == [(IMAGE, "a/1.jpg")]
+
+
+def save_image(path, size, color="red"):
+    Image.new("RGB", size, color).save(path, format="PNG")
+
+
+def test_thumbnails_are_downscaled_and_cached_on_disk(tmp_path):
+    source = tmp_path / "large.png"
+    save_image(source, (1200, 800))
+    cache_dir = tmp_path / "thumbnails"
+
+    data = ThumbnailCache(cache_dir=str(cache_dir), size=100).thumbnail(str(source))
+
+    with Image.open(cache_dir / os.listdir(cache_dir)[0]) as thumb:
+        assert thumb.format == "JPEG" and max(thumb.size) == 100
+    # A new cache (e.g. after a restart) serves the same bytes from disk
+    assert ThumbnailCache(cache_dir=str(cache_dir), size=100).thumbnail(str(source)) == data
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_changed_file_gets_a_new_thumbnail(tmp_path):
+    source = tmp_path / "image.png"
+    save_image(source, (300, 300), "red")
+    cache = ThumbnailCache(max_entries=1, cache_dir=None, size=50)
+    first = cache.thumbnail(str(source))
+
+    save_image(source, (300, 200), "blue")
+    os.utime(source, ns=(0, 10**9))
+
+    assert cache.thumbnail(str(source)) != first
+    assert len(cache._thumbnails) == 1
@@ -0,0 +1,12 @@
+from cnn_backends import _labelled_images, split_images
+from config import EXAMPLE_IMAGES_DIR
+
+
+def test_calibration_and_parity_images_are_disjoint():
+    calibration, held_out = split_images(EXAMPLE_IMAGES_DIR, per_species=1)
+
+    assert not {path for path, _ in calibration} & {path for path, _ in held_out}
+    assert sorted(calibration + held_out) == sorted(_labelled_images(EXAMPLE_IMAGES_DIR))
+    # One calibration image per species, so int8 ranges see every class
+    species = [label for _, label in calibration]
+    assert len(species) == len(set(species)) == len({label for _, label in _labelled_images(EXAMPLE_IMAGES_DIR)})
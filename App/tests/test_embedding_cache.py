@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from embedding_cache import QueryEmbeddingCache
+
+
+def vector(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("model", "cap", vector(1))
+    cache.put("model", "gills", vector(2))
+    cache.get("model", "cap")
+    cache.put("model", "stem", vector(3))
+
+    assert cache.get("model", "gills") is None
+    assert cache.get("model", "cap") is not None and cache.get("model", "stem") is not None
+    assert len(cache) == 2
+
+
+def test_queries_are_normalized_and_keyed_by_model():
+    cache = QueryEmbeddingCache()
+    cache.put("model", "  Red   CAP ", vector(1))
+
+    assert np.array_equal(cache.get("model", "red cap"), vector(1))
+    assert cache.get("other-model", "red cap") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache" / "queries.npz")
+    cache = QueryEmbeddingCache(max_size=3)
+    cache.path = path
+    for i, text in enumerate(["cap", "gills", "stem"]):
+        cache.put("model", text, vector(i))
+    cache.save()
+
+    # Loading into a smaller cache keeps the most recently used entries
+    loaded = QueryEmbeddingCache(max_size=2)
+    loaded.path = path
+    loaded.load()
+
+    assert loaded.get("model", "cap") is None
+    assert np.array_equal(loaded.get("model", "stem"), vector(2))
+    assert os.listdir(tmp_path / "cache") == ["queries.npz"]
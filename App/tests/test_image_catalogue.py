@@ -0,0 +1,27 @@
+import os
+
+from image_catalogue import ExampleImageCatalogue
+
+
+def test_catalogue_rescans_only_when_the_directory_changes(tmp_path, monkeypatch):
+    species_dir = tmp_path / "Amanita muscaria"
+    species_dir.mkdir()
+    for name in ("2.jpg", "1.PNG", "notes.txt"):
+        (species_dir / name).write_bytes(b"")
+    catalogue = ExampleImageCatalogue(str(tmp_path))
+
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or scandir(path))
+
+    expected = [(species_dir / "1.PNG").as_posix(), (species_dir / "2.jpg").as_posix()]
+    assert catalogue.images_for("Amanita muscaria") == expected
+    assert catalogue.images_for("Amanita muscaria") == expected
+    assert len(scans) == 1
+
+    (species_dir / "3.jpeg").write_bytes(b"")
+    os.utime(species_dir, ns=(0, 10**9))
+
+    assert catalogue.images_for("Amanita muscaria") == expected + [(species_dir / "3.jpeg").as_posix()]
+    assert len(scans) == 2
+    assert catalogue.images_for("Boletus edulis") == []
@@ -0,0 +1,127 @@
+import json
+import sys
+
+import pytest
+
+import ingestion
+from ingestion import Fetcher, PageCache, RateLimiter, Source, ingest_source
+
+
+class FakeSource(Source):
+    name = "fake"
+    output_file = "fake.json"
+
+    def __init__(self, urls):
+        super().__init__("http://fake")
+        self.urls = urls
+
+    def page_urls(self, fetcher):
+        return list(self.urls)
+
+    def parse(self, url, body):
+        return url.rsplit("/", 1)[-1], {"Description": body}
+
+
+class FakeFetcher:
+    """Serves canned bodies; URLs in `failing` raise like a dead connection."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.requested = []
+
+    def get(self, url):
+        self.requested.append(url)
+        if url in self.failing:
+            raise ConnectionError("connection reset")
+        return f"body of {url}"
+
+
+URLS = [f"http://fake/species-{i}" for i in range(5)]
+
+
+def run(tmp_path, fetcher, **kwargs):
+    return ingest_source(FakeSource(URLS), fetcher, output_dir=str(tmp_path / "kb"),
+                         checkpoint_dir=str(tmp_path / "checkpoints"), workers=2, **kwargs)
+
+
+def read_output(tmp_path):
+    with open(tmp_path / "kb" / "fake.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_failed_pages_keep_the_existing_file(tmp_path):
+    (tmp_path / "kb").mkdir()
+    (tmp_path / "kb" / "fake.json").write_text('{"old": {}}', encoding="utf-8")
+
+    stats = run(tmp_path, FakeFetcher(failing={URLS[2]}))
+
+    assert stats["failed"] == 1 and stats["fetched"] == 4
+    assert stats["records"] is None
+    assert read_output(tmp_path) == {"old": {}}
+
+
+def test_rerun_resumes_from_the_checkpoint(tmp_path):
+    run(tmp_path, FakeFetcher(failing={URLS[2]}))
+
+    fetcher = FakeFetcher()
+    stats = run(tmp_path, fetcher)
+
+    assert fetcher.requested == [URLS[2]]
+    assert stats == {"pages": 5, "resumed": 4, "fetched": 1, "failed": 0, "records": 5}
+    # Records follow the page order, not the fetch order
+    assert list(read_output(tmp_path)) == [f"species-{i}" for i in range(5)]
+
+
+def test_fresh_run_ignores_the_checkpoint(tmp_path):
+    run(tmp_path, FakeFetcher())
+    fetcher = FakeFetcher()
+
+    assert run(tmp_path, fetcher, fresh=True)["fetched"] == 5
+    assert sorted(fetcher.requested) == URLS
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.apparent_encoding = "utf-8"
+        self.encoding = None
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Answers 304 when the request carries the ETag of the page."""
+
+    def __init__(self, etag):
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(dict(headers or {}))
+        if (headers or {}).get("If-None-Match") == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, "<html>page</html>", {"ETag": self.etag, "Content-Type": "text/html"})
+
+
+def test_unchanged_pages_are_revalidated_with_their_etag():
+    fetcher = Fetcher(cache=PageCache(":memory:"), rate_limiter=RateLimiter(0))
+    session = FakeSession('"v1"')
+    fetcher._local.session = session
+
+    assert fetcher.get("http://fake/page") == "<html>page</html>"
+    assert fetcher.get("http://fake/page") == "<html>page</html>"
+    assert session.requests == [{}, {"If-None-Match": '"v1"'}]
+
+
+def test_cli_exits_non_zero_when_pages_failed(monkeypatch):
+    stats = {"pages": 5, "resumed": 0, "fetched": 4, "failed": 1, "records": None}
+    monkeypatch.setattr(ingestion, "ingest", lambda *args: {"fake": stats})
+    monkeypatch.setattr(sys, "argv", ["ingestion.py", "wikipedia"])
+
+    with pytest.raises(SystemExit) as exit_info:
+        ingestion.main()
+    assert exit_info.value.code == 1
@@ -0,0 +1,55 @@
+import json
+import sys
+import types
+
+import numpy as np
+
+import kb_artifact
+from kb_artifact import document_hashes, update_embeddings
+
+
+class FakeSentenceTransformer:
+    def __init__(self, name):
+        self.name = name
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+    def encode(self, texts, batch_size=None):
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+def test_empty_knowledge_base_without_previous_artifact(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+
+    embeddings = update_embeddings([], document_hashes([]), str(tmp_path), "fake-model")
+
+    assert embeddings.shape == (0, 8) and embeddings.dtype == np.float32
+
+
+def test_artifact_is_stale_when_build_settings_change(tmp_path, monkeypatch):
+    source = tmp_path / "kb.json"
+    source.write_text(json.dumps({"Boletus edulis": {"Edibility": "Edible"}}), encoding="utf-8")
+    artifact_dir = str(tmp_path / "artifact")
+    kb_artifact.build_artifact([str(source)], artifact_dir, "fake-model",
+                               embeddings=np.ones((1, 8), dtype=np.float32))
+
+    assert kb_artifact.load_artifact([str(source)], artifact_dir, "fake-model") is not None
+
+    monkeypatch.setattr(kb_artifact, "SPECIES_ALIASES", {"Boletus aereus": "Boletus edulis"})
+    assert kb_artifact.load_artifact([str(source)], artifact_dir, "fake-model") is None
+    monkeypatch.undo()
+    monkeypatch.setattr(kb_artifact, "BM25_K1", 2.0)
+    assert kb_artifact.load_artifact([str(source)], artifact_dir, "fake-model") is None
+
+
+def test_artifact_with_another_dtype_is_stale(tmp_path):
+    source = tmp_path / "kb.json"
+    source.write_text(json.dumps({"Boletus edulis": {"Edibility": "Edible"}}), encoding="utf-8")
+    artifact_dir = str(tmp_path / "artifact")
+    kb_artifact.build_artifact([str(source)], artifact_dir, "fake-model", dtype="float16",
+                               embeddings=np.ones((1, 8), dtype=np.float32))
+
+    assert kb_artifact.load_artifact([str(source)], artifact_dir, "fake-model", dtype="float16") is not None
+    assert kb_artifact.load_artifact([str(source)], artifact_dir, "fake-model", dtype="float32") is None
@@ -0,0 +1,22 @@
+import pytest
+
+from config import KNOWLEDGE_BASE_FILES, MUSHROOM_SPECIES
+from knowledge_base import normalize_species_name, prepare_knowledge_base
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return prepare_knowledge_base(KNOWLEDGE_BASE_FILES, return_index=True, return_metadata=True)
+
+
+def test_every_species_resolves(knowledge_base):
+    _, name_index, _ = knowledge_base
+    missing = [s for s in MUSHROOM_SPECIES if not name_index.get(normalize_species_name(s))]
+    assert missing == []
+
+
+def test_species_chunks_start_with_overview_then_priority_sections(knowledge_base):
+    _, name_index, metadata = knowledge_base
+    sections = [metadata[idx]["section"] for idx in name_index[normalize_species_name("Amanita phalloides")]]
+    assert sections[0] == "overview"
+    assert sections.index("Toxicity") < sections.index("Description")
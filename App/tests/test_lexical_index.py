@@ -0,0 +1,31 @@
+import os
+
+from lexical_index import LexicalIndex
+
+DOCUMENTS = [
+    "Amanita muscaria\nToxicity: ibotenic acid and muscimol.",
+    "Boletus edulis\nEdibility: a choice edible.",
+    "Cantharellus cibarius\nSimilar species: Hygrophoropsis aurantiaca.",
+]
+
+
+def test_saved_index_loads_with_the_same_results(tmp_path):
+    index = LexicalIndex.build(DOCUMENTS)
+    index.save(str(tmp_path))
+
+    loaded = LexicalIndex.load(str(tmp_path))
+
+    assert len(loaded) == len(DOCUMENTS)
+    assert list(loaded.search("muscimol", 3)[1]) == list(index.search("muscimol", 3)[1]) == [0]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_resaving_keeps_a_loaded_index_readable(tmp_path):
+    LexicalIndex.build(DOCUMENTS).save(str(tmp_path))
+    loaded = LexicalIndex.load(str(tmp_path))
+
+    # Rebuilding over the same directory must not change the mapped postings under the reader
+    LexicalIndex.build(DOCUMENTS[::-1]).save(str(tmp_path))
+
+    assert list(loaded.search("muscimol", 3)[1]) == [0]
+    assert list(LexicalIndex.load(str(tmp_path)).search("muscimol", 3)[1]) == [2]
@@ -0,0 +1,49 @@
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry("test")
+    lookups = registry.counter("lookups", "Cache lookups")
+    lookups.inc(result="hit")
+    lookups.inc(2, result='mi"ss')
+    sizes = registry.histogram("batch_size", "Images per batch", buckets=(1, 4))
+    sizes.observe(1)
+    sizes.observe(3)
+    sizes.observe(10)
+
+    text = registry.render_prometheus()
+
+    assert "\n".join([
+        "# HELP test_batch_size Images per batch",
+        "# TYPE test_batch_size histogram",
+        'test_batch_size_bucket{le="1"} 1',
+        'test_batch_size_bucket{le="4"} 2',
+        'test_batch_size_bucket{le="+Inf"} 3',
+        "test_batch_size_sum 14",
+        "test_batch_size_count 3",
+        "# HELP test_lookups_total Cache lookups",
+        "# TYPE test_lookups_total counter",
+        'test_lookups_total{result="hit"} 1',
+        'test_lookups_total{result="mi\\"ss"} 2',
+    ]) + "\n" in text
+    assert text.endswith("\n") and registry.counter("lookups", "Cache lookups") is lookups
+
+
+def test_spans_feed_the_stage_histogram_and_exporters():
+    registry = MetricsRegistry("test")
+    records = []
+    registry.add_exporter(records.append)
+
+    with registry.span("identify"):
+        with pytest.raises(ValueError):
+            with registry.span("retrieve", queries=2):
+                raise ValueError("boom")
+
+    assert [(r.name, r.parent, r.error) for r in records] == [
+        ("retrieve", "identify", "ValueError"), ("identify", None, None)
+    ]
+    assert records[0].attributes == {"queries": 2}
+    assert registry.stage_seconds.summary(stage="retrieve")["count"] == 1
+    assert 'test_stage_duration_seconds_count{stage="identify"} 1' in registry.render_prometheus()
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import predictor
+from config import IMAGE_SIZE, MUSHROOM_SPECIES
+from predictor import MushroomPredictor, load_image_array
+
+
+class FakeBackend:
+    """Predicts the species whose index is the image's red value."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, batch):
+        self.batch_sizes.append(len(batch))
+        probabilities = np.zeros((len(batch), len(MUSHROOM_SPECIES)), dtype=np.float32)
+        probabilities[np.arange(len(batch)), batch[:, 0, 0, 0].astype(int)] = 1.0
+        return probabilities
+
+
+@pytest.fixture
+def model(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(predictor, "create_backend", lambda name, model_path: backend)
+    return MushroomPredictor(decode_workers=2)
+
+
+def solid_image(red, channels=3, size=IMAGE_SIZE):
+    image = np.zeros((*size, channels), dtype=np.uint8)
+    image[..., 0] = red
+    if channels == 4:
+        image[..., 3] = 255
+    return image
+
+
+def test_batch_is_split_into_forward_passes_in_order(model, monkeypatch):
+    monkeypatch.setattr(predictor, "PREDICT_BATCH_SIZE", 4)
+    images = [solid_image(i) for i in range(10)]
+
+    predictions = model.predict_batch(images, top_k=1)
+
+    assert model.backend.batch_sizes == [4, 4, 2]
+    assert [next(iter(p)) for p in predictions] == MUSHROOM_SPECIES[:10]
+    assert model.predict_batch([], top_k=1) == []
+
+
+def test_in_memory_sources_decode_to_rgb(model):
+    buffer = io.BytesIO()
+    Image.fromarray(solid_image(3, size=(100, 80))).save(buffer, format="PNG")
+    buffer.read()  # Already consumed, e.g. by st.image
+
+    sources = [
+        solid_image(3, channels=4),
+        solid_image(3, channels=4, size=(60, 90)),
+        buffer.getvalue(),
+        buffer,
+        Image.fromarray(solid_image(3)),
+    ]
+
+    for source in sources:
+        assert load_image_array(source).shape == (*IMAGE_SIZE, 3)
+    assert [next(iter(p)) for p in model.predict_batch(sources, top_k=1)] == [MUSHROOM_SPECIES[3]] * len(sources)
@@ -0,0 +1,136 @@
+import pytest
+
+from config import IDENTIFICATION_PRIMARY_SHARE
+from conversation_context import ConversationContext
+from llm_stub import FakeClient, FakeContent, FakeTypes
+from RAG_Agent import MushroomRAGAgent
+from response_cache import ResponseCache
+
+pytestmark = pytest.mark.usefixtures("no_sdk")
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def agent(client, retriever):
+    return MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                            genai_types=FakeTypes,
+                            response_cache=ResponseCache(":memory:"))
+
+
+PREDICTIONS = {"Amanita pantherina": 0.2, "Amanita muscaria": 0.8}
+
+
+def test_chat_uses_system_instructions(agent, client):
+    assert agent.online_mode
+    assert client.created_chats[0].config.system_instruction == agent.system_instructions
+
+
+def test_identification_sends_predictions_and_documents(agent, client, retriever):
+    card = agent.initialize_from_predictions(PREDICTIONS)
+
+    assert card.startswith("Name: Fly Agaric")
+    prompt = client.created_chats[-1].sent_messages[0]
+    assert "PRIMARY PREDICTION: Amanita muscaria" in prompt
+    assert retriever.documents["Amanita muscaria"] in prompt
+    assert retriever.documents["Amanita pantherina"] in prompt
+    # The top prediction comes first and gets the larger share of the budget
+    queries, shares = retriever.batches[0]
+    assert queries == ["Amanita muscaria", "Amanita pantherina"]
+    assert shares == pytest.approx([IDENTIFICATION_PRIMARY_SHARE, 1.0 - IDENTIFICATION_PRIMARY_SHARE])
+
+
+def test_cached_card_is_replayed_with_new_confidences(client, retriever):
+    client.reply = lambda message: "Name: Fly Agaric\nConfidence: 80.00%"
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                             genai_types=FakeTypes,
+                             response_cache=ResponseCache(":memory:"))
+    agent.initialize_from_predictions(PREDICTIONS)
+    sent = sum(len(chat.sent_messages) for chat in client.created_chats)
+
+    agent.reset()
+    card = agent.initialize_from_predictions({"Amanita muscaria": 0.7, "Amanita pantherina": 0.3})
+    assert card == "Name: Fly Agaric\nConfidence: 70.00%"
+    assert sum(len(chat.sent_messages) for chat in client.created_chats) == sent
+    # The replayed exchange is in the history for follow-up questions
+    assert [entry.role for entry in agent.get_history()] == ["user", "model"]
+    assert agent.get_history()[1].parts[0].text == card
+
+
+def test_cache_is_checked_before_the_prompt_is_assembled(client, retriever):
+    client.reply = lambda message: "Name: Fly Agaric\nConfidence: 80.00%"
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                             genai_types=FakeTypes,
+                             response_cache=ResponseCache(":memory:"))
+    agent.initialize_from_predictions(PREDICTIONS)
+
+    # Same chat: the documents are already in the history, yet the key still matches
+    agent.initialize_from_predictions(PREDICTIONS)
+    assert sum(len(chat.sent_messages) for chat in client.created_chats) == 1
+    assert len(agent.conversation.turn_stats) == 1
+
+
+def test_card_with_unmasked_percentages_is_not_cached(client, retriever):
+    client.reply = lambda message: "Name: Fly Agaric\nConfidence: 80.00% (about 80%)"
+    cache = ResponseCache(":memory:")
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                             genai_types=FakeTypes, response_cache=cache)
+    agent.initialize_from_predictions(PREDICTIONS)
+
+    agent.reset()
+    agent.initialize_from_predictions({"Amanita muscaria": 0.7, "Amanita pantherina": 0.3})
+    assert sum(len(chat.sent_messages) for chat in client.created_chats) == 2
+
+
+def test_streamed_chat_answer_matches_reply(client, retriever):
+    client.reply = lambda message: "A short answer about gills."
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                             genai_types=FakeTypes, response_cache=None)
+
+    assert "".join(agent.send_message_stream("What do the gills look like?")) == "A short answer about gills."
+    assert [entry.role for entry in agent.get_history()] == ["user", "model"]
+
+
+def test_compacted_history_is_built_from_fake_types(client, retriever):
+    client.reply = lambda message: "answer " * 200
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, client=client,
+                             genai_types=FakeTypes, response_cache=None)
+    agent.conversation = ConversationContext(token_budget=400, keep_recent_turns=1, summary_chars=20)
+    for question in ("first", "second", "third", "fourth"):
+        agent.send_message(f"{question} question")
+
+    # Compaction rebuilt the chat from FakeContent entries made by _make_content
+    history = agent.get_history()
+    assert all(isinstance(entry, FakeContent) for entry in history)
+    assert len(client.created_chats) > 1
+    assert min(len(entry.parts[0].text) for entry in history) < len("answer " * 200)
+
+
+def test_without_client_or_key_answers_offline(retriever):
+    agent = MushroomRAGAgent(api_key=None, retriever=retriever, response_cache=None)
+
+    assert not agent.online_mode
+    assert "Amanita muscaria" in agent.initialize_from_predictions(PREDICTIONS)
+
+
+def test_history_that_cannot_be_compacted_is_left_unchanged():
+    # Only the card and the kept recent turn: over budget, but nothing to summarize or drop
+    history = [FakeContent("user", "card " * 200), FakeContent("model", "answer " * 200),
+               FakeContent("user", "recent " * 200), FakeContent("model", "reply " * 200)]
+    conversation = ConversationContext(token_budget=100, keep_recent_turns=1)
+
+    assert conversation.fit_history(history, "next question", FakeContent) is None
+
+
+def test_over_budget_history_is_compacted():
+    history = [FakeContent("user", "card"), FakeContent("model", "card answer")]
+    history += [FakeContent(role, f"{role} " * 200) for _ in range(3) for role in ("user", "model")]
+    conversation = ConversationContext(token_budget=300, keep_recent_turns=1, summary_chars=20)
+
+    compacted = conversation.fit_history(history, "next question", FakeContent)
+
+    assert compacted is not None and len(compacted) <= len(history)
+    assert compacted[:2] == history[:2] and compacted[-2:] == history[-2:]
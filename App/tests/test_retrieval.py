@@ -0,0 +1,83 @@
+import sys
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+from embedding_cache import QueryEmbeddingCache
+from retrieval import RetrievalEngine, RetrievalService
+
+DOCUMENTS = [
+    "Fly agaric has a red cap with white warts and white gills.",
+    "The penny bun is a prized edible bolete with a brown cap and pores.",
+    "Death cap is deadly poisonous, with a greenish cap and a volva at the base.",
+    "Chanterelles are golden, funnel shaped and smell of apricots.",
+    "The panther cap has a brown cap with white warts and is poisonous.",
+    "Shaggy ink cap dissolves into black ink as it ages.",
+]
+
+
+class FakeSentenceTransformer:
+    """Deterministic bag-of-words embeddings."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def encode(self, texts, batch_size=None):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in zip(vectors, texts):
+            for word in text.lower().split():
+                row[zlib.crc32(word.strip(".,").encode()) % 64] += 1.0
+        return vectors
+
+
+@pytest.fixture(params=["dense", "rrf"])
+def service(request, monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+    return RetrievalService(DOCUMENTS, "fake-model", query_cache=QueryEmbeddingCache(100),
+                            fusion=request.param)
+
+
+@pytest.mark.parametrize("k", [1, 5, 200, 300])
+def test_top_k_matches_a_full_sort(k):
+    rng = np.random.default_rng(0)
+    engine = RetrievalEngine(rng.normal(size=(200, 16)))
+    queries = rng.normal(size=(4, 16))
+
+    scores, indices = engine.search(queries, k)
+
+    expected = np.argsort(-engine.scores(queries), axis=1, kind="stable")[:, :k]
+    assert indices.shape == (4, min(k, 200))
+    assert np.array_equal(indices, expected)
+    assert np.allclose(scores, np.take_along_axis(engine.scores(queries), expected, axis=1))
+
+
+def test_batched_queries_match_one_query_at_a_time(service):
+    queries = ["white warts on the cap", "prized edible bolete with pores", "golden funnel"]
+
+    batched = service.retrieve_per_query(queries, top_k=3)
+
+    single = [service.retrieve_per_query([query], top_k=3)[0] for query in queries]
+    for batched_hits, single_hits in zip(batched, single):
+        assert [hit["index"] for hit in batched_hits] == [hit["index"] for hit in single_hits]
+        # A batched matrix product may round differently in the last bits
+        assert [hit["similarity"] for hit in batched_hits] == pytest.approx(
+            [hit["similarity"] for hit in single_hits]
+        )
+
+
+def test_batch_merges_per_query_results_without_duplicates(service):
+    queries = ["white warts on the cap", "brown cap poisonous"]
+
+    merged = service.retrieve_batch(queries, top_k=3)
+
+    single = [service.retrieve(query, top_k=3) for query in queries]
+    expected = {}
+    for hits in single:
+        for hit in hits:
+            expected.setdefault(hit["index"], hit["similarity"])
+            expected[hit["index"]] = max(expected[hit["index"]], hit["similarity"])
+    assert [hit["index"] for hit in merged] == list(expected)
+    assert [hit["similarity"] for hit in merged] == pytest.approx(list(expected.values()))
@@ -0,0 +1,143 @@
+import base64
+import http.client
+import json
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import RAG_Agent
+from config import SERVICE_MAX_BODY_BYTES
+from service import InferenceService, ServiceHTTPServer, make_handler
+from startup import Warmup
+
+
+class FakeBatcher:
+    """Resolves every submitted image at once with fixed predictions."""
+
+    def submit(self, image, top_k=3):
+        future = Future()
+        future.set_result(dict(list({"Amanita muscaria": 0.8, "Amanita pantherina": 0.2}.items())[:top_k]))
+        return future
+
+
+class BlockingRetriever:
+    """Holds every retrieval until released, to keep requests in flight."""
+
+    def __init__(self, retriever):
+        self.retriever = retriever
+        self.release = threading.Event()
+
+    def retrieve_per_query(self, queries, top_k=5):
+        self.release.wait(5)
+        return self.retriever.retrieve_per_query(queries, top_k)
+
+
+@pytest.fixture
+def start_service(monkeypatch):
+    monkeypatch.setattr(RAG_Agent, "RESPONSE_CACHE_ENABLED", False)
+    servers = []
+
+    def start(phases, wait=True, **kwargs):
+        warmup = Warmup()
+        for name, load in phases.items():
+            warmup.add_phase(name, load)
+        warmup.start()
+        service = InferenceService(warmup, **kwargs)
+        server = ServiceHTTPServer(("127.0.0.1", 0), make_handler(service))
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append((server, service))
+        if wait:
+            warmup.wait(timeout=5)
+        return server.server_address[1]
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+def ready_phases(retriever):
+    return {"retrieval": lambda: retriever, "predictor": FakeBatcher, "llm_client": lambda: None}
+
+
+def post(port, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    connection.request("POST", path, body=data, headers={"Content-Type": "application/json", **(headers or {})})
+    response = connection.getresponse()
+    status, payload = response.status, json.loads(response.read())
+    connection.close()
+    return status, payload
+
+
+IMAGE = base64.b64encode(b"not decoded by the fake batcher").decode("ascii")
+
+
+def test_predict_and_identify(start_service, retriever):
+    port = start_service(ready_phases(retriever))
+
+    status, body = post(port, "/predict", {"image": IMAGE, "top_k": 1})
+    assert status == 200 and body["predictions"] == {"Amanita muscaria": 0.8}
+
+    status, body = post(port, "/identify", {"predictions": {"Amanita muscaria": 0.9}})
+    assert status == 200 and "Amanita muscaria" in body["card"]
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/predict", {"image": IMAGE, "top_k": 0}),
+    ("/predict", {"image": IMAGE, "top_k": 170}),
+    ("/predict", {"image": IMAGE, "top_k": "3"}),
+    ("/predict", {"image": IMAGE, "top_k": True}),
+    ("/predict", {"image": "not base64!"}),
+    ("/retrieve", {"query": "gills", "top_k": 51}),
+    ("/retrieve", {"query": ""}),
+    ("/identify", {"image": IMAGE, "top_k": 2.5}),
+    ("/identify", {"predictions": {"../..": 0.9}}),
+    ("/identify", {"predictions": {"Amanita muscaria": "high"}}),
+    ("/identify", {"predictions": {"Amanita muscaria": float("inf")}}),
+    ("/identify", {"predictions": {"Amanita muscaria": float("nan")}}),
+    ("/identify", {"predictions": []}),
+])
+def test_invalid_requests_are_rejected(start_service, retriever, path, payload):
+    port = start_service(ready_phases(retriever))
+
+    status, body = post(port, path, payload)
+
+    assert status == 400, body
+
+
+def test_malformed_bodies_are_rejected(start_service, retriever):
+    port = start_service(ready_phases(retriever))
+
+    assert post(port, "/predict", b"{not json")[0] == 400
+    assert post(port, "/predict", b"{}", {"Content-Length": "-1"})[0] == 400
+    assert post(port, "/predict", b"{}", {"Content-Length": str(SERVICE_MAX_BODY_BYTES + 1)})[0] == 413
+    assert post(port, "/unknown", {})[0] == 404
+
+
+def test_resource_still_loading_returns_503(start_service, retriever):
+    loaded = threading.Event()
+    port = start_service({"retrieval": lambda: loaded.wait(5) and retriever, "predictor": FakeBatcher},
+                         wait=False)
+
+    status, body = post(port, "/retrieve", {"query": "gills"})
+    loaded.set()
+
+    assert status == 503 and "loading" in body["error"]
+
+
+def test_saturated_pool_returns_503_and_slow_requests_504(start_service, retriever):
+    blocking = BlockingRetriever(retriever)
+    port = start_service(ready_phases(blocking), workers=1, max_pending=1, timeout=0.2)
+
+    first = {}
+    thread = threading.Thread(target=lambda: first.update(result=post(port, "/retrieve", {"query": "gills"})))
+    thread.start()
+    # The first request holds the only slot until its worker finishes, even after its 504
+    thread.join()
+    assert first["result"][0] == 504
+    assert post(port, "/retrieve", {"query": "cap"})[0] == 503
+
+    blocking.release.set()
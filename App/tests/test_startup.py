@@ -0,0 +1,26 @@
+from startup import Warmup
+
+
+def test_retry_restarts_failed_phases_and_their_dependents():
+    attempts = []
+
+    def load_knowledge_base():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        return "kb"
+
+    warmup = Warmup()
+    warmup.add_phase("knowledge_base", load_knowledge_base)
+    warmup.add_phase("retrieval", lambda kb: f"retrieval over {kb}", after=["knowledge_base"])
+    warmup.add_phase("predictor", lambda: "predictor")
+    warmup.run()
+
+    report = warmup.report()
+    assert [report[name]["status"] for name in report] == ["failed", "failed", "ready"]
+
+    assert warmup.retry() == ["knowledge_base", "retrieval"]
+    assert warmup.wait(timeout=5)
+    assert warmup.is_ready()
+    assert warmup.result("retrieval") == "retrieval over kb"
+    assert warmup.retry() == []